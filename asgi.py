@@ -0,0 +1,811 @@
+"""
+Native asyncio serving mode for the Replit Info API.
+Serves the same ``/``, ``/get`` and ``/watch`` routes as ``main.app`` on
+an ASGI entry point, with one event-loop-wide HTTP pool and a semaphore
+capping concurrent upstream calls. Run with ``uvicorn asgi:app``;
+requires the optional ``httpx`` package.
+"""
+
+from asyncio import (
+    FIRST_COMPLETED,
+    AbstractEventLoop,
+    Event,
+    Future,
+    Semaphore,
+    Task,
+    gather,
+    get_running_loop,
+    run_coroutine_threadsafe,
+    sleep,
+    timeout,
+    wait,
+)
+from contextvars import Context
+from os import environ
+from pathlib import Path
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+import codec
+import config
+from breaker import CircuitBreaker, CircuitOpenError
+from cache import Entry, TTLCache, open_cache
+from cassette import open_recorder, open_replay
+from compress import CompressionStore, select_encoding
+from conditional import (
+    ValidatorStore,
+    encoded_etag,
+    is_conditional,
+    not_modified,
+    record_etag,
+    record_last_modified,
+    validator_headers,
+)
+from deadline import Deadline, DeadlineExceeded, current_deadline, get_deadline
+from delta import MEDIA_TYPE as PATCH_TYPE
+from delta import VersionStore
+from hotset import HotRefresher
+from query import (
+    UnknownFieldError,
+    build_batch_query,
+    build_projection,
+    build_query,
+    covered_fields,
+    normalize_fields,
+)
+from records import RecordCache, record_key
+from timing import HEADER as TIMING_HEADER
+from timing import Timings, phase, timing_scope
+from upstream import (
+    HEADERS,
+    UpstreamError,
+    UpstreamStatusError,
+    extract_batch,
+    extract_repl,
+    timeout_error,
+)
+from watch import HEARTBEAT, WatchHub, WatchLimitError, encode_event
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+INDEX = Path(__file__).parent / "templates" / "index.html"
+
+cache = open_cache()
+records = RecordCache(cache)
+negative_cache = TTLCache(ttl=config.NEGATIVE_CACHE_TTL,
+                          stale_ttl=0,
+                          max_entries=config.NEGATIVE_CACHE_MAX_ENTRIES,
+                          refresh_workers=1)
+breaker = CircuitBreaker()
+# Both run on background threads and fetch through ``fetch_batch``
+hot = HotRefresher(
+    records,
+    lambda replit_ids, fields: fetch_batch(replit_ids, fields),
+    max_ids=config.HOT_REFRESH_IDS if config.CACHE_ENABLED else 0)
+watches = WatchHub(lambda replit_ids, fields: fetch_batch(replit_ids, fields),
+                   records if config.CACHE_ENABLED else None)
+validators = ValidatorStore()
+versions = VersionStore()
+compression = CompressionStore()
+replay = open_replay()
+recorder = open_recorder()
+_client = None
+_loop: Optional[AbstractEventLoop] = None
+_semaphore: Optional[Semaphore] = None
+_inflight: Dict[Tuple[str, Optional[Tuple[str, ...]]], Future] = {}
+_refreshes: Set[Task] = set()
+
+
+def get_client() -> Any:
+    """Return the event-loop-wide async HTTP client.
+
+    Returns:
+        httpx.AsyncClient: Shared client with a bounded connection pool
+
+    Raises:
+        ImportError: If ``httpx`` is not installed
+    """
+    global _client, _semaphore
+    if _client is None:
+        try:
+            from httpx import AsyncClient, Limits
+        except ImportError as e:
+            raise ImportError(
+                "async serving mode requires httpx: pip install httpx"
+            ) from e
+        _client = AsyncClient(
+            headers=HEADERS,
+            limits=Limits(
+                max_connections=config.POOL_MAXSIZE,
+                max_keepalive_connections=config.POOL_MAXSIZE,
+            ),
+        )
+        _semaphore = Semaphore(config.ASYNC_UPSTREAM_CONCURRENCY)
+    return _client
+
+
+async def post(payload: Dict[str, Any]) -> Any:
+    """POST a GraphQL payload under the upstream concurrency cap.
+
+    Connect and read timeouts are clamped to the active request
+    deadline, which also bounds the wait for a semaphore slot.
+
+    Args:
+        payload: JSON body with ``query`` and ``variables``
+
+    Returns:
+        Any: Decoded upstream body
+
+    Raises:
+        UpstreamTimeout: If the upstream does not answer in time
+        UpstreamStatusError: If the upstream answers a 5xx status
+        DeadlineExceeded: If the request budget runs out
+    """
+    from httpx import ConnectTimeout, Timeout, TimeoutException
+
+    deadline = get_deadline()
+    if replay is not None:
+        return await replayed(payload, deadline)
+    client = get_client()
+    start = monotonic()
+    try:
+        with phase("upstream"):
+            async with timeout(deadline.check()):
+                async with _semaphore:
+                    connect, read = deadline.timeouts()
+                    response = await client.post(
+                        config.UPSTREAM_URL,
+                        json=payload,
+                        timeout=Timeout(read, connect=connect),
+                    )
+    except TimeoutException as e:
+        if isinstance(e, ConnectTimeout):
+            limit, configured = connect, config.UPSTREAM_CONNECT_TIMEOUT
+        else:
+            limit, configured = read, config.UPSTREAM_READ_TIMEOUT
+        raise timeout_error(deadline, limit, configured, e) from e
+    except TimeoutError as e:
+        if isinstance(e, DeadlineExceeded):
+            raise
+        raise DeadlineExceeded(
+            f"request budget of {deadline.budget:.3f}s exceeded") from e
+    if response.status_code >= 500:
+        raise UpstreamStatusError(response.status_code)
+    if recorder is not None:
+        recorder.record(payload, response.content, monotonic() - start)
+    with phase("decode"):
+        return codec.loads(response.content)
+
+
+async def replayed(payload: Dict[str, Any], deadline: Deadline) -> Any:
+    """Answer a GraphQL payload from the replay cassette.
+
+    Args:
+        payload: JSON body with ``query`` and ``variables``
+        deadline: Deadline of the current request
+
+    Returns:
+        Any: Decoded recorded body
+
+    Raises:
+        UpstreamError: If the payload was never recorded
+        UpstreamTimeout: If the recorded latency exceeds the read timeout
+            while latency simulation is on
+    """
+    found = replay.lookup(payload)
+    if found is None:
+        raise UpstreamError("no recorded upstream response for this query")
+    content, latency = found
+    if config.CASSETTE_SIMULATE_LATENCY:
+        _, read = deadline.timeouts()
+        with phase("upstream"):
+            await sleep(min(latency, read))
+        if latency > read:
+            raise timeout_error(deadline, read, config.UPSTREAM_READ_TIMEOUT,
+                                "replayed")
+    with phase("decode"):
+        return codec.loads(content)
+
+
+async def get_info(replit_id: str,
+                   fields: Optional[Tuple[str, ...]] = None) -> Any:
+    """Async counterpart of ``main.get_info``.
+
+    Args:
+        replit_id: Repl ID to look up
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        Any: The repl record, or None if it does not exist
+    """
+    return extract_repl(await post({
+        "variables": {
+            "id": replit_id
+        },
+        "query": build_query(fields),
+    }))
+
+
+async def get_infos(
+    replit_ids: List[str],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Async counterpart of ``main.get_infos``.
+
+    Args:
+        replit_ids: Repl IDs resolved in one aliased request
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, str]]: Records and errors by ID
+    """
+    return extract_batch(
+        await post({
+            "variables": {
+                f"id{i}": replit_id
+                for i, replit_id in enumerate(replit_ids)
+            },
+            "query": build_batch_query(len(replit_ids), fields),
+        }), replit_ids)
+
+
+async def guarded(fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+    """Await an upstream call through the circuit breaker.
+
+    Args:
+        fn: Coroutine function performing the upstream call
+        *args: Arguments for ``fn``
+
+    Returns:
+        Any: Result of ``fn``
+
+    Raises:
+        CircuitOpenError: If the breaker rejects the call
+    """
+    breaker.allow()
+    try:
+        result = await fn(*args)
+    except Exception as e:
+        breaker.record_error(e)
+        raise
+    breaker.record_success()
+    return result
+
+
+def fetch_batch(
+    replit_ids: List[str],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Batched upstream fetch for background threads.
+
+    The fetch itself runs on the event loop captured at lifespan startup.
+
+    Args:
+        replit_ids: Repl IDs to look up
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, str]]: Records and errors by ID
+    """
+    return run_coroutine_threadsafe(guarded(get_infos, replit_ids, fields),
+                                    _loop).result()
+
+
+async def cached(method: Callable[..., Any], *args: Any) -> Any:
+    """Call a cache method, off the event loop for blocking backends.
+
+    Args:
+        method: Bound method of ``cache``
+        *args: Arguments for ``method``
+
+    Returns:
+        Any: Result of ``method``
+    """
+    if not cache.blocking:
+        return method(*args)
+    return await get_running_loop().run_in_executor(None, method, *args)
+
+
+async def _load(replit_id: str,
+                wanted: Optional[Tuple[str, ...]],
+                entry: Optional[Entry] = None) -> Any:
+    # Concurrent callers of one field set await the same upstream fetch;
+    # returns the whole cached record once the fetch is merged into it
+    key = (replit_id, wanted)
+    while (future := _inflight.get(key)) is not None:
+        # Waiters are bounded by their own budget, like ``flight.do``
+        done, _ = await wait([future], timeout=get_deadline().check())
+        if not done:
+            raise DeadlineExceeded("timed out waiting for in-flight lookup")
+        # A cancelled leader, or one out of its own budget, is retried
+        if not future.cancelled() and not isinstance(
+                future.exception(), DeadlineExceeded):
+            return future.result()
+    future = _inflight[key] = get_running_loop().create_future()
+    try:
+        value = await guarded(get_info, replit_id, wanted)
+        if value is None:
+            negative_cache.set(replit_id, True)
+        elif config.CACHE_ENABLED:
+            value = await cached(records.store, replit_id, None, value,
+                                 entry)
+        future.set_result(value)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        # Mark retrieved so lone leaders don't log "never retrieved"
+        future.exception()
+        raise
+    finally:
+        del _inflight[key]
+        if not future.done():
+            future.cancel()
+
+
+async def _refresh(replit_id: str, wanted: Optional[Tuple[str, ...]]) -> None:
+    try:
+        await _load(replit_id, wanted)
+    except Exception:
+        cache.refresh_errors += 1
+
+
+async def lookup(replit_id: str,
+                 fields: Optional[Tuple[str, ...]] = None) -> Any:
+    """Cached, coalesced lookup of a single repl.
+
+    Fields a fresh cached record lacks are fetched and merged into it.
+
+    Args:
+        replit_id: Repl ID to look up
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        Any: The repl record, or None if it does not exist
+    """
+    if negative_cache.get_many([replit_id]):
+        return None
+    hot.touch(replit_id)
+    wanted, entry = fields, None
+    if config.CACHE_ENABLED:
+        key = record_key(replit_id)
+        entry = await cached(cache.get, key, True)
+        if entry is None and cache.store is not None:
+            entry = await get_running_loop().run_in_executor(
+                None, cache.load_stored, key)
+        if entry is not None:
+            found, missing = records.answer(entry, fields)
+            fresh = monotonic() < entry.expires_at
+            if missing is None:
+                if fresh:
+                    cache.hits += 1
+                    return found
+                cache.stale_hits += 1
+                wider = covered_fields(entry.value)
+                if (replit_id, wider) not in _inflight:
+                    # Refreshes get their own budget, not the caller's
+                    task = get_running_loop().create_task(
+                        _refresh(replit_id, wider), context=Context())
+                    _refreshes.add(task)
+                    task.add_done_callback(_refreshes.discard)
+                return found
+            if fresh:
+                wanted = missing
+            else:
+                entry = None
+        cache.misses += 1
+    value = await _load(replit_id, wanted, entry)
+    return None if value is None else build_projection(fields).project(
+        value)
+
+
+async def lookup_many(
+    replit_ids: List[str],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Dict[str, Any]:
+    """Async counterpart of ``main.lookup_many``.
+
+    Args:
+        replit_ids: Repl IDs to look up
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        Dict[str, Any]: ``data`` and ``errors`` keyed by repl ID
+    """
+    replit_ids = list(dict.fromkeys(replit_ids))
+    if config.CACHE_ENABLED:
+        data, fetches, partial = await cached(records.get_many, replit_ids,
+                                              fields)
+    else:
+        data, fetches, partial = {}, {fields: replit_ids}, {}
+    data.update(dict.fromkeys(negative_cache.get_many(
+        replit_id for replit_id in replit_ids if replit_id not in data)))
+    for replit_id in replit_ids:
+        if replit_id not in data or data[replit_id] is not None:
+            hot.touch(replit_id)
+    size = config.BATCH_CHUNK_SIZE
+    chunks = []
+    for wanted, ids in fetches.items():
+        ids = [replit_id for replit_id in ids if replit_id not in data]
+        chunks.extend(
+            (wanted, ids[i:i + size]) for i in range(0, len(ids), size))
+    results = await gather(*(guarded(get_infos, chunk, wanted)
+                             for wanted, chunk in chunks),
+                           return_exceptions=True)
+    errors = {}
+    for (_, chunk), result in zip(chunks, results, strict=True):
+        if isinstance(result, Exception):
+            errors.update(dict.fromkeys(chunk, str(result)))
+            continue
+        chunk_data, chunk_errors = result
+        errors.update(chunk_errors)
+        for replit_id, info in chunk_data.items():
+            if info is None:
+                negative_cache.set(replit_id, True)
+            elif config.CACHE_ENABLED:
+                info = await cached(records.store, replit_id, fields, info,
+                                    partial.get(replit_id))
+            data[replit_id] = info
+    return {
+        "data": {
+            replit_id: data[replit_id]
+            for replit_id in replit_ids if replit_id in data
+        },
+        "errors": errors,
+    }
+
+
+async def respond(send: Send,
+                  body: Any,
+                  status: int = 200,
+                  content_type: str = "application/json",
+                  headers: Optional[Dict[str, str]] = None,
+                  accept_encoding: Optional[str] = None) -> None:
+    """Send a complete HTTP response.
+
+    Args:
+        send: ASGI send callable
+        body: Bytes, text, or a value encoded as JSON
+        status: HTTP status code
+        content_type: Media type used for bytes and text bodies
+        headers: Extra response headers
+        accept_encoding: Request ``Accept-Encoding`` value, if the body
+            may be compressed
+    """
+    if isinstance(body, str):
+        body = body.encode()
+    elif not isinstance(body, bytes):
+        with phase("encode"):
+            body, content_type = codec.dumps(body), "application/json"
+    raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                   for name, value in (headers or {}).items()]
+    encoding = select_encoding(len(body), accept_encoding)
+    if encoding is not None and status != 304:
+        body = compression.compress(body, encoding)
+        raw_headers.append((b"content-encoding", encoding.encode()))
+    if status != 304:
+        raw_headers += [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": raw_headers,
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def repl_info(send: Send, args: Dict[str, List[str]],
+                    headers: Dict[str, str]) -> None:
+    """Async ``/get`` handler mirroring ``main.repl_info``.
+
+    Runs under the deadline set up by ``app`` for the request.
+
+    Args:
+        send: ASGI send callable
+        args: Parsed query string
+        headers: Request headers
+    """
+    replit_id = (args.get("replit_id") or [""])[0] or environ.get("REPL_ID")
+    if not replit_id:
+        return await respond(send, {"error": "replit_id is required"}, 400)
+
+    title = "title" in args
+    try:
+        fields = normalize_fields(("title", ) if title else (
+            args.get("fields") or None))
+    except UnknownFieldError as e:
+        return await respond(send, {"error": str(e)}, 400)
+
+    accept_encoding = headers.get("Accept-Encoding")
+    vary = {"Vary": "Accept-Encoding"} if config.COMPRESS_ENABLED else {}
+    try:
+        if "," in replit_id:
+            replit_ids = [
+                i.strip() for i in replit_id.split(",") if i.strip()
+            ]
+            if not replit_ids:
+                return await respond(send, {"error": "replit_id is required"},
+                                     400)
+            if len(replit_ids) > config.BATCH_MAX_IDS:
+                return await respond(send, {
+                    "error":
+                    f"at most {config.BATCH_MAX_IDS} replit_ids per batch"
+                }, 400)
+            result = await lookup_many(replit_ids, fields)
+            if title:
+                result["data"] = {
+                    replit_id: info.get("title", "") if info else info
+                    for replit_id, info in result["data"].items()
+                }
+            return await respond(send,
+                                 result,
+                                 headers=vary,
+                                 accept_encoding=accept_encoding)
+
+        key = (replit_id, fields)
+        if is_conditional(headers):
+            seen = validators.recent(key)
+            if seen and not_modified(headers, seen.etag, seen.last_modified):
+                validators.short_circuits += 1
+                etag = encoded_etag(
+                    seen.etag, select_encoding(seen.size, accept_encoding))
+                return await respond(send, b"", 304, headers={
+                    **validator_headers(etag, seen.last_modified),
+                    **vary,
+                })
+
+        info = await lookup(replit_id, fields)
+        if info is None:
+            return await respond(send, info)
+        last_modified = record_last_modified(info)
+        if isinstance(info, dict) and title:
+            info = info.get("title", "")
+        etag = record_etag(info)
+        since = (args.get("since") or [None])[0]
+        patch = None if title else versions.update(key, etag, info, since)
+        with phase("encode"):
+            body = info.encode() if isinstance(info, str) else codec.dumps(
+                info)
+        validators.remember(key, etag, last_modified, len(body))
+        encoding = select_encoding(len(body), accept_encoding)
+        extra = {
+            **validator_headers(encoded_etag(etag, encoding), last_modified),
+            **vary,
+        }
+        if not_modified(headers, etag, last_modified):
+            return await respond(send, b"", 304, headers=extra)
+        if patch is not None:
+            with phase("encode"):
+                body = codec.dumps(patch)
+            encoding = select_encoding(len(body), accept_encoding)
+            return await respond(send,
+                                 body,
+                                 content_type=PATCH_TYPE,
+                                 headers={
+                                     **validator_headers(
+                                         encoded_etag(etag, encoding),
+                                         last_modified),
+                                     **vary,
+                                 },
+                                 accept_encoding=accept_encoding)
+        return await respond(send,
+                             body,
+                             content_type="text/html; charset=utf-8"
+                             if isinstance(info, str) else "application/json",
+                             headers=extra,
+                             accept_encoding=accept_encoding)
+    except CircuitOpenError as e:
+        return await respond(send, {"error": str(e)}, 503,
+                             headers={"Retry-After": retry_after(e)})
+    except TimeoutError as e:
+        return await respond(send, {"error": str(e)}, 504)
+    except Exception as e:
+        return await respond(send, {"error": str(e)}, 500)
+
+
+async def repl_watch(receive: Receive, send: Send,
+                     args: Dict[str, List[str]]) -> None:
+    """Async ``/watch`` handler mirroring ``main.repl_watch``.
+
+    Streams Server-Sent Events until the client disconnects.
+
+    Args:
+        receive: ASGI receive callable
+        send: ASGI send callable
+        args: Parsed query string
+    """
+    replit_ids = [
+        i.strip() for value in args.get("replit_id", [])
+        for i in value.split(",") if i.strip()
+    ]
+    if not replit_ids:
+        return await respond(send, {"error": "replit_id is required"}, 400)
+    if len(replit_ids) > config.WATCH_MAX_IDS:
+        return await respond(send, {
+            "error": f"at most {config.WATCH_MAX_IDS} replit_ids per watch"
+        }, 400)
+    try:
+        fields = normalize_fields(args.get("fields") or None)
+    except UnknownFieldError as e:
+        return await respond(send, {"error": str(e)}, 400)
+
+    loop = get_running_loop()
+    ready = Event()
+    try:
+        subscription = watches.subscribe(
+            replit_ids, fields, lambda: loop.call_soon_threadsafe(ready.set))
+    except WatchLimitError as e:
+        return await respond(send, {"error": str(e)}, 503)
+
+    async def disconnect() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    gone = loop.create_task(disconnect())
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no")],
+        })
+        while True:
+            waiter = loop.create_task(ready.wait())
+            await wait({waiter, gone},
+                       timeout=config.WATCH_HEARTBEAT,
+                       return_when=FIRST_COMPLETED)
+            waiter.cancel()
+            if gone.done():
+                return
+            ready.clear()
+            body = b"".join(
+                encode_event(name, data)
+                for name, data in subscription.drain()) or HEARTBEAT
+            if subscription.overflowed:
+                body += encode_event("overflow", {})
+                return await send({"type": "http.response.body", "body": body})
+            await send({
+                "type": "http.response.body",
+                "body": body,
+                "more_body": True
+            })
+    finally:
+        gone.cancel()
+        watches.unsubscribe(subscription)
+
+
+async def lifespan(receive: Receive, send: Send) -> None:
+    """Open the shared HTTP pool on startup and close it on shutdown.
+
+    Startup also hands the event loop to the hot-record refresher.
+
+    Args:
+        receive: ASGI receive callable
+        send: ASGI send callable
+    """
+    global _client, _loop
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _loop = get_running_loop()
+            try:
+                get_client()
+            except ImportError as e:
+                await send({
+                    "type": "lifespan.startup.failed",
+                    "message": str(e)
+                })
+                return
+            if cache.store is not None:
+                # Warm from disk off the loop so startup never blocks on it
+                get_running_loop().run_in_executor(
+                    None, cache.warm, config.PERSIST_WARM_ENTRIES)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _client is not None:
+                await _client.aclose()
+                _client = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def retry_after(error: CircuitOpenError) -> str:
+    """Format the ``Retry-After`` value of a rejected call.
+
+    Args:
+        error: Rejection raised by the circuit breaker
+
+    Returns:
+        str: Whole seconds until the breaker lets a trial call through
+    """
+    return str(int(error.retry_after) + 1)
+
+
+def head_send(send: Send) -> Send:
+    """Wrap ``send`` so a HEAD response keeps its headers but no body.
+
+    Args:
+        send: ASGI send callable
+
+    Returns:
+        Send: ASGI send callable
+    """
+
+    async def wrapped(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.body":
+            message = {**message, "body": b""}
+        await send(message)
+
+    return wrapped
+
+
+def timed_send(send: Send, timings: Optional[Timings]) -> Send:
+    """Wrap ``send`` so the response carries a ``Server-Timing`` header.
+
+    Args:
+        send: ASGI send callable
+        timings: Timings of the request, or None to leave ``send`` as is
+
+    Returns:
+        Send: ASGI send callable
+    """
+    if timings is None:
+        return send
+
+    async def wrapped(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            message["headers"] = [
+                *message["headers"],
+                (TIMING_HEADER.lower().encode(), timings.header().encode()),
+            ]
+        await send(message)
+
+    return wrapped
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    """ASGI application entry point.
+
+    Args:
+        scope: ASGI connection scope
+        receive: ASGI receive callable
+        send: ASGI send callable
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["method"] not in ("GET", "HEAD"):
+        return await respond(send, {"error": "method not allowed"}, 405)
+    path = scope["path"]
+    if scope["method"] == "HEAD":
+        if path == "/watch":
+            # An event stream has no length to report
+            return await respond(send, {"error": "method not allowed"},
+                                 405,
+                                 headers={"Allow": "GET"})
+        send = head_send(send)
+    if path == "/":
+        return await respond(send, INDEX.read_bytes(),
+                             content_type="text/html; charset=utf-8")
+    if path == "/watch":
+        return await repl_watch(
+            receive, send,
+            parse_qs(scope["query_string"].decode(), keep_blank_values=True))
+    if path == "/get":
+        with timing_scope() as timings:
+            with phase("parse"):
+                args = parse_qs(scope["query_string"].decode(),
+                                keep_blank_values=True)
+                headers = {
+                    name.decode("latin-1").title(): value.decode("latin-1")
+                    for name, value in scope["headers"]
+                }
+            current_deadline.set(Deadline.from_headers(headers))
+            return await repl_info(timed_send(send, timings), args, headers)
+    return await respond(send, {"error": "not found"}, 404)
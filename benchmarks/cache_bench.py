@@ -0,0 +1,87 @@
+"""
+Benchmark the host-local cache backends.
+Stores a canned full ``Repl`` payload under a batch of keys in the
+``memory``, ``shared`` and ``disk`` backends and reports the wall time of
+one store and one hit on each, showing what the memory-mapped backend
+costs over the in-process one and saves over SQLite for sharing entries
+between workers.
+
+Usage:
+    python benchmarks/cache_bench.py [--iterations N] [--keys N]
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from sys import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+path.insert(0, str(ROOT))
+
+import codec  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from persist import DiskCache, PersistentStore  # noqa: E402
+from sharedcache import SharedCache  # noqa: E402
+
+PAYLOAD = codec.loads(
+    (ROOT / "benchmarks" / "payloads" / "repl.json").read_bytes())
+
+
+def measure(cache: TTLCache, keys: int,
+            iterations: int) -> Tuple[float, float]:
+    """Measure the wall time of one store and one hit in microseconds.
+
+    Args:
+        cache: Backend to measure
+        keys: Distinct keys stored and read in turn
+        iterations: Number of stores and of hits
+
+    Returns:
+        Tuple[float, float]: Mean wall microseconds per store and per hit
+    """
+    start = perf_counter()
+    for key in range(iterations):
+        cache.set(("repl", key % keys), PAYLOAD)
+    stored = (perf_counter() - start) / iterations * 1e6
+    for key in range(min(iterations, 100)):
+        cache.get(("repl", key % keys))
+    start = perf_counter()
+    for key in range(iterations):
+        cache.get(("repl", key % keys))
+    return stored, (perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations: int, keys: int) -> Dict[str, Tuple[float, float]]:
+    """Run every backend and report its store and hit latency.
+
+    Args:
+        iterations: Stores and hits per backend
+        keys: Distinct keys per backend
+
+    Returns:
+        Dict[str, Tuple[float, float]]: Wall microseconds per store and
+        per hit by backend
+    """
+    with TemporaryDirectory() as tmp:
+        disk = PersistentStore(str(Path(tmp) / "cache.sqlite3"))
+        return {
+            "memory": measure(TTLCache(), keys, iterations),
+            "shared": measure(SharedCache(str(Path(tmp) / "cache.shm")),
+                              keys, iterations),
+            "disk": measure(DiskCache(disk), keys, iterations),
+        }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=100)
+    args = parser.parse_args()
+    result = run(args.iterations, args.keys)
+    print(f"codec backend: {codec.NAME}, payload: "
+          f"{len(codec.dumps(PAYLOAD))} bytes, keys: {args.keys}")
+    for backend, (stored, hit) in result.items():
+        print(f"{backend + ':':8} store {stored:8.1f} us, "
+              f"hit {hit:8.1f} us")
@@ -0,0 +1,104 @@
+"""
+Benchmark the JSON codec layer on the /get hot path.
+Compares the previous decode/extract/encode path (stdlib ``json`` via
+``requests``, chained ``.get`` extraction and Flask ``jsonify``) with the
+``codec`` path on a canned full ``Repl`` payload, reporting CPU time per
+request.
+
+Usage:
+    python benchmarks/codec_bench.py [--iterations N]
+"""
+
+from argparse import ArgumentParser
+from json import loads as json_loads
+from pathlib import Path
+from sys import path
+from time import process_time
+from typing import Callable, Dict
+
+from flask import jsonify
+
+ROOT = Path(__file__).resolve().parent.parent
+path.insert(0, str(ROOT))
+
+import codec  # noqa: E402
+from main import app, json_response  # noqa: E402
+from upstream import extract_repl  # noqa: E402
+
+PAYLOAD = (ROOT / "benchmarks" / "payloads" / "repl.json").read_bytes()
+
+
+def legacy_path(body: bytes) -> bytes:
+    """Decode, extract and encode the way ``get_info`` used to.
+
+    Args:
+        body: Raw upstream body
+
+    Returns:
+        bytes: Encoded response body
+    """
+    out = json_loads(body.decode("utf-8"))
+    info = ((out.get("data", out) or out).get("repl", out)) if out else None
+    return jsonify(info).get_data()
+
+
+def codec_path(body: bytes) -> bytes:
+    """Decode, extract and encode through the codec layer.
+
+    Args:
+        body: Raw upstream body
+
+    Returns:
+        bytes: Encoded response body
+    """
+    return json_response(extract_repl(codec.loads(body))).get_data()
+
+
+def cpu_per_call(fn: Callable[[bytes], bytes], iterations: int) -> float:
+    """Measure the CPU time of one call in microseconds.
+
+    Args:
+        fn: Path to measure
+        iterations: Number of calls
+
+    Returns:
+        float: Mean CPU microseconds per call
+    """
+    for _ in range(min(iterations, 100)):
+        fn(PAYLOAD)
+    start = process_time()
+    for _ in range(iterations):
+        fn(PAYLOAD)
+    return (process_time() - start) / iterations * 1e6
+
+
+def run(iterations: int) -> Dict[str, float]:
+    """Run both paths and report their cost.
+
+    Args:
+        iterations: Calls per path
+
+    Returns:
+        Dict[str, float]: CPU microseconds per request and the saving
+    """
+    with app.app_context():
+        legacy = cpu_per_call(legacy_path, iterations)
+        current = cpu_per_call(codec_path, iterations)
+    return {
+        "legacy_us": legacy,
+        "codec_us": current,
+        "saved_us": legacy - current,
+        "speedup": legacy / current if current else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+    result = run(args.iterations)
+    print(f"codec backend: {codec.NAME}, payload: {len(PAYLOAD)} bytes")
+    print(f"legacy path:  {result['legacy_us']:8.1f} us/request")
+    print(f"codec path:   {result['codec_us']:8.1f} us/request")
+    print(f"saved:        {result['saved_us']:8.1f} us/request "
+          f"({result['speedup']:.2f}x)")
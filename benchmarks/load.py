@@ -0,0 +1,361 @@
+"""
+End-to-end load benchmark for /get against a local stub upstream.
+Starts ``stub_upstream.py`` and the service under a chosen server, drives
+/get (full record and title only) at a fixed concurrency and writes RPS,
+latency percentiles and server CPU per request to a JSON results file.
+Several servers and worker/thread counts can be compared in one run.
+
+Usage:
+    python benchmarks/load.py [--server flask gunicorn uvicorn]
+        [--workers 1 4] [--threads 8] [--concurrency 32] [--duration 10]
+        [--output benchmarks/results/load.json]
+"""
+
+from argparse import ArgumentParser, Namespace
+from http.client import HTTPConnection
+from itertools import product
+from json import dumps
+from os import cpu_count, environ, listdir, sysconf
+from pathlib import Path
+from platform import python_version
+from socket import socket
+from subprocess import DEVNULL, Popen
+from sys import executable, path
+from threading import Event, Thread
+from time import monotonic, perf_counter, sleep
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+path.insert(0, str(ROOT / "benchmarks"))
+
+from stub_upstream import add_arguments  # noqa: E402
+
+MODES = {
+    "full": "/get?replit_id={}",
+    "title": "/get?replit_id={}&title",
+}
+
+
+def free_port() -> int:
+    """Return a currently unused local TCP port.
+
+    Returns:
+        int: Port number
+    """
+    with socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server: str, port: int, workers: int,
+                   threads: int) -> List[str]:
+    """Build the command line that serves the app.
+
+    Args:
+        server: ``flask``, ``gunicorn``, ``waitress`` or ``uvicorn``
+        port: Port to listen on
+        workers: Worker processes (ignored by single-process servers)
+        threads: Threads per worker (ignored by ``uvicorn``)
+
+    Returns:
+        List[str]: Command line
+    """
+    bind = f"127.0.0.1:{port}"
+    if server == "flask":
+        return [
+            executable, "-c",
+            f"from main import app; app.run(port={port}, threaded=True)"
+        ]
+    if server == "gunicorn":
+        return [
+            executable, "-m", "gunicorn", "-b", bind, "-w",
+            str(workers), "--threads",
+            str(threads), "main:app"
+        ]
+    if server == "waitress":
+        return [
+            executable, "-m", "waitress", f"--listen={bind}",
+            f"--threads={threads}", "main:app"
+        ]
+    if server == "uvicorn":
+        return [
+            executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port",
+            str(port), "--workers",
+            str(workers), "--no-access-log", "asgi:app"
+        ]
+    raise ValueError(f"unknown server: {server}")
+
+
+def wait_ready(port: int, timeout: float = 30) -> None:
+    """Block until a server answers HTTP requests on ``port``.
+
+    Args:
+        port: Port to poll
+        timeout: Seconds to wait
+
+    Raises:
+        TimeoutError: If the server does not come up in time
+    """
+    give_up = monotonic() + timeout
+    while monotonic() < give_up:
+        try:
+            conn = HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise TimeoutError(f"nothing listening on port {port}")
+
+
+def process_tree_cpu(pid: int) -> Optional[float]:
+    """Sum the CPU seconds used so far by a process and its descendants.
+
+    Reads ``/proc``, so it only works on Linux.
+
+    Args:
+        pid: Root process ID
+
+    Returns:
+        Optional[float]: User plus system seconds, or None without
+        ``/proc``
+    """
+    try:
+        entries = [entry for entry in listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    tick = sysconf("SC_CLK_TCK")
+    stats: Dict[int, List[str]] = {}
+    for entry in entries:
+        try:
+            text = (Path("/proc") / entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields follow its ")"
+        stats[int(entry)] = text[text.rindex(")") + 2:].split()
+    tree, total = {pid}, 0.0
+    for _ in range(8):
+        tree |= {child for child, fields in stats.items()
+                 if int(fields[1]) in tree}
+    for member in tree:
+        fields = stats.get(member)
+        if fields:
+            total += (int(fields[11]) + int(fields[12])) / tick
+    return total
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the ``q`` percentile of sorted ``values``.
+
+    Args:
+        values: Sorted samples
+        q: Percentile between 0 and 100
+
+    Returns:
+        float: Sample at the percentile, or 0.0 without samples
+    """
+    if not values:
+        return 0.0
+    return values[min(int(q / 100 * len(values)), len(values) - 1)]
+
+
+def drive(port: int, mode: str, options: Namespace) -> Dict[str, Any]:
+    """Send requests at a fixed concurrency for a fixed time.
+
+    Args:
+        port: Port the service listens on
+        mode: Key of ``MODES``
+        options: Command line options
+
+    Returns:
+        Dict[str, Any]: Request count, errors, latencies and elapsed time
+    """
+    stop = Event()
+    results: List[Dict[str, Any]] = []
+
+    def client(worker: int) -> None:
+        conn = HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies, errors, i = [], 0, worker
+        while not stop.is_set():
+            target = MODES[mode].format(f"repl-{i % options.ids}")
+            i += options.concurrency
+            start = perf_counter()
+            try:
+                conn.request("GET", target)
+                response = conn.getresponse()
+                response.read()
+                errors += response.status >= 500
+            except OSError:
+                errors += 1
+                conn.close()
+                conn = HTTPConnection("127.0.0.1", port, timeout=30)
+            latencies.append(perf_counter() - start)
+        conn.close()
+        results.append({"latencies": latencies, "errors": errors})
+
+    clients = [
+        Thread(target=client, args=(worker, ), daemon=True)
+        for worker in range(options.concurrency)
+    ]
+    start = monotonic()
+    for thread in clients:
+        thread.start()
+    sleep(options.duration)
+    stop.set()
+    for thread in clients:
+        thread.join()
+    latencies = sorted(latency for result in results
+                       for latency in result["latencies"])
+    return {
+        "elapsed": monotonic() - start,
+        "latencies": latencies,
+        "errors": sum(result["errors"] for result in results),
+    }
+
+
+def run_one(server: str, workers: int, threads: int, mode: str,
+            upstream_port: int, options: Namespace) -> Dict[str, Any]:
+    """Benchmark one server configuration in one mode.
+
+    Args:
+        server: Server name, see ``server_command``
+        workers: Worker processes
+        threads: Threads per worker
+        mode: Key of ``MODES``
+        upstream_port: Port of the stub upstream
+        options: Command line options
+
+    Returns:
+        Dict[str, Any]: Result row
+    """
+    port = free_port()
+    env = dict(environ,
+               REPLIT_INFO_UPSTREAM_URL=f"http://127.0.0.1:{upstream_port}")
+    if options.no_cache:
+        env["REPLIT_INFO_CACHE_ENABLED"] = "false"
+    for item in options.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+    process = Popen(server_command(server, port, workers, threads),
+                    cwd=ROOT,
+                    env=env,
+                    stdout=DEVNULL,
+                    stderr=DEVNULL)
+    try:
+        wait_ready(port)
+        if options.warmup:
+            drive(port, mode, Namespace(**{
+                **vars(options), "duration": options.warmup
+            }))
+        cpu_before = process_tree_cpu(process.pid)
+        measured = drive(port, mode, options)
+        cpu_after = process_tree_cpu(process.pid)
+    finally:
+        process.terminate()
+        process.wait(10)
+    latencies, count = measured["latencies"], len(measured["latencies"])
+    cpu = (cpu_after - cpu_before) if cpu_before is not None else None
+    return {
+        "server": server,
+        "workers": workers,
+        "threads": threads,
+        "mode": mode,
+        "requests": count,
+        "errors": measured["errors"],
+        "rps": count / measured["elapsed"],
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "cpu_ms_per_request": (cpu / count * 1000) if cpu and count else None,
+    }
+
+
+def main(options: Namespace) -> Dict[str, Any]:
+    """Run every requested configuration and write the results file.
+
+    Args:
+        options: Command line options
+
+    Returns:
+        Dict[str, Any]: Run metadata and one row per configuration
+    """
+    upstream_port = free_port()
+    stub = Popen([
+        executable,
+        str(ROOT / "benchmarks" / "stub_upstream.py"), "--port",
+        str(upstream_port), "--latency",
+        str(options.latency), "--jitter",
+        str(options.jitter), "--error-rate",
+        str(options.error_rate), "--missing-rate",
+        str(options.missing_rate)
+    ])
+    runs = []
+    try:
+        wait_ready(upstream_port)
+        for server, workers, threads, mode in product(
+                options.server, options.workers, options.threads,
+                options.mode):
+            row = run_one(server, workers, threads, mode, upstream_port,
+                          options)
+            runs.append(row)
+            print(f"{server:>8} w={workers} t={threads} {mode:>5}: "
+                  f"{row['rps']:8.1f} rps  p50 {row['p50_ms']:7.2f} ms  "
+                  f"p99 {row['p99_ms']:7.2f} ms  errors {row['errors']}")
+    finally:
+        stub.terminate()
+        stub.wait(10)
+    report = {
+        "meta": {
+            "python": python_version(),
+            "cpu_count": cpu_count(),
+            "concurrency": options.concurrency,
+            "duration": options.duration,
+            "ids": options.ids,
+            "cache": not options.no_cache,
+            "upstream": {
+                "latency_ms": options.latency,
+                "jitter_ms": options.jitter,
+                "error_rate": options.error_rate,
+                "missing_rate": options.missing_rate,
+            },
+        },
+        "runs": runs,
+    }
+    output = Path(options.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(dumps(report, indent=2) + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--server",
+                        nargs="+",
+                        default=["flask"],
+                        choices=["flask", "gunicorn", "waitress", "uvicorn"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1])
+    parser.add_argument("--threads", nargs="+", type=int, default=[8])
+    parser.add_argument("--mode",
+                        nargs="+",
+                        default=list(MODES),
+                        choices=list(MODES))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--ids",
+                        type=int,
+                        default=1000,
+                        help="distinct repl IDs cycled through")
+    parser.add_argument("--no-cache",
+                        action="store_true",
+                        help="disable the response cache in the service")
+    parser.add_argument("--env",
+                        action="append",
+                        default=[],
+                        help="extra NAME=VALUE setting for the service")
+    parser.add_argument("--output",
+                        default=str(ROOT / "benchmarks" / "results" /
+                                    "load.json"))
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,210 @@
+"""
+Microbenchmarks for each step of the /get hot path, with a regression gate.
+Runs offline on the canned upstream payload: query construction, decode
+and ``repl`` extraction, the ``title`` branch of ``repl_info`` and
+response serialization. Results are compared with the committed
+``baseline.json``; the run fails when a benchmark is slower by more than
+the threshold.
+
+Usage:
+    python benchmarks/micro.py [--threshold 25] [--save] [--only NAME]
+"""
+
+from argparse import ArgumentParser
+from json import dumps, loads
+from os import environ
+from pathlib import Path
+from statistics import median
+from sys import exit, path
+from timeit import Timer
+from typing import Callable, Dict, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+path.insert(0, str(ROOT))
+
+# Keep the suite offline and free of side effects
+environ["REPLIT_INFO_UPSTREAM_URL"] = "http://127.0.0.1:9"
+environ["REPLIT_INFO_PERSIST_PATH"] = ""
+environ["REPLIT_INFO_CACHE_ENABLED"] = "true"
+environ["REPLIT_INFO_CACHE_TTL"] = "86400"
+
+import codec  # noqa: E402
+import main  # noqa: E402
+from query import build_batch_query, build_query  # noqa: E402
+from records import record_key  # noqa: E402
+from upstream import extract_repl  # noqa: E402
+
+PAYLOAD = (ROOT / "benchmarks" / "payloads" / "repl.json").read_bytes()
+RECORD = extract_repl(codec.loads(PAYLOAD))
+BASELINE = ROOT / "benchmarks" / "baseline.json"
+REPL_ID = RECORD["id"]
+
+Result = Dict[str, float]
+
+
+def calibration() -> None:
+    """Fixed pure-Python workload each benchmark is measured against."""
+    total = 0
+    for i in range(1000):
+        total += i * i % 7
+
+
+def query_build() -> None:
+    """Build the full, title-only and batch query documents uncached."""
+    build_query.__wrapped__(None)
+    build_query.__wrapped__(("title", ))
+    build_batch_query.__wrapped__(50, None)
+
+
+def decode_extract() -> None:
+    """Decode the canned upstream body and pull out the record."""
+    extract_repl(codec.loads(PAYLOAD))
+
+
+def serialize() -> None:
+    """Encode the full record as a JSON response."""
+    main.json_response(RECORD).get_data()
+
+
+client = main.app.test_client()
+
+
+def get(target: str) -> None:
+    """Request ``target`` from the Flask app.
+
+    Args:
+        target: Path and query string
+
+    Raises:
+        RuntimeError: If the response is not a 200, so a failing path is
+            never mistaken for a fast one
+    """
+    status = client.get(target).status_code
+    if status != 200:
+        raise RuntimeError(f"GET {target} answered {status}")
+
+
+def title_branch() -> None:
+    """Serve ``/get?title`` for a cached record through the Flask app."""
+    get(f"/get?replit_id={REPL_ID}&title")
+
+
+def full_cached() -> None:
+    """Serve ``/get`` for a cached full record through the Flask app."""
+    get(f"/get?replit_id={REPL_ID}")
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "query_build": query_build,
+    "decode_extract": decode_extract,
+    "serialize": serialize,
+    "title_branch": title_branch,
+    "full_cached": full_cached,
+}
+
+
+def measure(fn: Callable[[], None], repeat: int = 30) -> Result:
+    """Time one benchmark against the calibration workload.
+
+    Each round of the benchmark is followed by a round of ``calibration``.
+    The median ratio of the two is compared with the baseline, so noise
+    that hits both, or a faster machine, cancels out.
+
+    Args:
+        fn: Benchmark body
+        repeat: Paired timing rounds of about 20 ms each
+
+    Returns:
+        Result: Fastest microseconds per call and the median cost relative
+        to ``calibration``
+    """
+    timer, reference = Timer(fn), Timer(calibration)
+    number = max(timer.autorange()[0] // 10, 1)
+    reference_number = max(reference.autorange()[0] // 10, 1)
+    times, ratios = [], []
+    for _ in range(repeat):
+        elapsed = timer.timeit(number) / number
+        times.append(elapsed)
+        ratios.append(elapsed /
+                      (reference.timeit(reference_number) / reference_number))
+    return {
+        "us": round(min(times) * 1e6, 3),
+        "relative": round(median(ratios), 4),
+    }
+
+
+def run(only: Optional[str] = None) -> Dict[str, Result]:
+    """Run the benchmarks.
+
+    Args:
+        only: Name of a single benchmark to run, or None for all
+
+    Returns:
+        Dict[str, Result]: Result by benchmark name
+    """
+    # ``?title`` is projected from the cached full record
+    main.cache.set(record_key(REPL_ID), RECORD)
+    return {
+        name: measure(fn)
+        for name, fn in BENCHMARKS.items() if only in (None, name)
+    }
+
+
+def compare(results: Dict[str, Result], baseline: Dict[str, Result],
+            threshold: float) -> Dict[str, float]:
+    """Find benchmarks that regressed against the baseline.
+
+    Args:
+        results: Current results
+        baseline: Committed results
+        threshold: Allowed slowdown in percent
+
+    Returns:
+        Dict[str, float]: Slowdown in percent of each regressed benchmark
+    """
+    regressed = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = (result["relative"] / baseline[name]["relative"] - 1) * 100
+        if change > threshold:
+            regressed[name] = change
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=float(
+                            environ.get("REPLIT_INFO_BENCH_THRESHOLD", 25)),
+                        help="allowed slowdown in percent")
+    parser.add_argument("--save",
+                        action="store_true",
+                        help="record the results as the new baseline")
+    parser.add_argument("--only", choices=list(BENCHMARKS))
+    args = parser.parse_args()
+    results = run(args.only)
+    baseline = loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    for name, result in results.items():
+        change = ""
+        if name in baseline:
+            ratio = result["relative"] / baseline[name]["relative"]
+            change = f"{(ratio - 1) * 100:+6.1f}%"
+        print(f"{name:16} {result['us']:10.2f} us  {change}")
+    if args.save:
+        BASELINE.write_text(
+            dumps({**baseline, **results}, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {BASELINE.relative_to(ROOT)}")
+    elif baseline:
+        regressed = compare(results, baseline, args.threshold)
+        # Re-measure before failing, so one noisy run is not a regression
+        for name in regressed:
+            retry = measure(BENCHMARKS[name])
+            if retry["relative"] < results[name]["relative"]:
+                results[name] = retry
+        regressed = compare(results, baseline, args.threshold)
+        for name, change in regressed.items():
+            print(f"REGRESSION: {name} is {change:.1f}% slower than the "
+                  f"baseline (threshold {args.threshold:g}%)")
+        exit(1 if regressed else 0)
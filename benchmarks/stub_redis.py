@@ -0,0 +1,149 @@
+"""
+Local stand-in for a Redis server used to exercise the ``redis`` cache
+backend without installing Redis. Speaks RESP and implements the
+commands the backend uses: GET, SET (with EX/PX), MGET, DEL, SCAN,
+DBSIZE, FLUSHDB, PING, SELECT and AUTH. Data lives in memory only.
+
+Usage:
+    python benchmarks/stub_redis.py [--port 6379]
+"""
+
+from argparse import ArgumentParser
+from fnmatch import fnmatchcase
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+DATA: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+LOCK = Lock()
+
+
+def encode_reply(reply: Any) -> bytes:
+    """Encode a reply in RESP.
+
+    Args:
+        reply: str (status), int, bytes, None, list or Exception
+
+    Returns:
+        bytes: Wire form of the reply
+    """
+    if isinstance(reply, Exception):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(map(encode_reply, reply))
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+def lookup(key: bytes) -> Optional[bytes]:
+    """Return a live value, dropping it if it has expired.
+
+    Args:
+        key: Key name
+
+    Returns:
+        Optional[bytes]: The value, or None
+    """
+    found = DATA.get(key)
+    if found is None:
+        return None
+    value, expires_at = found
+    if expires_at is not None and monotonic() >= expires_at:
+        del DATA[key]
+        return None
+    return value
+
+
+def run(args: List[bytes]) -> Any:
+    """Execute one command.
+
+    Args:
+        args: Command name and arguments
+
+    Returns:
+        Any: Reply for ``encode_reply``
+    """
+    name = args[0].upper()
+    with LOCK:
+        if name == b"GET":
+            return lookup(args[1])
+        if name == b"MGET":
+            return [lookup(key) for key in args[1:]]
+        if name == b"SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[3:]]
+            if b"PX" in options:
+                expires_at = monotonic() + int(
+                    args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = monotonic() + int(
+                    args[3 + options.index(b"EX") + 1])
+            DATA[args[1]] = (args[2], expires_at)
+            return "OK"
+        if name == b"DEL":
+            return sum(DATA.pop(key, None) is not None for key in args[1:])
+        if name == b"SCAN":
+            # One pass over everything; a cursor of 0 ends the scan
+            upper = [arg.upper() for arg in args]
+            pattern = args[upper.index(b"MATCH") +
+                           1] if b"MATCH" in upper else b"*"
+            keys = [
+                key for key in list(DATA)
+                if fnmatchcase(key.decode(), pattern.decode())
+                and lookup(key) is not None
+            ]
+            return [b"0", keys]
+        if name == b"DBSIZE":
+            return sum(lookup(key) is not None for key in list(DATA))
+        if name == b"FLUSHDB":
+            DATA.clear()
+            return "OK"
+        if name == b"PING":
+            return "PONG"
+        if name in (b"SELECT", b"AUTH"):
+            return "OK"
+    return ValueError(f"unknown command '{name.decode()}'")
+
+
+class RespHandler(StreamRequestHandler):
+    """Serve RESP commands on one client connection."""
+
+    def handle(self) -> None:
+        while True:
+            line = self.rfile.readline()
+            if not line.startswith(b"*"):
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(encode_reply(run(args)))
+
+
+class RespServer(ThreadingTCPServer):
+    """Threaded TCP server for ``RespHandler``."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(port: int) -> None:
+    """Run the stand-in server until interrupted.
+
+    Args:
+        port: Port to listen on
+    """
+    with RespServer(("127.0.0.1", port), RespHandler) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=6379)
+    serve(parser.parse_args().port)
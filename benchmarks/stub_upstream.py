@@ -0,0 +1,165 @@
+"""
+Local stand-in for the replit.com GraphQL endpoint used by benchmarks.
+Answers single and aliased batch ``Repl`` queries from the canned payload,
+projected to the requested top-level fields, with configurable latency
+and error injection.
+
+Usage:
+    python benchmarks/stub_upstream.py [--port 8765] [--latency MS]
+        [--jitter MS] [--error-rate P] [--missing-rate P]
+"""
+
+from argparse import ArgumentParser, Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from pathlib import Path
+from random import random, uniform
+from re import finditer
+from time import sleep
+from typing import Any, Dict, List, Optional
+
+PAYLOAD = Path(__file__).resolve().parent / "payloads" / "repl.json"
+RECORD: Dict[str, Any] = loads(PAYLOAD.read_bytes())["data"]["repl"]
+
+
+def selected_fields(query: str) -> Optional[List[str]]:
+    """Find the top-level fields a query selects on ``Repl``.
+
+    Args:
+        query: GraphQL document
+
+    Returns:
+        Optional[List[str]]: Field names, or None if no selection on
+        ``Repl`` was found
+    """
+    start = query.find("on Repl {")
+    if start < 0:
+        return None
+    fields, depth = [], 0
+    for match in finditer(r"[{}]|\w+", query[start + len("on Repl "):]):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                break
+        elif depth == 1:
+            fields.append(token)
+    return fields
+
+
+def respond_repl(replit_id: str, fields: Optional[List[str]],
+                 options: Namespace) -> Optional[Dict[str, Any]]:
+    """Build the record for one repl ID.
+
+    Args:
+        replit_id: Requested repl ID
+        fields: Top-level fields to keep, or None for all
+        options: Command line options
+
+    Returns:
+        Optional[Dict[str, Any]]: Record, or None to simulate a missing
+        repl
+    """
+    if random() < options.missing_rate:
+        return None
+    record = dict(RECORD, id=replit_id)
+    if fields is not None:
+        record = {field: record.get(field) for field in fields}
+    return record
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serve GraphQL ``Repl`` queries from the canned payload."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK on every kept-alive request
+    disable_nagle_algorithm = True
+    options = Namespace(latency=0.0,
+                        jitter=0.0,
+                        error_rate=0.0,
+                        missing_rate=0.0)
+
+    def do_POST(self) -> None:
+        body = loads(self.rfile.read(int(self.headers["Content-Length"])))
+        delay = self.options.latency + uniform(0, self.options.jitter)
+        if delay:
+            sleep(delay / 1000)
+        if random() < self.options.error_rate:
+            return self.reply(500, {"errors": [{"message": "injected"}]})
+        variables = body.get("variables") or {}
+        fields = selected_fields(body.get("query", ""))
+        if "id" in variables:
+            data = {
+                "repl": respond_repl(variables["id"], fields, self.options)
+            }
+        else:
+            data = {
+                f"r{name[2:]}": respond_repl(value, fields, self.options)
+                for name, value in variables.items()
+            }
+        self.reply(200, {"data": data})
+
+    def reply(self, status: int, body: Dict[str, Any]) -> None:
+        """Send a JSON response on the kept-alive connection.
+
+        Args:
+            status: HTTP status code
+            body: JSON body
+        """
+        encoded = dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, *_args: Any) -> None:
+        pass
+
+
+def add_arguments(parser: ArgumentParser) -> None:
+    """Add the stub's latency and error injection options.
+
+    Args:
+        parser: Parser to extend
+    """
+    parser.add_argument("--latency",
+                        type=float,
+                        default=20.0,
+                        help="base upstream latency in milliseconds")
+    parser.add_argument("--jitter",
+                        type=float,
+                        default=10.0,
+                        help="extra random latency in milliseconds")
+    parser.add_argument("--error-rate",
+                        type=float,
+                        default=0.0,
+                        help="fraction of calls answered with HTTP 500")
+    parser.add_argument("--missing-rate",
+                        type=float,
+                        default=0.0,
+                        help="fraction of repls reported as missing")
+
+
+def serve(port: int, options: Namespace) -> None:
+    """Run the stub until interrupted.
+
+    Args:
+        port: Port to listen on
+        options: Latency and error injection options
+    """
+    StubHandler.options = options
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    serve(args.port, args)
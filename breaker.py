@@ -0,0 +1,145 @@
+"""
+Circuit breaker guarding calls to the replit.com upstream.
+After a run of consecutive failures the breaker opens and rejects calls
+immediately; once the reset timeout passes a single trial call decides
+whether it closes again. Only errors that show the upstream failing
+count, so clients cannot open the breaker with tiny request budgets.
+"""
+
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict
+
+import config
+from upstream import is_upstream_failure
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the upstream while the breaker is open.
+
+    Args:
+        retry_after: Seconds until the breaker lets a trial call through
+    """
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("upstream unavailable, circuit breaker is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Args:
+        failure_threshold: Consecutive failures that open the breaker
+        reset_timeout: Seconds the breaker stays open before a trial call
+        is_failure: Tells whether an error raised by a call counts as a
+            failure
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = config.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = config.BREAKER_RESET_TIMEOUT,
+        is_failure: Callable[[BaseException], bool] = is_upstream_failure,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = self.rejected = 0
+        self._trial = False
+        self._lock = Lock()
+
+    def allow(self) -> None:
+        """Admit a call or reject it while the breaker is open.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half open with
+                its trial call already in flight
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_after = self.opened_at + self.reset_timeout - monotonic()
+            if self.state == OPEN and retry_after <= 0:
+                self.state, self._trial = HALF_OPEN, False
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(max(retry_after, 0.0))
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call."""
+        with self._lock:
+            self.state, self.failures, self._trial = CLOSED, 0, False
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the breaker past the threshold."""
+        with self._lock:
+            self.failures += 1
+            if (self.state == HALF_OPEN
+                    or self.failures >= self.failure_threshold):
+                if self.state != OPEN:
+                    self.trips += 1
+                self.state, self.opened_at = OPEN, monotonic()
+                self._trial = False
+
+    def record_error(self, error: BaseException) -> None:
+        """Account for a call that raised.
+
+        Errors that do not count as failures leave the failure count
+        alone, but free the trial slot so a half-open breaker can try
+        again.
+
+        Args:
+            error: Error raised by the call
+        """
+        if self.is_failure(error):
+            self.record_failure()
+            return
+        with self._lock:
+            self._trial = False
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Call ``fn`` through the breaker.
+
+        Args:
+            fn: Upstream call
+            *args: Positional arguments for ``fn``
+            **kwargs: Keyword arguments for ``fn``
+
+        Returns:
+            Any: Result of ``fn``
+
+        Raises:
+            CircuitOpenError: If the breaker rejects the call
+        """
+        self.allow()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_error(e)
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the breaker state.
+
+        Returns:
+            Dict[str, Any]: State, consecutive failures, trips and
+            rejected calls
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,375 @@
+"""
+Bounded in-process cache for repl lookups.
+Entries expire after a TTL, are evicted least-recently-used once the
+entry or byte budget is exceeded, and are served stale while a
+background refresh fetches a new copy.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import monotonic
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    NamedTuple,
+    Optional,
+    Set,
+)
+
+import codec
+import config
+
+if TYPE_CHECKING:
+    from persist import PersistentStore
+
+
+class Entry(NamedTuple):
+    """A cached value with its expiry and accounted size."""
+
+    value: Any
+    expires_at: float
+    size: int
+
+
+def estimate_size(key: Hashable, data: bytes) -> int:
+    """Estimate the memory held by a cache entry in bytes.
+
+    Args:
+        key: Cache key
+        data: Serialized value
+
+    Returns:
+        int: Serialized size of key and value
+    """
+    return len(repr(key)) + len(data)
+
+
+class TTLCache:
+    """Thread-safe TTL + LRU cache with a byte budget.
+
+    This is also the cache backend interface: other backends subclass it
+    and override the storage methods ``get``, ``set``, ``clear``,
+    ``__len__`` and ``stats`` (and ``get_entries`` where they can batch
+    reads), keeping the freshness, stale-while-revalidate and refresh
+    logic. Values come back as ``codec.Document`` objects carrying their
+    serialized form.
+
+    Args:
+        ttl: Seconds an entry is served as fresh
+        stale_ttl: Extra seconds an expired entry may be served while it
+            is refreshed in the background
+        max_entries: Maximum number of entries
+        max_bytes: Maximum accounted size of all entries
+        refresh_workers: Threads used for background refreshes
+        store: Optional persistent tier read on a miss and written on
+            every ``set``
+    """
+
+    #: Backend name reported by ``stats``
+    backend = "memory"
+    #: Whether storage calls do I/O and so must stay off an event loop
+    blocking = False
+
+    def __init__(
+        self,
+        ttl: float = config.CACHE_TTL,
+        stale_ttl: float = config.CACHE_STALE_TTL,
+        max_entries: int = config.CACHE_MAX_ENTRIES,
+        max_bytes: int = config.CACHE_MAX_BYTES,
+        refresh_workers: int = config.CACHE_REFRESH_WORKERS,
+        store: Optional["PersistentStore"] = None,
+    ) -> None:
+        self.ttl = ttl
+        self.store = store
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.stale_hits = self.misses = self.store_hits = 0
+        self.evictions = self.expirations = 0
+        self.refreshes = self.refresh_errors = 0
+        self._entries: "OrderedDict[Hashable, Entry]" = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=refresh_workers,
+            thread_name_prefix="cache-refresh",
+        )
+
+    def get(self, key: Hashable, stale: bool = False) -> Optional[Entry]:
+        """Look up an entry without loading it.
+
+        Args:
+            key: Cache key
+            stale: Also return expired entries still inside the stale
+                window
+
+        Returns:
+            Optional[Entry]: The entry, or None on a miss
+        """
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if now >= entry.expires_at + self.stale_ttl:
+                self._discard(key)
+                self.expirations += 1
+                return None
+            if now >= entry.expires_at and not stale:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self,
+            key: Hashable,
+            value: Any,
+            ttl: Optional[float] = None,
+            persist: bool = True) -> Optional[Entry]:
+        """Store a value, evicting least recently used entries if needed.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Override of the default TTL in seconds; may be negative
+                for values that are already stale
+            persist: Also queue the value for the persistent tier
+
+        Returns:
+            Optional[Entry]: The stored entry, or None if it is larger
+            than the whole byte budget
+        """
+        # Serialized once; responses and the store reuse the bytes
+        data = codec.dumps(value)
+        value = codec.document(value, data)
+        if persist and self.store is not None:
+            self.store.put(key, value)
+        size = estimate_size(key, data)
+        if size > self.max_bytes:
+            return None
+        entry = Entry(value, monotonic() + (self.ttl if ttl is None else ttl),
+                      size)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self.bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self.bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def load_stored(self, key: Hashable) -> Optional[Entry]:
+        """Promote a record from the persistent tier into memory.
+
+        The entry keeps the freshness it has left, so records older than
+        the TTL come back stale.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Optional[Entry]: The promoted entry, or None if the store has
+            no usable copy
+        """
+        if self.store is None:
+            return None
+        found = self.store.get(key)
+        if found is None or found[1] >= self.ttl + self.stale_ttl:
+            return None
+        self.store_hits += 1
+        value, age = found
+        return self.set(key, value, ttl=self.ttl - age, persist=False)
+
+    def warm(self, limit: int) -> int:
+        """Preload the most recently fetched records from the store.
+
+        Args:
+            limit: Maximum number of records to load
+
+        Returns:
+            int: Number of records loaded
+        """
+        loaded = 0
+        if self.store is not None:
+            for key, value, age in self.store.recent(limit):
+                if (age < self.ttl + self.stale_ttl
+                        and self.get(key, stale=True) is None):
+                    self.set(key, value, ttl=self.ttl - age, persist=False)
+                    loaded += 1
+        return loaded
+
+    def get_entries(self, keys: Iterable[Hashable]) -> Dict[Hashable, Entry]:
+        """Look up several entries, stale ones included, without counting.
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Dict[Hashable, Entry]: Entries of the keys that were found
+        """
+        found = {}
+        for key in keys:
+            entry = self.get(key, stale=True) or self.load_stored(key)
+            if entry is not None:
+                found[key] = entry
+        return found
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Return the fresh cached values among ``keys``.
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Dict[Hashable, Any]: Values of the keys that hit
+        """
+        keys = list(keys)
+        entries = self.get_entries(keys)
+        found = {}
+        for key in keys:
+            entry = entries.get(key)
+            if entry is None or monotonic() >= entry.expires_at:
+                self.misses += 1
+            else:
+                self.hits += 1
+                found[key] = entry.value
+        return found
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return a cached value, loading it on a miss.
+
+        Fresh entries are returned directly. Expired entries inside the
+        stale window are returned immediately and refreshed in the
+        background. Anything else is loaded synchronously.
+
+        Args:
+            key: Cache key
+            loader: Callable fetching the value; None results are not
+                cached
+
+        Returns:
+            Any: Cached or freshly loaded value
+        """
+        entry = self.get(key, stale=True) or self.load_stored(key)
+        if entry is not None:
+            if monotonic() < entry.expires_at:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self.refresh(key, loader)
+            return entry.value
+        self.misses += 1
+        value = loader()
+        if value is not None:
+            entry = self.set(key, value)
+            if entry is not None:
+                # The stored copy carries its serialized form
+                value = entry.value
+        return value
+
+    def refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        """Reload an entry in the background, once per key at a time.
+
+        Args:
+            key: Cache key
+            loader: Callable fetching the new value
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, key, loader)
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        try:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+            self.refreshes += 1
+        except Exception:
+            # Keep serving the stale copy until it ages out
+            self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache effectiveness counters.
+
+        Returns:
+            Dict[str, Any]: Sizes, hit/miss/eviction counts and hit ratio
+        """
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "hit_ratio": ((self.hits + self.stale_hits) /
+                          lookups) if lookups else 0.0,
+        }
+
+
+def open_cache() -> TTLCache:
+    """Create the repl lookup cache for ``REPLIT_INFO_CACHE_BACKEND``.
+
+    Returns:
+        TTLCache: An in-process (``memory``), host-wide shared memory
+        (``shared``), SQLite (``disk``) or Redis-protocol (``redis``)
+        cache; all but ``disk`` use the persistent tier when configured
+
+    Raises:
+        ValueError: If the backend is unknown or lacks its path
+    """
+    # Imported here: the backends build on this module
+    from persist import DiskCache, open_store
+    backend = config.CACHE_BACKEND
+    if backend == "memory":
+        return TTLCache(store=open_store())
+    if backend == "shared":
+        from sharedcache import SharedCache
+        if not config.SHARED_CACHE_PATH:
+            raise ValueError("the shared cache backend needs "
+                             "REPLIT_INFO_SHARED_CACHE_PATH")
+        return SharedCache(store=open_store())
+    if backend == "disk":
+        store = open_store()
+        if store is None:
+            raise ValueError(
+                "the disk cache backend needs REPLIT_INFO_PERSIST_PATH")
+        return DiskCache(store)
+    if backend == "redis":
+        from rediscache import RedisCache
+        return RedisCache(store=open_store())
+    raise ValueError(f"unknown cache backend: {backend}")
@@ -0,0 +1,246 @@
+"""
+Record/replay cassettes of upstream GraphQL traffic for offline runs.
+Recording appends each request's response body and latency to a log;
+the log is compiled into a cassette file holding an open-addressing hash
+index keyed by query hash and variables. Replay memory-maps the cassette,
+so lookups are O(1) and a large capture costs nothing at startup.
+"""
+
+from atexit import register, unregister
+from hashlib import blake2b
+from mmap import ACCESS_READ, mmap
+from os import replace
+from pathlib import Path
+from struct import Struct
+from threading import Lock
+from types import TracebackType
+from typing import Any, Dict, Optional, Tuple, Type
+
+import codec
+import config
+
+MAGIC = b"RICASS1\0"
+# Magic, slot count, entry count
+HEADER = Struct("<8sII")
+# Key, body offset, body length, latency in seconds
+SLOT = Struct("<16sQIf")
+# Key, latency in seconds, body length; the body follows
+LOG_RECORD = Struct("<16sfI")
+EMPTY_KEY = bytes(16)
+
+
+class CassetteError(ValueError):
+    """Raised when a file is not a valid cassette."""
+
+
+def payload_key(payload: Dict[str, Any]) -> bytes:
+    """Derive the cassette key of a GraphQL payload.
+
+    Args:
+        payload: JSON body with ``query`` and ``variables``
+
+    Returns:
+        bytes: 16-byte key over the query hash and canonical variables
+    """
+    query_hash = blake2b(payload.get("query", "").encode(),
+                         digest_size=16).digest()
+    variables = codec.dumps_sorted(payload.get("variables") or {})
+    return blake2b(query_hash + variables, digest_size=16).digest()
+
+
+def compile_log(log_path: str, path: str) -> int:
+    """Build a cassette from a recording log.
+
+    The last recording of a key wins. The cassette is written to a
+    temporary file and moved into place, so readers never see a partial
+    file.
+
+    Args:
+        log_path: Recording log written by ``CassetteRecorder``
+        path: Cassette file to write
+
+    Returns:
+        int: Number of entries in the cassette
+    """
+    log = Path(log_path).read_bytes()
+    found: Dict[bytes, Tuple[int, int, float]] = {}
+    position = 0
+    while position + LOG_RECORD.size <= len(log):
+        key, latency, length = LOG_RECORD.unpack_from(log, position)
+        position += LOG_RECORD.size
+        if position + length > len(log):
+            # Torn final record from an interrupted writer
+            break
+        found[key] = (position, length, latency)
+        position += length
+    slots = 8
+    while slots < 2 * len(found):
+        slots *= 2
+    table = bytearray(slots * SLOT.size)
+    offset = HEADER.size + len(table)
+    bodies = []
+    for key, (start, length, latency) in found.items():
+        slot = int.from_bytes(key[:8], "little") % slots
+        while table[slot * SLOT.size:slot * SLOT.size + 16] != EMPTY_KEY:
+            slot = (slot + 1) % slots
+        SLOT.pack_into(table, slot * SLOT.size, key, offset, length, latency)
+        bodies.append(log[start:start + length])
+        offset += length
+    partial = f"{path}.tmp"
+    with open(partial, "wb") as out:
+        out.write(HEADER.pack(MAGIC, slots, len(found)))
+        out.write(table)
+        out.writelines(bodies)
+    replace(partial, path)
+    return len(found)
+
+
+class CassetteReader:
+    """Memory-mapped cassette answering lookups in constant time.
+
+    Args:
+        path: Cassette file written by ``compile_log``
+
+    Raises:
+        CassetteError: If the file is not a cassette
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.hits = self.misses = 0
+        with open(path, "rb") as source:
+            self._map = mmap(source.fileno(), 0, access=ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise CassetteError(f"{path} is not a cassette")
+        magic, self.slots, self.entries = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise CassetteError(f"{path} is not a cassette")
+
+    def lookup(self,
+               payload: Dict[str, Any]) -> Optional[Tuple[bytes, float]]:
+        """Find the recorded response to a payload.
+
+        Args:
+            payload: JSON body with ``query`` and ``variables``
+
+        Returns:
+            Optional[Tuple[bytes, float]]: Recorded body and latency in
+            seconds, or None if the payload was never recorded
+        """
+        key = payload_key(payload)
+        slot = int.from_bytes(key[:8], "little") % self.slots
+        for _ in range(self.slots):
+            found, offset, length, latency = SLOT.unpack_from(
+                self._map, HEADER.size + slot * SLOT.size)
+            if found == key:
+                self.hits += 1
+                return self._map[offset:offset + length], latency
+            if found == EMPTY_KEY:
+                break
+            slot = (slot + 1) % self.slots
+        self.misses += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Report replay activity.
+
+        Returns:
+            Dict[str, Any]: Cassette entries, hits and misses
+        """
+        return {
+            "mode": "replay",
+            "path": self.path,
+            "entries": self.entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CassetteRecorder:
+    """Append upstream responses to a recording log.
+
+    The log is compiled into the cassette on ``close``, which runs at
+    interpreter exit unless called earlier or when used as a context
+    manager.
+
+    Args:
+        path: Cassette file to produce
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.recorded = 0
+        self._lock = Lock()
+        # Appended to for the recorder's whole life; closed by ``close``
+        self._log = open(self.log_path, "ab")  # noqa: SIM115
+        register(self.close)
+
+    def __enter__(self) -> "CassetteRecorder":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        self.close()
+
+    def record(self, payload: Dict[str, Any], body: bytes,
+               latency: float) -> None:
+        """Append one request/response pair.
+
+        Args:
+            payload: JSON body that was sent
+            body: Raw upstream response body
+            latency: Seconds the upstream took to answer
+        """
+        record = LOG_RECORD.pack(payload_key(payload), latency,
+                                 len(body)) + body
+        with self._lock:
+            if self._log.closed:
+                return
+            # One write per record keeps concurrent appenders intact
+            self._log.write(record)
+            self._log.flush()
+            self.recorded += 1
+
+    def close(self) -> None:
+        """Stop recording and compile the log into the cassette."""
+        with self._lock:
+            if self._log.closed:
+                return
+            self._log.close()
+        unregister(self.close)
+        compile_log(self.log_path, self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report recording activity.
+
+        Returns:
+            Dict[str, Any]: Responses recorded so far
+        """
+        return {"mode": "record", "path": self.path, "recorded": self.recorded}
+
+
+def open_replay() -> Optional[CassetteReader]:
+    """Open the configured cassette for replay, if replay is enabled.
+
+    Returns:
+        Optional[CassetteReader]: Reader for ``REPLIT_INFO_CASSETTE_PATH``,
+        or None unless ``REPLIT_INFO_CASSETTE_MODE`` is ``replay``
+    """
+    if config.CASSETTE_MODE != "replay":
+        return None
+    return CassetteReader(config.CASSETTE_PATH)
+
+
+def open_recorder() -> Optional[CassetteRecorder]:
+    """Start recording to the configured cassette, if recording is enabled.
+
+    Returns:
+        Optional[CassetteRecorder]: Recorder for
+        ``REPLIT_INFO_CASSETTE_PATH``, or None unless
+        ``REPLIT_INFO_CASSETTE_MODE`` is ``record``
+    """
+    if config.CASSETTE_MODE != "record":
+        return None
+    return CassetteRecorder(config.CASSETTE_PATH)
@@ -0,0 +1,98 @@
+"""
+Single-flight coalescing of concurrent identical upstream lookups.
+The first caller for a key runs the fetch; callers arriving while it is
+in flight wait for and share its result or exception. A leader that ran
+out of its own request budget does not fail its followers: they retry.
+"""
+
+from threading import Event, Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from deadline import DeadlineExceeded
+
+
+class _Call:
+    """An in-flight fetch shared by every caller of the same key."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls across the threads of a worker."""
+
+    def __init__(self) -> None:
+        self.calls = self.coalesced = self.retries = 0
+        self._inflight: Dict[Hashable, _Call] = {}
+        self._lock = Lock()
+
+    def do(self,
+           key: Hashable,
+           fn: Callable[[], Any],
+           timeout: Optional[float] = None) -> Any:
+        """Run ``fn`` once for every concurrent caller of ``key``.
+
+        Args:
+            key: Identity of the call
+            fn: Callable performing the fetch
+            timeout: Longest a waiting caller blocks on the shared call
+
+        Returns:
+            Any: Result of the shared call
+
+        Raises:
+            TimeoutError: If a waiting caller's timeout elapses first
+            BaseException: Whatever the shared call raised, except the
+                leader's ``DeadlineExceeded``, which makes waiting callers
+                retry under their own timeout
+        """
+        give_up = None if timeout is None else monotonic() + timeout
+        while True:
+            with self._lock:
+                call = self._inflight.get(key)
+                if call is None:
+                    call = self._inflight[key] = _Call()
+                    self.calls += 1
+                    break
+                self.coalesced += 1
+            remaining = None if give_up is None else max(
+                give_up - monotonic(), 0.0)
+            if not call.done.wait(remaining):
+                raise TimeoutError("timed out waiting for in-flight lookup")
+            if isinstance(call.error, DeadlineExceeded):
+                # The leader's budget ran out, not necessarily this one's
+                self.retries += 1
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+        return call.value
+
+    def stats(self) -> Dict[str, Any]:
+        """Report how many upstream calls coalescing saved.
+
+        Returns:
+            Dict[str, Any]: Leader calls, coalesced callers, callers that
+            retried after their leader's budget ran out and calls
+            currently in flight
+        """
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,143 @@
+"""
+JSON codec used for upstream decode and response encode.
+Backed by ``orjson`` when it is installed, with a ``json`` fallback
+producing the same compact output. Decoded objects can keep the bytes
+they came from as a ``Document``, which ``dumps`` passes through as is.
+"""
+
+from typing import Any, Union
+
+Encoded = Union[bytes, bytearray, memoryview, str]
+
+
+class Document(dict):
+    """JSON object that remembers its encoded form.
+
+    ``dumps`` returns ``raw`` instead of encoding the object again, so a
+    cached record is serialized once. Treat documents as read-only.
+    """
+
+    __slots__ = ("raw", )
+    raw: bytes
+
+
+try:
+    from orjson import OPT_SORT_KEYS
+    from orjson import dumps as _orjson_dumps
+    from orjson import loads as _orjson_loads
+except ImportError:  # pragma: no cover - depends on the environment
+    _orjson_dumps = None
+
+if _orjson_dumps is not None:
+    NAME = "orjson"
+
+    def loads(data: Encoded) -> Any:
+        """Decode a JSON document.
+
+        Args:
+            data: Encoded JSON; buffers are decoded in place
+
+        Returns:
+            Any: Decoded value
+        """
+        return _orjson_loads(data)
+
+    def dumps(value: Any) -> bytes:
+        """Encode a value as compact JSON.
+
+        Args:
+            value: JSON-serializable value
+
+        Returns:
+            bytes: UTF-8 encoded JSON
+        """
+        if type(value) is Document:
+            return value.raw
+        return _orjson_dumps(value)
+
+    def dumps_sorted(value: Any) -> bytes:
+        """Encode a value as compact JSON with sorted object keys.
+
+        Args:
+            value: JSON-serializable value
+
+        Returns:
+            bytes: UTF-8 encoded canonical JSON
+        """
+        return _orjson_dumps(value, option=OPT_SORT_KEYS)
+
+else:
+    from json import dumps as _json_dumps
+    from json import loads as _json_loads
+
+    NAME = "json"
+
+    def loads(data: Encoded) -> Any:
+        """Decode a JSON document.
+
+        Args:
+            data: Encoded JSON; memoryviews are copied first
+
+        Returns:
+            Any: Decoded value
+        """
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return _json_loads(data)
+
+    def dumps(value: Any) -> bytes:
+        """Encode a value as compact JSON.
+
+        Args:
+            value: JSON-serializable value
+
+        Returns:
+            bytes: UTF-8 encoded JSON
+        """
+        if type(value) is Document:
+            return value.raw
+        return _json_dumps(value, ensure_ascii=False,
+                           separators=(",", ":")).encode()
+
+    def dumps_sorted(value: Any) -> bytes:
+        """Encode a value as compact JSON with sorted object keys.
+
+        Args:
+            value: JSON-serializable value
+
+        Returns:
+            bytes: UTF-8 encoded canonical JSON
+        """
+        return _json_dumps(value,
+                           ensure_ascii=False,
+                           sort_keys=True,
+                           separators=(",", ":")).encode()
+
+
+def document(value: Any, raw: bytes) -> Any:
+    """Attach its encoded form to a decoded value.
+
+    Args:
+        value: Decoded JSON value
+        raw: ``dumps`` output for ``value``
+
+    Returns:
+        Any: A ``Document`` for objects; other values unchanged
+    """
+    if not isinstance(value, dict):
+        return value
+    found = Document(value)
+    found.raw = raw
+    return found
+
+
+def loads_document(data: Union[bytes, memoryview]) -> Any:
+    """Decode JSON produced by ``dumps``, keeping its encoded form.
+
+    Args:
+        data: Compact JSON
+
+    Returns:
+        Any: Decoded value; objects come back as a ``Document``
+    """
+    return document(loads(data), bytes(data))
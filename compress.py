@@ -0,0 +1,166 @@
+"""
+Negotiated response compression for JSON responses.
+Supports gzip, plus brotli and zstd when their optional packages are
+installed. Compressed bodies are kept in a bounded store keyed by
+content hash, so a hot record is compressed once rather than on every
+request.
+"""
+
+from collections import OrderedDict
+from gzip import compress as gzip_compress
+from hashlib import blake2b
+from threading import Lock, local
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import config
+from timing import phase
+
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {
+    "gzip": lambda body: gzip_compress(body, config.COMPRESS_GZIP_LEVEL,
+                                       mtime=0),
+}
+
+try:
+    from brotli import compress as brotli_compress
+
+    ENCODERS["br"] = lambda body: brotli_compress(
+        body, quality=config.COMPRESS_BROTLI_QUALITY)
+except ImportError:  # pragma: no cover - depends on the environment
+    pass
+
+try:
+    from zstandard import ZstdCompressor
+
+    # Compressor objects are not thread-safe, so each thread keeps its own
+    _zstd = local()
+
+    def zstd_compress(body: bytes) -> bytes:
+        compressor = getattr(_zstd, "compressor", None)
+        if compressor is None:
+            compressor = _zstd.compressor = ZstdCompressor(
+                level=config.COMPRESS_ZSTD_LEVEL)
+        return compressor.compress(body)
+
+    ENCODERS["zstd"] = zstd_compress
+except ImportError:  # pragma: no cover - depends on the environment
+    pass
+
+# Server preference when the client accepts several encodings equally
+PREFERENCE = ("br", "zstd", "gzip")
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding for an ``Accept-Encoding`` value.
+
+    Args:
+        accept_encoding: Request header value
+
+    Returns:
+        Optional[str]: Encoding name, or None for identity
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip().lower()] = quality
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for name in PREFERENCE:
+        weight = weights.get(name, wildcard)
+        if name in ENCODERS and weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def select_encoding(size: int,
+                    accept_encoding: Optional[str]) -> Optional[str]:
+    """Decide how a response body of a given size should be encoded.
+
+    Bodies under ``REPLIT_INFO_COMPRESS_MIN_SIZE`` are sent as is, since
+    compression would cost more than it saves.
+
+    Args:
+        size: Uncompressed body size in bytes
+        accept_encoding: Request ``Accept-Encoding`` value
+
+    Returns:
+        Optional[str]: Encoding name, or None for identity
+    """
+    if not config.COMPRESS_ENABLED or size < config.COMPRESS_MIN_SIZE:
+        return None
+    return negotiate(accept_encoding)
+
+
+class CompressionStore:
+    """Bounded LRU store of compressed bodies keyed by content hash.
+
+    Args:
+        max_bytes: Maximum total size of stored compressed bodies
+    """
+
+    def __init__(self, max_bytes: int = config.COMPRESS_STORE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self.bytes_in = self.bytes_out = 0
+        self._entries: "OrderedDict[Tuple[bytes, str], bytes]" = (
+            OrderedDict())
+        self._lock = Lock()
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        """Return ``body`` compressed with ``encoding``, reusing copies.
+
+        Args:
+            body: Uncompressed response body
+            encoding: Name of a supported encoding
+
+        Returns:
+            bytes: Compressed body
+        """
+        key = (blake2b(body, digest_size=16).digest(), encoding)
+        with self._lock:
+            found = self._entries.get(key)
+            if found is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return found
+        with phase("compress"):
+            compressed = ENCODERS[encoding](body)
+        with self._lock:
+            self.misses += 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(compressed)
+            if key not in self._entries and len(compressed) <= self.max_bytes:
+                self._entries[key] = compressed
+                self.bytes += len(compressed)
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.bytes -= len(evicted)
+        return compressed
+
+    def stats(self) -> Dict[str, Any]:
+        """Report compression store usage.
+
+        Returns:
+            Dict[str, Any]: Stored bodies, hits, misses and the overall
+            compression ratio
+        """
+        return {
+            "encodings": sorted(ENCODERS),
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "ratio": (self.bytes_out /
+                      self.bytes_in) if self.bytes_in else 0.0,
+        }
@@ -0,0 +1,202 @@
+"""
+Conditional GET support for repl lookups.
+Responses carry a strong ETag hashed from the normalized record and a
+Last-Modified date taken from ``timeUpdated``; compressed variants get
+the encoding appended to the tag. Recently issued
+validators are remembered per lookup so a revalidation inside the
+freshness window is answered without touching the upstream.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from hashlib import blake2b
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, Hashable, Mapping, NamedTuple, Optional
+
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+import codec
+import config
+
+
+class Validators(NamedTuple):
+    """Cache validators issued for one lookup."""
+
+    etag: str
+    last_modified: Optional[datetime]
+    seen_at: float
+    size: int = 0
+
+
+def record_etag(info: Any) -> str:
+    """Hash a record into a strong entity tag.
+
+    Args:
+        info: Repl record or title
+
+    Returns:
+        str: Unquoted entity tag
+    """
+    return blake2b(codec.dumps_sorted(info), digest_size=16).hexdigest()
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """Derive the entity tag of a content-coded representation.
+
+    Args:
+        etag: Unquoted entity tag of the identity representation
+        encoding: Content coding, or None for identity
+
+    Returns:
+        str: Unquoted entity tag, suffixed with the coding if any
+    """
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def record_last_modified(info: Any) -> Optional[datetime]:
+    """Return when a repl record was last updated.
+
+    Args:
+        info: Repl record
+
+    Returns:
+        Optional[datetime]: Parsed ``timeUpdated``, or None if absent
+    """
+    if not isinstance(info, dict) or not info.get("timeUpdated"):
+        return None
+    try:
+        updated = datetime.fromisoformat(info["timeUpdated"])
+    except (TypeError, ValueError):
+        return None
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=timezone.utc)
+    # HTTP dates have second precision
+    return updated.replace(microsecond=0)
+
+
+def is_conditional(headers: Mapping[str, str]) -> bool:
+    """Whether a request carries conditional GET headers.
+
+    Args:
+        headers: Request headers
+
+    Returns:
+        bool: True if ``If-None-Match`` or ``If-Modified-Since`` is set
+    """
+    return bool(
+        headers.get("If-None-Match") or headers.get("If-Modified-Since"))
+
+
+def not_modified(headers: Mapping[str, str], etag: str,
+                 last_modified: Optional[datetime]) -> bool:
+    """Evaluate conditional GET headers against current validators.
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since``. Tags
+    of any content coding of the record match.
+
+    Args:
+        headers: Request headers
+        etag: Current unquoted entity tag of the identity representation
+        last_modified: Current modification date
+
+    Returns:
+        bool: True if the client's copy is still current
+    """
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return etags.star_tag or any(
+            tag.split("-", 1)[0] == etag for tag in etags.as_set(True))
+    if_modified_since = parse_date(headers.get("If-Modified-Since"))
+    return (if_modified_since is not None and last_modified is not None
+            and last_modified <= if_modified_since)
+
+
+def validator_headers(etag: str,
+                      last_modified: Optional[datetime]) -> Dict[str, str]:
+    """Build the ``ETag`` and ``Last-Modified`` response headers.
+
+    Args:
+        etag: Unquoted entity tag
+        last_modified: Modification date, if known
+
+    Returns:
+        Dict[str, str]: Response headers
+    """
+    headers = {"ETag": quote_etag(etag)}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+class ValidatorStore:
+    """Bounded LRU store of recently issued validators per lookup.
+
+    Args:
+        max_entries: Lookups remembered
+        freshness: Seconds a remembered validator answers revalidations
+            without a lookup
+    """
+
+    def __init__(self,
+                 max_entries: int = config.ETAG_MAX_ENTRIES,
+                 freshness: float = config.ETAG_FRESHNESS) -> None:
+        self.max_entries = max_entries
+        self.freshness = freshness
+        self.short_circuits = 0
+        self._entries: "OrderedDict[Hashable, Validators]" = OrderedDict()
+        self._lock = Lock()
+
+    def remember(self,
+                 key: Hashable,
+                 etag: str,
+                 last_modified: Optional[datetime],
+                 size: int = 0) -> None:
+        """Record the validators just issued for a lookup.
+
+        Args:
+            key: Lookup key
+            etag: Unquoted entity tag
+            last_modified: Modification date, if known
+            size: Uncompressed body size, which decides the content coding
+                of later responses
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = Validators(etag, last_modified, monotonic(),
+                                            size)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def recent(self, key: Hashable) -> Optional[Validators]:
+        """Return validators issued within the freshness window.
+
+        Args:
+            key: Lookup key
+
+        Returns:
+            Optional[Validators]: Validators, or None if unknown or old
+        """
+        with self._lock:
+            found = self._entries.get(key)
+            if found is None:
+                return None
+            if monotonic() - found.seen_at >= self.freshness:
+                return None
+            self._entries.move_to_end(key)
+            return found
+
+    def stats(self) -> Dict[str, Any]:
+        """Report validator store usage.
+
+        Returns:
+            Dict[str, Any]: Size, freshness and revalidations answered
+            without a lookup
+        """
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "freshness": self.freshness,
+            "short_circuits": self.short_circuits,
+        }
@@ -0,0 +1,198 @@
+"""
+Runtime configuration for the Replit Info API.
+Every setting is read once from the environment at import time so the
+hot path never touches ``os.environ``.
+"""
+
+from os import cpu_count, environ
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment.
+
+    Args:
+        name: Environment variable name
+        default: Value used when the variable is unset or empty
+
+    Returns:
+        int: Parsed value
+    """
+    return int(environ.get(name) or default)
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment.
+
+    Args:
+        name: Environment variable name
+        default: Value used when the variable is unset or empty
+
+    Returns:
+        float: Parsed value
+    """
+    return float(environ.get(name) or default)
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment.
+
+    Args:
+        name: Environment variable name
+        default: Value used when the variable is unset or empty
+
+    Returns:
+        bool: False for "0", "false", "no" and "off", True otherwise
+    """
+    value = environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off")
+
+
+UPSTREAM_URL = environ.get("REPLIT_INFO_UPSTREAM_URL",
+                           "https://replit.com/graphql")
+
+# Connection pool sizing for the shared upstream client
+POOL_CONNECTIONS = env_int("REPLIT_INFO_POOL_CONNECTIONS", 4)
+POOL_MAXSIZE = env_int("REPLIT_INFO_POOL_MAXSIZE", 32)
+POOL_BLOCK = env_bool("REPLIT_INFO_POOL_BLOCK", False)
+UPSTREAM_RETRIES = env_int("REPLIT_INFO_UPSTREAM_RETRIES", 2)
+UPSTREAM_BACKOFF = env_float("REPLIT_INFO_UPSTREAM_BACKOFF", 0.05)
+
+# Timeouts, request budgets and hedging
+UPSTREAM_CONNECT_TIMEOUT = env_float("REPLIT_INFO_UPSTREAM_CONNECT_TIMEOUT",
+                                     3.05)
+UPSTREAM_READ_TIMEOUT = env_float("REPLIT_INFO_UPSTREAM_READ_TIMEOUT", 10)
+REQUEST_BUDGET = env_float("REPLIT_INFO_REQUEST_BUDGET", 15)
+REQUEST_BUDGET_MAX = env_float("REPLIT_INFO_REQUEST_BUDGET_MAX", 60)
+HEDGE_ENABLED = env_bool("REPLIT_INFO_HEDGE_ENABLED", False)
+HEDGE_QUANTILE = env_float("REPLIT_INFO_HEDGE_QUANTILE", 0.95)
+HEDGE_MIN_DELAY = env_float("REPLIT_INFO_HEDGE_MIN_DELAY", 0.05)
+HEDGE_MIN_SAMPLES = env_int("REPLIT_INFO_HEDGE_MIN_SAMPLES", 20)
+HEDGE_WINDOW = env_int("REPLIT_INFO_HEDGE_WINDOW", 500)
+HEDGE_WORKERS = env_int("REPLIT_INFO_HEDGE_WORKERS", 8)
+
+# In-process response cache
+CACHE_ENABLED = env_bool("REPLIT_INFO_CACHE_ENABLED", True)
+CACHE_TTL = env_float("REPLIT_INFO_CACHE_TTL", 60)
+CACHE_STALE_TTL = env_float("REPLIT_INFO_CACHE_STALE_TTL", 300)
+CACHE_MAX_ENTRIES = env_int("REPLIT_INFO_CACHE_MAX_ENTRIES", 10_000)
+CACHE_MAX_BYTES = env_int("REPLIT_INFO_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+CACHE_REFRESH_WORKERS = env_int("REPLIT_INFO_CACHE_REFRESH_WORKERS", 2)
+
+# Batch lookups
+BATCH_CHUNK_SIZE = env_int("REPLIT_INFO_BATCH_CHUNK_SIZE", 50)
+BATCH_WORKERS = env_int("REPLIT_INFO_BATCH_WORKERS", 4)
+BATCH_MAX_IDS = env_int("REPLIT_INFO_BATCH_MAX_IDS", 1000)
+
+# Streaming NDJSON lookups
+STREAM_WINDOW = env_int("REPLIT_INFO_STREAM_WINDOW", 16)
+STREAM_WORKERS = env_int("REPLIT_INFO_STREAM_WORKERS", 16)
+STREAM_MAX_IDS = env_int("REPLIT_INFO_STREAM_MAX_IDS", 100_000)
+
+# Async (ASGI) serving mode
+ASYNC_UPSTREAM_CONCURRENCY = env_int("REPLIT_INFO_ASYNC_UPSTREAM_CONCURRENCY",
+                                     64)
+
+# Negative cache and circuit breaker
+NEGATIVE_CACHE_TTL = env_float("REPLIT_INFO_NEGATIVE_CACHE_TTL", 30)
+NEGATIVE_CACHE_MAX_ENTRIES = env_int("REPLIT_INFO_NEGATIVE_CACHE_MAX_ENTRIES",
+                                     10_000)
+BREAKER_FAILURE_THRESHOLD = env_int("REPLIT_INFO_BREAKER_FAILURE_THRESHOLD",
+                                    5)
+BREAKER_RESET_TIMEOUT = env_float("REPLIT_INFO_BREAKER_RESET_TIMEOUT", 30)
+
+# Persistent on-disk cache tier, disabled unless a path is set
+PERSIST_PATH = environ.get("REPLIT_INFO_PERSIST_PATH", "")
+PERSIST_MAX_AGE = env_float("REPLIT_INFO_PERSIST_MAX_AGE", 24 * 60 * 60)
+PERSIST_COMPACT_INTERVAL = env_float("REPLIT_INFO_PERSIST_COMPACT_INTERVAL",
+                                     600)
+PERSIST_QUEUE_SIZE = env_int("REPLIT_INFO_PERSIST_QUEUE_SIZE", 10_000)
+PERSIST_WARM_ENTRIES = env_int("REPLIT_INFO_PERSIST_WARM_ENTRIES", 1000)
+
+# Conditional GET validators
+ETAG_MAX_ENTRIES = env_int("REPLIT_INFO_ETAG_MAX_ENTRIES", 10_000)
+ETAG_FRESHNESS = env_float("REPLIT_INFO_ETAG_FRESHNESS", 10)
+
+# Response compression
+COMPRESS_ENABLED = env_bool("REPLIT_INFO_COMPRESS_ENABLED", True)
+COMPRESS_MIN_SIZE = env_int("REPLIT_INFO_COMPRESS_MIN_SIZE", 1024)
+COMPRESS_GZIP_LEVEL = env_int("REPLIT_INFO_COMPRESS_GZIP_LEVEL", 6)
+COMPRESS_BROTLI_QUALITY = env_int("REPLIT_INFO_COMPRESS_BROTLI_QUALITY", 5)
+COMPRESS_ZSTD_LEVEL = env_int("REPLIT_INFO_COMPRESS_ZSTD_LEVEL", 3)
+COMPRESS_STORE_BYTES = env_int("REPLIT_INFO_COMPRESS_STORE_BYTES",
+                               16 * 1024 * 1024)
+
+# Metrics
+METRICS_ENABLED = env_bool("REPLIT_INFO_METRICS_ENABLED", True)
+
+# Server-Timing response header
+SERVER_TIMING = env_bool("REPLIT_INFO_SERVER_TIMING", True)
+
+# Upstream record/replay
+CASSETTE_MODE = environ.get("REPLIT_INFO_CASSETTE_MODE", "").lower()
+CASSETTE_PATH = environ.get("REPLIT_INFO_CASSETTE_PATH", "upstream.cassette")
+CASSETTE_SIMULATE_LATENCY = env_bool("REPLIT_INFO_CASSETTE_SIMULATE_LATENCY",
+                                     False)
+
+# Production serving (``serve.py``)
+SERVE_SERVER = environ.get("REPLIT_INFO_SERVE_SERVER", "").lower()
+SERVE_APP = environ.get("REPLIT_INFO_SERVE_APP", "wsgi").lower()
+SERVE_HOST = environ.get("REPLIT_INFO_SERVE_HOST", "0.0.0.0")
+SERVE_PORT = env_int("REPLIT_INFO_SERVE_PORT", 8080)
+# One process per core; threads absorb upstream waits, and fewer
+# processes keep the per-process caches warmer
+SERVE_WORKERS = env_int("REPLIT_INFO_SERVE_WORKERS", cpu_count() or 1)
+SERVE_THREADS = env_int("REPLIT_INFO_SERVE_THREADS", 8)
+SERVE_PRELOAD = env_bool("REPLIT_INFO_SERVE_PRELOAD", False)
+SERVE_KEEPALIVE = env_float("REPLIT_INFO_SERVE_KEEPALIVE", 5)
+SERVE_GRACEFUL_TIMEOUT = env_float("REPLIT_INFO_SERVE_GRACEFUL_TIMEOUT", 30)
+SERVE_TIMEOUT = env_float("REPLIT_INFO_SERVE_TIMEOUT",
+                          REQUEST_BUDGET_MAX + 15)
+SERVE_PIDFILE = environ.get("REPLIT_INFO_SERVE_PIDFILE", "")
+
+# Cache shared by every worker process on the host, disabled unless a path
+# is set; a tmpfs path such as /dev/shm/replit-info.cache keeps it in RAM
+SHARED_CACHE_PATH = environ.get("REPLIT_INFO_SHARED_CACHE_PATH", "")
+SHARED_CACHE_BYTES = env_int("REPLIT_INFO_SHARED_CACHE_BYTES",
+                             64 * 1024 * 1024)
+SHARED_CACHE_SLOTS = env_int("REPLIT_INFO_SHARED_CACHE_SLOTS", 65_536)
+
+# Cache backend: memory, shared, disk (the SQLite file at PERSIST_PATH) or
+# redis; defaults to shared when a shared cache path is set
+CACHE_BACKEND = (environ.get("REPLIT_INFO_CACHE_BACKEND", "").lower()
+                 or ("shared" if SHARED_CACHE_PATH else "memory"))
+REDIS_URL = environ.get("REPLIT_INFO_REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_PREFIX = environ.get("REPLIT_INFO_REDIS_PREFIX", "replit-info:")
+REDIS_TIMEOUT = env_float("REPLIT_INFO_REDIS_TIMEOUT", 0.25)
+REDIS_MGET_CHUNK = env_int("REPLIT_INFO_REDIS_MGET_CHUNK", 100)
+
+# Background refresh of the most requested repl IDs (``hotset.py``); IDs
+# estimated to be looked up HOT_MIN_HITS times per decay interval are
+# re-fetched HOT_REFRESH_LEAD seconds before their record goes stale
+HOT_REFRESH_IDS = env_int("REPLIT_INFO_HOT_REFRESH_IDS", 256)
+HOT_MIN_HITS = env_int("REPLIT_INFO_HOT_MIN_HITS", 5)
+HOT_SKETCH_WIDTH = env_int("REPLIT_INFO_HOT_SKETCH_WIDTH", 4096)
+HOT_DECAY_INTERVAL = env_float("REPLIT_INFO_HOT_DECAY_INTERVAL", 300)
+HOT_REFRESH_LEAD = env_float("REPLIT_INFO_HOT_REFRESH_LEAD", 10)
+HOT_REFRESH_INTERVAL = env_float("REPLIT_INFO_HOT_REFRESH_INTERVAL", 1)
+HOT_REFRESH_WORKERS = env_int("REPLIT_INFO_HOT_REFRESH_WORKERS", 2)
+# Upstream requests per minute the refresher may make
+HOT_REFRESH_BUDGET = env_int("REPLIT_INFO_HOT_REFRESH_BUDGET", 60)
+
+# Change-watch subscriptions (``/watch``); a watched ID is first polled
+# every WATCH_INTERVAL seconds, then faster while it keeps changing and
+# slower while it does not
+WATCH_INTERVAL = env_float("REPLIT_INFO_WATCH_INTERVAL", 5)
+WATCH_MIN_INTERVAL = env_float("REPLIT_INFO_WATCH_MIN_INTERVAL", 1)
+WATCH_MAX_INTERVAL = env_float("REPLIT_INFO_WATCH_MAX_INTERVAL", 60)
+WATCH_MAX_IDS = env_int("REPLIT_INFO_WATCH_MAX_IDS", 100)
+WATCH_MAX_WATCHED = env_int("REPLIT_INFO_WATCH_MAX_WATCHED", 10_000)
+WATCH_QUEUE_SIZE = env_int("REPLIT_INFO_WATCH_QUEUE_SIZE", 256)
+WATCH_HEARTBEAT = env_float("REPLIT_INFO_WATCH_HEARTBEAT", 15)
+WATCH_WORKERS = env_int("REPLIT_INFO_WATCH_WORKERS", 2)
+
+# Delta responses (``/get?since=``); the last DELTA_VERSIONS versions of
+# up to DELTA_MAX_ENTRIES lookups are kept to diff clients' versions against
+DELTA_MAX_ENTRIES = env_int("REPLIT_INFO_DELTA_MAX_ENTRIES", 1024)
+DELTA_VERSIONS = env_int("REPLIT_INFO_DELTA_VERSIONS", 4)
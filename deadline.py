@@ -0,0 +1,131 @@
+"""
+Per-request deadline budgets for upstream calls.
+A request's deadline is stored in a context variable so every upstream
+call made on its behalf can clamp its connect and read timeouts to the
+time that is left.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from math import isfinite
+from time import monotonic
+from typing import Iterator, Mapping, Optional, Tuple
+
+import config
+
+BUDGET_HEADER = "X-Request-Timeout-Ms"
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's time budget runs out."""
+
+
+class Deadline:
+    """Absolute point in time by which a request must finish.
+
+    Args:
+        budget: Seconds from now until the deadline
+    """
+
+    __slots__ = ("budget", "expires_at")
+
+    def __init__(self, budget: float) -> None:
+        self.budget = budget
+        self.expires_at = monotonic() + budget
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> "Deadline":
+        """Build a deadline from a client-supplied budget header.
+
+        The header holds milliseconds and is capped by the server's
+        maximum; a missing, malformed or non-finite header uses the server
+        default.
+
+        Args:
+            headers: Incoming request headers
+
+        Returns:
+            Deadline: Deadline for the request
+        """
+        try:
+            budget = float(headers.get(BUDGET_HEADER) or "") / 1000
+        except ValueError:
+            budget = config.REQUEST_BUDGET
+        if not isfinite(budget):
+            # NaN compares false, so it would slip past the clamp below
+            budget = config.REQUEST_BUDGET
+        return cls(min(max(budget, 0.0), config.REQUEST_BUDGET_MAX))
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(self.expires_at - monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return monotonic() >= self.expires_at
+
+    def check(self) -> float:
+        """Return the remaining budget, raising once it is spent.
+
+        Returns:
+            float: Seconds left
+
+        Raises:
+            DeadlineExceeded: If the deadline has passed
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(
+                f"request budget of {self.budget:.3f}s exceeded")
+        return remaining
+
+    def timeouts(
+        self,
+        connect: float = config.UPSTREAM_CONNECT_TIMEOUT,
+        read: float = config.UPSTREAM_READ_TIMEOUT,
+    ) -> Tuple[float, float]:
+        """Clamp connect and read timeouts to the remaining budget.
+
+        Args:
+            connect: Configured connect timeout in seconds
+            read: Configured read timeout in seconds
+
+        Returns:
+            Tuple[float, float]: Connect and read timeouts
+
+        Raises:
+            DeadlineExceeded: If the deadline has passed
+        """
+        remaining = self.check()
+        return min(connect, remaining), min(read, remaining)
+
+
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "current_deadline", default=None)
+
+
+def get_deadline() -> Deadline:
+    """Return the active deadline, or a fresh server-default one.
+
+    Returns:
+        Deadline: Deadline governing the current upstream call
+    """
+    return current_deadline.get() or Deadline(config.REQUEST_BUDGET)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    """Make ``deadline`` the active deadline inside the block.
+
+    Args:
+        deadline: Deadline to activate
+
+    Yields:
+        Deadline: The active deadline
+    """
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
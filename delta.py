@@ -0,0 +1,139 @@
+"""
+Delta responses for repl lookups.
+Recent versions of each looked-up record are kept by entity tag, so a
+client holding an older version can be sent a JSON merge patch (RFC 7396)
+to the current one instead of the whole record.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+
+import codec
+import config
+
+MEDIA_TYPE = "application/merge-patch+json"
+
+
+def merge_patch(old: Any, new: Any) -> Any:
+    """Compute the JSON merge patch turning ``old`` into ``new``.
+
+    Objects are diffed key by key; anything else, lists included, is
+    replaced whole. A removed field becomes null in the patch, so a field
+    whose new value is null is indistinguishable from a removed one.
+
+    Args:
+        old: Previous version
+        new: Current version
+
+    Returns:
+        Any: Merge patch; an empty object if nothing changed
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+    patch = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            patch[key] = merge_patch(old[key], value)
+    return patch
+
+
+def parse_version(token: str) -> str:
+    """Normalize a version token to a bare entity tag.
+
+    Quoted, weak and content-coded forms of an ``ETag`` are accepted.
+
+    Args:
+        token: Version token sent by the client
+
+    Returns:
+        str: Unquoted entity tag of the identity representation
+    """
+    token = token.strip()
+    if token.startswith("W/"):
+        token = token[2:]
+    return token.strip('"').split("-", 1)[0]
+
+
+class VersionStore:
+    """Bounded LRU store of recent record versions per lookup.
+
+    Args:
+        max_entries: Lookups remembered
+        versions: Versions kept per lookup, newest first
+    """
+
+    def __init__(self,
+                 max_entries: int = config.DELTA_MAX_ENTRIES,
+                 versions: int = config.DELTA_VERSIONS) -> None:
+        self.max_entries = max_entries
+        self.versions = versions
+        self.deltas = self.unknown = self.current = self.bytes_saved = 0
+        self._entries: "OrderedDict[Hashable, OrderedDict[str, Any]]" = (
+            OrderedDict())
+        self._lock = Lock()
+
+    def update(self,
+               key: Hashable,
+               etag: str,
+               record: Any,
+               since: Optional[str] = None) -> Optional[Any]:
+        """Remember a record version and diff it against an older one.
+
+        Args:
+            key: Lookup key
+            etag: Unquoted entity tag of ``record``
+            record: Current record
+            since: Version token the client holds, if any
+
+        Returns:
+            Optional[Any]: Merge patch from ``since`` to ``record`` (empty
+            if the client is current), or None if ``since`` is not given
+            or no longer known
+        """
+        base = None
+        since = parse_version(since) if since else None
+        with self._lock:
+            versions = self._entries.pop(key, None) or OrderedDict()
+            self._entries[key] = versions
+            if since is not None:
+                base = versions.get(since)
+            versions.pop(etag, None)
+            versions[etag] = record
+            while len(versions) > self.versions:
+                versions.popitem(last=False)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if since is None:
+            return None
+        if since == etag:
+            self.current += 1
+            return {}
+        if base is None:
+            self.unknown += 1
+            return None
+        patch = merge_patch(base, record)
+        self.deltas += 1
+        self.bytes_saved += max(
+            len(codec.dumps(record)) - len(codec.dumps(patch)), 0)
+        return patch
+
+    def stats(self) -> Dict[str, Any]:
+        """Report delta response activity.
+
+        Returns:
+            Dict[str, Any]: Lookups remembered, patches served, requests
+            already current, unknown versions answered in full and body
+            bytes saved by patches
+        """
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "versions": self.versions,
+            "deltas": self.deltas,
+            "current": self.current,
+            "unknown": self.unknown,
+            "bytes_saved": self.bytes_saved,
+        }
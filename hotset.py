@@ -0,0 +1,337 @@
+"""
+Background refresh of the most requested repl records.
+Lookups are counted in a count-min sketch, and the IDs with the highest
+estimates are re-fetched shortly before their cached record goes stale,
+several per aliased GraphQL request, on a bounded pool and under an
+upstream request budget.
+"""
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from os import getpid
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import config
+from query import covered_fields
+from records import Fields, RecordCache, record_key
+
+# Fetch of several repls in one upstream request, as ``main.get_infos``
+BatchFetch = Callable[[List[str], Fields],
+                      Tuple[Dict[str, Any], Dict[str, str]]]
+# Repl ID and the fields its cached record holds
+Due = Tuple[str, Fields]
+
+
+class CountMinSketch:
+    """Approximate per-key counts in fixed memory.
+
+    Estimates never undercount; conservative updates keep overcounting
+    from hash collisions low.
+
+    Args:
+        width: Counters per row
+        depth: Rows, each indexed by its own hash
+    """
+
+    def __init__(self,
+                 width: int = config.HOT_SKETCH_WIDTH,
+                 depth: int = 4) -> None:
+        self.width = width
+        self._rows = [array("L", bytes(8 * width)) for _ in range(depth)]
+        self._lock = Lock()
+
+    def _indexes(self, key: str) -> List[int]:
+        return [
+            hash((row, key)) % self.width for row in range(len(self._rows))
+        ]
+
+    def add(self, key: str) -> int:
+        """Count one occurrence of a key.
+
+        Args:
+            key: Key to count
+
+        Returns:
+            int: Estimated count of the key, this occurrence included
+        """
+        cells = list(zip(self._rows, self._indexes(key), strict=True))
+        with self._lock:
+            count = min(row[i] for row, i in cells) + 1
+            for row, i in cells:
+                if row[i] < count:
+                    row[i] = count
+        return count
+
+    def estimate(self, key: str) -> int:
+        """Return the estimated count of a key.
+
+        Args:
+            key: Key to look up
+
+        Returns:
+            int: Estimated count
+        """
+        return min(
+            row[i]
+            for row, i in zip(self._rows, self._indexes(key), strict=True))
+
+    def decay(self) -> None:
+        """Halve every counter, so old popularity fades."""
+        with self._lock:
+            for row in self._rows:
+                for i, count in enumerate(row):
+                    if count:
+                        row[i] = count >> 1
+
+
+class HotRefresher:
+    """Keeps the cached records of the most requested repl IDs fresh.
+
+    Every lookup is counted; IDs whose estimated count reaches
+    ``min_hits`` compete for ``max_ids`` places. A background thread
+    re-fetches the records of those IDs ``lead`` seconds before they go
+    stale, grouping IDs that cover the same fields into batched requests.
+    An ID whose refresh fails is retried after a delay that doubles from
+    ``interval`` up to ``decay_interval`` while it keeps failing.
+
+    Args:
+        records: Record cache to keep fresh
+        fetch: Batched upstream fetch; one call is one upstream request
+        max_ids: Hot IDs tracked; 0 disables refreshing
+        min_hits: Estimated lookups per decay period that make an ID hot
+        lead: Seconds before an entry goes stale that it is refreshed
+        interval: Seconds between scans for entries due a refresh
+        decay_interval: Seconds between halvings of all counts
+        workers: Threads running refreshes
+        budget: Upstream requests allowed per minute
+        chunk_size: Repl IDs per request
+    """
+
+    def __init__(
+        self,
+        records: RecordCache,
+        fetch: BatchFetch,
+        max_ids: int = config.HOT_REFRESH_IDS,
+        min_hits: int = config.HOT_MIN_HITS,
+        lead: float = config.HOT_REFRESH_LEAD,
+        interval: float = config.HOT_REFRESH_INTERVAL,
+        decay_interval: float = config.HOT_DECAY_INTERVAL,
+        workers: int = config.HOT_REFRESH_WORKERS,
+        budget: int = config.HOT_REFRESH_BUDGET,
+        chunk_size: int = config.BATCH_CHUNK_SIZE,
+    ) -> None:
+        self.records = records
+        self.fetch = fetch
+        self.max_ids = max_ids
+        self.min_hits = min_hits
+        self.lead = lead
+        self.interval = interval
+        self.decay_interval = decay_interval
+        self.workers = workers
+        self.budget = budget
+        self.chunk_size = chunk_size
+        self.sketch = CountMinSketch()
+        self.hot: Dict[str, int] = {}
+        self.requests = self.refreshed = self.over_budget = self.errors = 0
+        self._pending: Set[str] = set()
+        # Repl ID -> (monotonic time of the next attempt, last delay)
+        self._backoff: Dict[str, Tuple[float, float]] = {}
+        self._tokens = float(budget)
+        self._filled_at = monotonic()
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def touch(self, replit_id: str) -> None:
+        """Count a lookup of a repl ID.
+
+        Args:
+            replit_id: Repl ID that was looked up
+        """
+        if not self.max_ids:
+            return
+        count = self.sketch.add(replit_id)
+        if count < self.min_hits:
+            return
+        with self._lock:
+            hot = self.hot
+            if replit_id in hot or len(hot) < self.max_ids:
+                hot[replit_id] = count
+            else:
+                coldest = min(hot, key=hot.__getitem__)
+                if hot[coldest] < count:
+                    del hot[coldest]
+                    hot[replit_id] = count
+        self._ensure_thread()
+
+    def _ensure_thread(self) -> None:
+        # Threads do not survive a fork, so each worker starts its own
+        if self._thread is not None and self._thread_pid == getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != getpid():
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="hot-refresh")
+                self._thread = Thread(target=self._loop,
+                                      name="hot-refresh",
+                                      daemon=True)
+                self._thread_pid = getpid()
+                self._thread.start()
+
+    def _loop(self) -> None:
+        next_decay = monotonic() + self.decay_interval
+        while True:
+            sleep(self.interval)
+            try:
+                if monotonic() >= next_decay:
+                    next_decay = monotonic() + self.decay_interval
+                    self.decay()
+                self.run_once()
+            except Exception:
+                # A failing backend must not kill the scheduler
+                self.errors += 1
+
+    def decay(self) -> None:
+        """Halve all counts and drop IDs that are no longer hot."""
+        self.sketch.decay()
+        with self._lock:
+            self.hot = {
+                replit_id: count >> 1
+                for replit_id, count in self.hot.items()
+                if count >> 1 >= self.min_hits
+            }
+            self._backoff = {
+                replit_id: backoff
+                for replit_id, backoff in self._backoff.items()
+                if replit_id in self.hot
+            }
+
+    def due(self) -> Tuple[List[Due], List[Due]]:
+        """Find hot IDs whose records go stale within ``lead`` seconds.
+
+        Returns:
+            Tuple[List[Due], List[Due]]: Due IDs, hottest first, and the
+            other hot IDs, soonest to go stale first, each with the fields
+            its record holds; IDs with no record at all are due for the
+            full record; IDs backing off after a failed refresh are left
+            out
+        """
+        now = monotonic()
+        with self._lock:
+            hot = sorted(self.hot, key=self.hot.__getitem__, reverse=True)
+            hot = [
+                replit_id for replit_id in hot
+                if replit_id not in self._pending
+                and self._backoff.get(replit_id, (now, ))[0] <= now
+            ]
+        entries = self.records.cache.get_entries(
+            record_key(replit_id) for replit_id in hot)
+        soon = now + self.lead
+        due, later = [], []
+        for replit_id in hot:
+            entry = entries.get(record_key(replit_id))
+            if entry is None:
+                due.append((replit_id, None))
+            elif entry.expires_at <= soon:
+                due.append((replit_id, covered_fields(entry.value)))
+            else:
+                later.append((entry.expires_at, replit_id,
+                              covered_fields(entry.value)))
+        later.sort(key=lambda item: item[0])
+        return due, [(replit_id, fields) for _, replit_id, fields in later]
+
+    def _take(self) -> bool:
+        # Token bucket holding at most one minute's budget
+        now = monotonic()
+        self._tokens = min(
+            self.budget,
+            self._tokens + (now - self._filled_at) * self.budget / 60)
+        self._filled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def run_once(self) -> int:
+        """Start the refreshes that are due and fit in the budget.
+
+        Spare places in the last request are filled with the hot IDs
+        closest to going stale. Each request asks for every field held by
+        any record in it, so records may come back wider than before.
+
+        Returns:
+            int: Upstream requests started
+        """
+        due, later = self.due()
+        size = self.chunk_size
+        if len(due) % size:
+            due += later[:size - len(due) % size]
+        started = 0
+        for i in range(0, len(due), size):
+            if not self._take():
+                self.over_budget += 1
+                break
+            chunk = [replit_id for replit_id, _ in due[i:i + size]]
+            held = [fields for _, fields in due[i:i + size]]
+            fields = None if None in held else tuple(
+                sorted(set().union(*held)))
+            with self._lock:
+                self._pending.update(chunk)
+            self._pool.submit(self._refresh, chunk, fields)
+            started += 1
+        return started
+
+    def _refresh(self, chunk: List[str], fields: Fields) -> None:
+        self.requests += 1
+        failed = set(chunk)
+        try:
+            data, _ = self.fetch(chunk, fields)
+            for replit_id, info in data.items():
+                if info is None:
+                    with self._lock:
+                        self.hot.pop(replit_id, None)
+                else:
+                    self.records.store(replit_id, fields, info)
+                    self.refreshed += 1
+                failed.discard(replit_id)
+        except Exception:
+            self.errors += 1
+        finally:
+            self._back_off(chunk, failed)
+
+    def _back_off(self, chunk: List[str], failed: Set[str]) -> None:
+        # IDs the upstream answered, even with nothing, are retried as
+        # usual; the rest wait twice as long as after their last failure
+        now = monotonic()
+        with self._lock:
+            self._pending.difference_update(chunk)
+            for replit_id in chunk:
+                if replit_id not in failed:
+                    self._backoff.pop(replit_id, None)
+                elif replit_id in self.hot:
+                    delay = self._backoff.get(replit_id, (now, 0.0))[1]
+                    delay = min(max(delay * 2, self.interval),
+                                self.decay_interval)
+                    self._backoff[replit_id] = (now + delay, delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report background refresh activity.
+
+        Returns:
+            Dict[str, Any]: Hot IDs tracked, upstream requests made,
+            records refreshed, IDs backing off after a failed refresh,
+            scans cut short by the budget and errors
+        """
+        return {
+            "hot_ids": len(self.hot),
+            "max_ids": self.max_ids,
+            "requests": self.requests,
+            "refreshed": self.refreshed,
+            "pending": len(self._pending),
+            "backing_off": len(self._backoff),
+            "over_budget": self.over_budget,
+            "errors": self.errors,
+        }
@@ -1,142 +1,311 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
 from os import environ
+from threading import Thread
+from time import perf_counter
 
-from flask import Flask, jsonify, render_template, request
-from requests import post
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+)
+
+import codec
+import config
+from breaker import CLOSED, CircuitBreaker, CircuitOpenError
+from cache import TTLCache, open_cache
+from coalesce import SingleFlight
+from compress import CompressionStore, select_encoding
+from conditional import (
+    ValidatorStore,
+    encoded_etag,
+    is_conditional,
+    not_modified,
+    record_etag,
+    record_last_modified,
+    validator_headers,
+)
+from deadline import Deadline, current_deadline, get_deadline
+from delta import MEDIA_TYPE as PATCH_TYPE
+from delta import VersionStore
+from hotset import HotRefresher
+from metrics import (
+    CONTENT_TYPE,
+    REGISTRY,
+    http_duration,
+    http_in_flight,
+    http_requests,
+)
+from query import (
+    UnknownFieldError,
+    build_batch_query,
+    build_query,
+    normalize_fields,
+)
+from records import RecordCache
+from timing import HEADER as TIMING_HEADER
+from timing import Timings, current_timings, phase
+from upstream import extract_batch, extract_repl, get_client
+from watch import WatchHub, WatchLimitError
 
 app = Flask(__name__)
+cache = open_cache()
+records = RecordCache(cache)
+# Short-lived record of IDs the upstream reported as missing
+negative_cache = TTLCache(ttl=config.NEGATIVE_CACHE_TTL,
+                          stale_ttl=0,
+                          max_entries=config.NEGATIVE_CACHE_MAX_ENTRIES,
+                          refresh_workers=1)
+flight = SingleFlight()
+validators = ValidatorStore()
+# Recent record versions, for merge patches against a client's version
+versions = VersionStore()
+compression = CompressionStore()
+breaker = CircuitBreaker()
+# Re-fetches the records of the most requested IDs before they go stale
+hot = HotRefresher(
+    records,
+    lambda replit_ids, fields: breaker.call(get_infos, replit_ids, fields),
+    max_ids=config.HOT_REFRESH_IDS if config.CACHE_ENABLED else 0)
+# Polls watched IDs once for all /watch subscribers
+watches = WatchHub(
+    lambda replit_ids, fields: breaker.call(get_infos, replit_ids, fields),
+    records if config.CACHE_ENABLED else None)
+batch_executor = ThreadPoolExecutor(max_workers=config.BATCH_WORKERS,
+                                    thread_name_prefix="batch")
+stream_executor = ThreadPoolExecutor(max_workers=config.STREAM_WORKERS,
+                                     thread_name_prefix="stream")
+if cache.store is not None:
+    # Warm from disk in the background so startup never blocks on it
+    Thread(target=cache.warm,
+           args=(config.PERSIST_WARM_ENTRIES, ),
+           name="cache-warm",
+           daemon=True).start()
+
+
+def get_info(replit_id, fields=None):
+    out = get_client().query({
+        "variables": {
+            "id": replit_id
+        },
+        "query": build_query(fields),
+    })
+    return extract_repl(out)
 
 
-def get_info(replit_id):
-    out = (post(
-        "https://replit.com/graphql",
-        headers={
-            "Referer": "https://replit.com",
-            "X-Requested-With": "replit",
+def get_infos(replit_ids, fields=None):
+    out = get_client().query({
+        "variables": {
+            f"id{i}": replit_id
+            for i, replit_id in enumerate(replit_ids)
         },
-        json={
-            "variables": {
-                "id": replit_id
-            },
-            "query":
-            """
-                    query Repl($id: String) {
-                            repl(id: $id) {
-                                    ... on Repl {
-                                        id
-                                        isProject
-                                        isPrivate
-                                        isStarred
-                                        title
-                                        slug
-                                        imageUrl
-                                        folderId 
-                                        isRenamed
-                                        commentCount
-                                        likeCount
-                                        currentUserDidLike
-                                        templateCategory
-                                        wasPosted
-                                        wasPublished
-                                        layoutState
-                                        language
-                                        owner: user {
-                                            id
-                                            username
-                                        }
-                                        origin {
-                                            id
-                                            title
-                                            url
-                                        }
-                                        iconUrl
-                                        templateLabel
-                                        url
-                                        multiplayerInvites {
-                                            email
-                                            replId
-                                            type
-                                        }
-                                        rootOriginReplUrl
-                                        timeCreated
-                                        timeUpdated
-                                        isOwner
-                                        config {
-                                            isServer
-                                            gitRemoteUrl
-                                            domain
-                                            isVnc
-                                            doClone
-                                        }
-                                        pinnedToProfile                          
-                                        hostedUrl
-                                        hostedUrlDotty: hostedUrl(dotty: true)
-                                        hostedUrlDev: hostedUrl(dev: true)
-                                        hostedUrlNoCustom: hostedUrl(noCustomDomain: true)
-                                        currentUserPermissions {
-                                            changeTitle
-                                            changeDescription
-                                            changeImageUrl
-                                            changeIconUrl
-                                            changeTemplateLabel
-                                            changeLanguage
-                                            changeConfig
-                                            changePrivacy
-                                            star
-                                            move
-                                            delete
-                                            leaveMultiplayer
-                                            editMultiplayers
-                                            viewHistory
-                                            containerAttach
-                                            containerWrite
-                                            changeAlwaysOn
-                                            linkDomain
-                                            changeCommentSettings
-                                            inviteGuests
-                                            publish
-                                            fork
-                                        }                   
-                                        isProjectFork
-                                        isModelSolution
-                                        isModelSolutionFork
-                                        workspaceCta                        
-                                        publicForkCount
-                                        runCount
-                                        isAlwaysOn
-                                        isBoosted
-                                        tags {
-                                            id
-                                            isOfficial
-                                        }
-                                        lastPublishedAt
-                                        multiplayers {
-                                            username
-                                        }
-                                        nixedLanguage
-                                        publishedAs             
-                                        description(plainText: true)
-                                        markdownDescription: description(plainText: false)
-                                        templateInfo {
-                                            label
-                                            iconUrl
-                                        }
-                                        domains {
-                                            domain
-                                            state
-                                        }
-                                        replViewSettings {
-                                            id
-                                            defaultView
-                                            replFile
-                                            replImage
-                                        }
-                                    }
-                            }
-                    }
-                """,
+        "query": build_batch_query(len(replit_ids), fields),
+    })
+    return extract_batch(out, replit_ids)
+
+
+def lookup_many(replit_ids, fields=None):
+    replit_ids = list(dict.fromkeys(replit_ids))
+    if config.CACHE_ENABLED:
+        data, fetches, partial = records.get_many(replit_ids, fields)
+    else:
+        data, fetches, partial = {}, {fields: replit_ids}, {}
+    data.update(dict.fromkeys(negative_cache.get_many(
+        replit_id for replit_id in replit_ids if replit_id not in data)))
+    for replit_id in replit_ids:
+        # IDs known not to exist do not count towards popularity
+        if replit_id not in data or data[replit_id] is not None:
+            hot.touch(replit_id)
+    # IDs are fetched per missing field set, in chunks of BATCH_CHUNK_SIZE
+    size = config.BATCH_CHUNK_SIZE
+    chunks = []
+    for wanted, ids in fetches.items():
+        ids = [replit_id for replit_id in ids if replit_id not in data]
+        chunks.extend(
+            (wanted, ids[i:i + size]) for i in range(0, len(ids), size))
+    futures = [(chunk,
+                batch_executor.submit(copy_context().run, breaker.call,
+                                      get_infos, chunk, wanted))
+               for wanted, chunk in chunks]
+    errors = {}
+    for chunk, future in futures:
+        try:
+            chunk_data, chunk_errors = future.result()
+        except Exception as e:
+            errors.update(dict.fromkeys(chunk, str(e)))
+            continue
+        errors.update(chunk_errors)
+        for replit_id, info in chunk_data.items():
+            if info is None:
+                negative_cache.set(replit_id, True)
+            elif config.CACHE_ENABLED:
+                info = records.store(replit_id, fields, info,
+                                     partial.get(replit_id))
+            data[replit_id] = info
+    return {
+        "data": {
+            replit_id: data[replit_id]
+            for replit_id in replit_ids if replit_id in data
         },
-    ).json())
-    return ((out.get("data", out) or out).get("repl", out)) if out else None
+        "errors": errors,
+    }
+
+
+def lookup(replit_id, fields=None):
+    if negative_cache.get_many([replit_id]):
+        return None
+    hot.touch(replit_id)
+
+    def load(wanted):
+        info = flight.do((replit_id, wanted),
+                         lambda: breaker.call(get_info, replit_id, wanted),
+                         get_deadline().remaining())
+        if info is None:
+            negative_cache.set(replit_id, True)
+        return info
+
+    if not config.CACHE_ENABLED:
+        return load(fields)
+    return records.get_or_load(replit_id, fields, load)
+
+
+def stream_lookups(replit_ids, fields=None, title=False):
+    # At most STREAM_WINDOW lookups are in flight; the next one is only
+    # submitted once the client has consumed a finished line.
+    replit_ids = iter(replit_ids)
+    pending = {}
+
+    def submit():
+        for replit_id in replit_ids:
+            future = stream_executor.submit(copy_context().run, lookup,
+                                            replit_id, fields)
+            pending[future] = replit_id
+            return
+
+    for _ in range(config.STREAM_WINDOW):
+        submit()
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                replit_id = pending.pop(future)
+                try:
+                    info = future.result()
+                    if isinstance(info, dict) and title:
+                        info = info.get("title", "")
+                    line = {"id": replit_id, "data": info}
+                except Exception as e:
+                    line = {"id": replit_id, "error": str(e)}
+                yield codec.dumps(line) + b"\n"
+                submit()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def json_response(value, status=200):
+    with phase('encode'):
+        body = codec.dumps(value)
+    return Response(body, status=status, mimetype='application/json')
+
+
+def encode_response(response, encoding):
+    if encoding is not None:
+        response.set_data(compression.compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+    if config.COMPRESS_ENABLED:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.before_request
+def start_deadline():
+    g.deadline_token = current_deadline.set(
+        Deadline.from_headers(request.headers))
+    if config.SERVER_TIMING and request.endpoint == 'repl_info':
+        g.timings_token = current_timings.set(Timings())
+
+
+@app.after_request
+def add_server_timing(response):
+    timings = current_timings.get()
+    if timings is not None:
+        response.headers[TIMING_HEADER] = timings.header()
+    return response
+
+
+@app.teardown_request
+def end_deadline(_exc):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        current_deadline.reset(token)
+    token = g.pop('timings_token', None)
+    if token is not None:
+        current_timings.reset(token)
+
+
+def route_label():
+    # Unmatched paths share one label to keep cardinality bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@app.before_request
+def start_timer():
+    if config.METRICS_ENABLED:
+        g.started_at = perf_counter()
+        http_in_flight.inc(route_label())
+
+
+@app.after_request
+def record_request(response):
+    started_at = g.pop('started_at', None)
+    if started_at is not None:
+        route = route_label()
+        http_in_flight.dec(route)
+        http_requests.inc(route, request.method, str(response.status_code))
+        http_duration.observe(perf_counter() - started_at, route)
+    return response
+
+
+@REGISTRY.collector
+def component_metrics():
+    upstream = get_client().stats()
+    cached = cache.stats()
+    return [
+        ("replit_info_upstream_timeouts_total", "counter",
+         "Upstream calls that timed out", upstream["timeouts"]),
+        ("replit_info_upstream_hedges_total", "counter",
+         "Hedged upstream attempts sent", upstream["hedges"]),
+        ("replit_info_upstream_hedge_wins_total", "counter",
+         "Hedged attempts that answered first", upstream["hedge_wins"]),
+        ("replit_info_upstream_connections_opened_total", "counter",
+         "Upstream connections opened", upstream["connections_opened"]),
+        ("replit_info_upstream_idle_connections", "gauge",
+         "Idle pooled upstream connections", upstream["idle_connections"]),
+        ("replit_info_cache_hits_total", "counter", "Fresh cache hits",
+         cached["hits"]),
+        ("replit_info_cache_stale_hits_total", "counter",
+         "Stale cache hits served while refreshing", cached["stale_hits"]),
+        ("replit_info_cache_misses_total", "counter", "Cache misses",
+         cached["misses"]),
+        ("replit_info_cache_subsumed_hits_total", "counter",
+         "Cache hits answered from a record holding more fields",
+         records.subsumed_hits),
+        ("replit_info_hot_refreshes_total", "counter",
+         "Hot records refreshed in the background", hot.refreshed),
+        ("replit_info_cache_entries", "gauge", "Cached lookups",
+         cached["entries"]),
+        ("replit_info_coalesced_total", "counter",
+         "Lookups that joined an in-flight upstream call",
+         flight.stats()["coalesced"]),
+        ("replit_info_breaker_open", "gauge",
+         "Whether the upstream circuit breaker is rejecting calls",
+         int(breaker.stats()["state"] != CLOSED)),
+    ]
 
 
 @app.route('/')
@@ -144,21 +313,218 @@ def index():
     return render_template('index.html')
 
 
+def batch_response(replit_ids, fields, title=False):
+    if len(replit_ids) > config.BATCH_MAX_IDS:
+        return jsonify({
+            "error": f"at most {config.BATCH_MAX_IDS} replit_ids per batch"
+        }), 400
+    result = lookup_many(replit_ids, fields)
+    if title:
+        result["data"] = {
+            replit_id: info.get("title", "") if info else info
+            for replit_id, info in result["data"].items()
+        }
+    response = json_response(result)
+    return encode_response(
+        response,
+        select_encoding(response.content_length,
+                        request.headers.get('Accept-Encoding')))
+
+
 @app.route('/get')
 def repl_info():
-    replit_id = request.args.get('replit_id') or environ.get('REPL_ID')
+    with phase('parse'):
+        replit_id = request.args.get('replit_id') or environ.get('REPL_ID')
+
+        if not replit_id:
+            return jsonify({'error': 'replit_id is required'}), 400
+
+        title = request.args.get('title') is not None
+        try:
+            fields = normalize_fields(('title', ) if title else (
+                request.args.getlist('fields') or None))
+        except UnknownFieldError as e:
+            return jsonify({"error": str(e)}), 400
+
+    if ',' in replit_id:
+        replit_ids = [i.strip() for i in replit_id.split(',') if i.strip()]
+        if not replit_ids:
+            return jsonify({'error': 'replit_id is required'}), 400
+        return batch_response(replit_ids, fields, title)
 
-    if not replit_id:
-        return jsonify({'error': 'replit_id is required'}), 400
+    key = (replit_id, fields)
+    accept_encoding = request.headers.get('Accept-Encoding')
+    if is_conditional(request.headers):
+        seen = validators.recent(key)
+        if seen and not_modified(request.headers, seen.etag,
+                                 seen.last_modified):
+            validators.short_circuits += 1
+            etag = encoded_etag(seen.etag,
+                                select_encoding(seen.size, accept_encoding))
+            return encode_response(
+                Response(status=304,
+                         headers=validator_headers(etag, seen.last_modified)),
+                None)
 
     try:
-        info = get_info(replit_id)
-        if isinstance(info, dict) and request.args.get('title') is not None:
+        info = lookup(replit_id, fields)
+        if info is None:
+            return json_response(info)
+        last_modified = record_last_modified(info)
+        if isinstance(info, dict) and title:
             info = info.get("title", "")
-        return info if isinstance(info, str) else jsonify(info)
+        etag = record_etag(info)
+        patch = None if title else versions.update(
+            key, etag, info, request.args.get('since'))
+        response = make_response(
+            info if isinstance(info, str) else json_response(info))
+        validators.remember(key, etag, last_modified, response.content_length)
+        encoding = select_encoding(response.content_length, accept_encoding)
+        headers = validator_headers(encoded_etag(etag, encoding),
+                                    last_modified)
+        if not_modified(request.headers, etag, last_modified):
+            return encode_response(Response(status=304, headers=headers),
+                                   None)
+        if patch is not None:
+            response = Response(codec.dumps(patch), mimetype=PATCH_TYPE)
+            encoding = select_encoding(response.content_length,
+                                       accept_encoding)
+            response.headers.update(
+                validator_headers(encoded_etag(etag, encoding),
+                                  last_modified))
+            return encode_response(response, encoding)
+        response.headers.update(headers)
+        return encode_response(response, encoding)
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e)}), 503, {
+            "Retry-After": str(int(e.retry_after) + 1)
+        }
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/batch', methods=['POST'])
+def repl_batch():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'body must be a JSON object'}), 400
+    replit_ids = body.get('ids') or body.get('replit_ids')
+    if not isinstance(replit_ids, list) or not all(
+            isinstance(i, str) for i in replit_ids):
+        return jsonify({'error': 'ids must be a list of strings'}), 400
+
+    fields = body.get('fields')
+    try:
+        fields = normalize_fields([fields] if isinstance(fields, str) else (
+            fields or None))
+    except UnknownFieldError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return batch_response(replit_ids, fields)
+
+
+@app.route('/stream', methods=['GET', 'POST'])
+def repl_stream():
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({'error': 'body must be a JSON object'}), 400
+        replit_ids = body.get('ids') or body.get('replit_ids')
+        fields = body.get('fields')
+        title = bool(body.get('title'))
+    else:
+        replit_ids = [
+            i.strip() for i in request.args.get('replit_id', '').split(',')
+            if i.strip()
+        ]
+        fields = request.args.getlist('fields') or None
+        title = request.args.get('title') is not None
+    if not replit_ids or not isinstance(replit_ids, list) or not all(
+            isinstance(i, str) for i in replit_ids):
+        return jsonify({'error': 'ids must be a list of strings'}), 400
+    if len(replit_ids) > config.STREAM_MAX_IDS:
+        return jsonify({
+            "error": f"at most {config.STREAM_MAX_IDS} replit_ids per stream"
+        }), 400
+
+    try:
+        fields = normalize_fields(('title', ) if title else (
+            [fields] if isinstance(fields, str) else fields or None))
+    except UnknownFieldError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return Response(stream_lookups(replit_ids, fields, title),
+                    mimetype='application/x-ndjson')
+
+
+@app.route('/watch')
+def repl_watch():
+    replit_ids = [
+        i.strip() for i in request.args.get('replit_id', '').split(',')
+        if i.strip()
+    ]
+    if not replit_ids:
+        return jsonify({"error": "replit_id is required"}), 400
+    if len(replit_ids) > config.WATCH_MAX_IDS:
+        return jsonify({
+            "error": f"at most {config.WATCH_MAX_IDS} replit_ids per watch"
+        }), 400
+    try:
+        fields = normalize_fields(request.args.getlist('fields') or None)
+    except UnknownFieldError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        subscription = watches.subscribe(replit_ids, fields)
+    except WatchLimitError as e:
+        return jsonify({"error": str(e)}), 503
+    return Response(watches.events(subscription),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        "upstream": get_client().stats(),
+        "cache": cache.stats(),
+        "records": records.stats(),
+        "hot_refresh": hot.stats(),
+        "watch": watches.stats(),
+        "persist": cache.store.stats() if cache.store else None,
+        "coalescing": flight.stats(),
+        "negative_cache": negative_cache.stats(),
+        "breaker": breaker.stats(),
+        "validators": validators.stats(),
+        "deltas": versions.stats(),
+        "compression": compression.stats(),
+    })
+
+
+@app.route('/metrics')
+def metrics():
+    if not config.METRICS_ENABLED:
+        return jsonify({"error": "metrics are disabled"}), 404
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    from importlib.util import find_spec
+    from sys import stderr
+
+    from serve import SERVERS
+    from serve import main as serve
+
+    if any(find_spec(server) is not None for server in SERVERS):
+        serve()
+    else:
+        # Keep the documented entry point working without the serve extra
+        print('main.py: no production server installed (pip install -e '
+              '".[serve]"); using the Flask development server',
+              file=stderr)
+        app.run(host=config.SERVE_HOST, port=config.SERVE_PORT)
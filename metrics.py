@@ -0,0 +1,325 @@
+"""
+Prometheus-style metrics for the Replit Info API.
+Counters, gauges and histograms record into per-thread shards, so the
+hot path never takes a lock; shards are merged when ``/metrics`` is
+scraped and rendered in the Prometheus text exposition format.
+"""
+
+from bisect import bisect_left
+from threading import Lock, Thread, current_thread, local
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans cache hits through slow upstream calls
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+                   2.5, 5, 10)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, str, str, float]
+
+
+def escape(value: str) -> str:
+    """Escape a label value for the text exposition format.
+
+    Args:
+        value: Raw label value
+
+    Returns:
+        str: Escaped label value
+    """
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Render a label set.
+
+    Args:
+        names: Label names
+        values: Label values, in the same order
+
+    Returns:
+        str: ``{name="value",...}``, or an empty string without labels
+    """
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(str(value))}"'
+                     for name, value in zip(names, values, strict=True))
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    """Render a sample value.
+
+    Args:
+        value: Sample value
+
+    Returns:
+        str: Integral values without a fraction, others as floats
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    """Base class for metrics recorded into per-thread shards.
+
+    Each thread writes only to its own shard, so recording needs no lock.
+    Shards of finished threads are folded into a retired total when the
+    metric is collected.
+
+    Args:
+        name: Metric name
+        documentation: Help text
+        labels: Label names
+        registry: Registry to register with, or None
+    """
+
+    kind = "untyped"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labels: Sequence[str] = (),
+                 registry: Optional["Registry"] = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._local = local()
+        self._shards: List[Tuple[Thread, Dict[Labels, Any]]] = []
+        self._retired: Dict[Labels, Any] = {}
+        self._lock = Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _shard(self) -> Dict[Labels, Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: Dict[Labels, Any] = {}
+            with self._lock:
+                self._shards.append((current_thread(), shard))
+            self._local.shard = shard
+            return shard
+
+    def _merge(self, total: Dict[Labels, Any], shard: Dict[Labels,
+                                                           Any]) -> None:
+        for key, value in shard.items():
+            total[key] = total.get(key, 0) + value
+
+    def merged(self) -> Dict[Labels, Any]:
+        """Merge every thread's shard.
+
+        Returns:
+            Dict[Labels, Any]: Totals per label set
+        """
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard.copy())
+            self._shards = live
+            total: Dict[Labels, Any] = {}
+            self._merge(total, self._retired)
+            for _, shard in live:
+                # dict.copy is atomic under the GIL
+                self._merge(total, shard.copy())
+        return total
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """Yield the current samples.
+
+        Yields:
+            Tuple[str, str, float]: Sample name, rendered labels and value
+        """
+        for key, value in sorted(self.merged().items()):
+            yield self.name, format_labels(self.labels, key), value
+
+
+class Counter(Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Increase the count.
+
+        Args:
+            *labels: Label values, in declaration order
+            amount: Increment
+        """
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    """Value that goes up and down, such as requests in flight."""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        """Decrease the value.
+
+        Args:
+            *labels: Label values, in declaration order
+            amount: Decrement
+        """
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets.
+
+    Args:
+        name: Metric name
+        documentation: Help text
+        labels: Label names
+        registry: Registry to register with, or None
+        buckets: Upper bounds of the buckets, ascending
+    """
+
+    kind = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labels: Sequence[str] = (),
+                 registry: Optional["Registry"] = None,
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record one observation.
+
+        Args:
+            value: Observed value
+            *labels: Label values, in declaration order
+        """
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _merge(self, total: Dict[Labels, Any], shard: Dict[Labels,
+                                                           Any]) -> None:
+        for key, counts in shard.items():
+            merged = total.setdefault(key, [0] * len(counts))
+            for i, count in enumerate(list(counts)):
+                merged[i] += count
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """Yield cumulative bucket, sum and count samples.
+
+        Yields:
+            Tuple[str, str, float]: Sample name, rendered labels and value
+        """
+        names = self.labels + ("le", )
+        for key, counts in sorted(self.merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"), ),
+                                    counts[:-1],
+                                    strict=True):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       format_labels(names, key + (format_value(bound), )),
+                       cumulative)
+            labels = format_labels(self.labels, key)
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """Set of metrics and collectors rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def register(self, metric: Metric) -> None:
+        """Add a metric.
+
+        Args:
+            metric: Metric to render on scrape
+        """
+        self._metrics.append(metric)
+
+    def collector(
+        self, fn: Callable[[], Iterable[Sample]]
+    ) -> Callable[[], Iterable[Sample]]:
+        """Add a function producing samples at scrape time.
+
+        Used to export counters that already live elsewhere, such as
+        component ``stats()``. Usable as a decorator.
+
+        Args:
+            fn: Returns ``(name, kind, help, value)`` tuples
+
+        Returns:
+            Callable[[], Iterable[Sample]]: ``fn`` unchanged
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        """Render every metric in the text exposition format.
+
+        Returns:
+            str: Exposition document
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {format_value(value)}"
+                         for name, labels, value in metric.samples())
+        for fn in self._collectors:
+            for name, kind, documentation, value in fn():
+                if value is None:
+                    continue
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = Counter("replit_info_http_requests_total",
+                        "HTTP requests handled",
+                        ("route", "method", "status"), REGISTRY)
+http_duration = Histogram("replit_info_http_request_duration_seconds",
+                          "Time spent handling HTTP requests", ("route", ),
+                          REGISTRY)
+http_in_flight = Gauge("replit_info_http_requests_in_flight",
+                       "HTTP requests being handled", ("route", ), REGISTRY)
+upstream_connect = Histogram("replit_info_upstream_connect_seconds",
+                             "Time to open an upstream connection", (),
+                             REGISTRY)
+upstream_ttfb = Histogram(
+    "replit_info_upstream_ttfb_seconds",
+    "Time from sending an upstream request to its response headers, "
+    "excluding connecting", (), REGISTRY)
+upstream_decode = Histogram("replit_info_upstream_decode_seconds",
+                            "Time to decode an upstream body", (), REGISTRY)
+upstream_errors = Counter("replit_info_upstream_errors_total",
+                          "Failed upstream calls by exception class",
+                          ("error", ), REGISTRY)
+upstream_in_flight = Gauge("replit_info_upstream_requests_in_flight",
+                           "Upstream calls waiting for an answer", (),
+                           REGISTRY)
@@ -0,0 +1,381 @@
+"""
+Persistent on-disk tier for the repl lookup cache.
+Records are kept in a local SQLite file with the time they were
+fetched, read lazily on an in-memory miss and written by a background
+thread so disk I/O never sits on the request path. ``DiskCache`` uses the
+same file as the cache backend itself.
+"""
+
+from os import getpid
+from queue import Empty, Full, Queue
+from sqlite3 import Connection, connect
+from threading import Lock, Thread, local
+from time import monotonic, time
+from typing import Any, Dict, Hashable, Iterator, Optional, Tuple
+
+import codec
+import config
+from cache import Entry, TTLCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repls (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+def encode_key(key: Hashable) -> str:
+    """Serialize a cache key for storage.
+
+    Args:
+        key: ``(replit_id, fields)`` cache key
+
+    Returns:
+        str: Stable text form of the key
+    """
+    return codec.dumps(key).decode()
+
+
+def decode_key(text: str) -> Hashable:
+    """Rebuild a cache key from its stored form.
+
+    Args:
+        text: Output of ``encode_key``
+
+    Returns:
+        Hashable: ``(replit_id, fields)`` cache key
+    """
+    replit_id, fields = codec.loads(text)
+    return replit_id, tuple(fields) if fields is not None else None
+
+
+class PersistentStore:
+    """SQLite-backed record store with asynchronous writes.
+
+    Args:
+        path: SQLite database file
+        max_age: Seconds after which records are dropped by compaction
+        compact_interval: Seconds between compactions
+        queue_size: Pending writes kept before new ones are dropped
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_age: float = config.PERSIST_MAX_AGE,
+        compact_interval: float = config.PERSIST_COMPACT_INTERVAL,
+        queue_size: int = config.PERSIST_QUEUE_SIZE,
+    ) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.compact_interval = compact_interval
+        self.reads = self.read_hits = 0
+        self.writes = self.dropped = self.compactions = self.errors = 0
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._local = local()
+        self._writer: Optional[Thread] = None
+        self._writer_pid: Optional[int] = None
+        self._lock = Lock()
+
+    def _connection(self) -> Connection:
+        # One connection per thread; WAL lets readers run beside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != getpid():
+            conn = connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            self._local.conn, self._local.pid = conn, getpid()
+        return conn
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Read a record from disk.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Optional[Tuple[Any, float]]: The value and its age in
+            seconds, or None if absent or too old
+        """
+        self.reads += 1
+        row = self._connection().execute(
+            "SELECT value, fetched_at FROM repls WHERE key = ?",
+            (encode_key(key), ),
+        ).fetchone()
+        if row is None:
+            return None
+        age = time() - row[1]
+        if age >= self.max_age:
+            return None
+        self.read_hits += 1
+        return codec.loads_document(row[0]), age
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Queue a record to be written by the background writer.
+
+        Args:
+            key: Cache key
+            value: JSON-serializable record
+        """
+        self.start_writer()
+        try:
+            self._queue.put_nowait(
+                (encode_key(key), codec.dumps(value), time()))
+        except Full:
+            self.dropped += 1
+
+    def write(self, key: Hashable, value: Any, age: float = 0.0) -> None:
+        """Write a record synchronously.
+
+        Args:
+            key: Cache key
+            value: JSON-serializable record
+            age: Seconds since the record was fetched
+        """
+        self._connection().execute(
+            "INSERT OR REPLACE INTO repls VALUES (?, ?, ?)",
+            (encode_key(key), codec.dumps(value), time() - age))
+        self.writes += 1
+
+    def recent(self, limit: int) -> Iterator[Tuple[Hashable, Any, float]]:
+        """Yield the most recently fetched records.
+
+        Args:
+            limit: Maximum number of records
+
+        Yields:
+            Tuple[Hashable, Any, float]: Key, value and age in seconds
+        """
+        rows = self._connection().execute(
+            "SELECT key, value, fetched_at FROM repls WHERE fetched_at > ? "
+            "ORDER BY fetched_at DESC LIMIT ?",
+            (time() - self.max_age, limit),
+        )
+        now = time()
+        for key, value, fetched_at in rows:
+            yield (decode_key(key), codec.loads_document(value),
+                   now - fetched_at)
+
+    def usage(self, since: float) -> Tuple[int, int]:
+        """Count the records fetched after a point in time.
+
+        Args:
+            since: Wall-clock time, as from ``time.time``
+
+        Returns:
+            Tuple[int, int]: Number of records and their encoded size in
+            bytes
+        """
+        return self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM repls "
+            "WHERE fetched_at > ?", (since, )).fetchone()
+
+    def clear(self) -> None:
+        """Delete every record, for every process using the file."""
+        self._connection().execute("DELETE FROM repls")
+
+    def start_writer(self) -> None:
+        """Start the background writer of this process, if not running.
+
+        The writer applies queued ``put`` calls and compacts the file
+        every ``compact_interval`` seconds.
+        """
+        if self._writer is not None and self._writer_pid == getpid():
+            return
+        with self._lock:
+            if self._writer is None or self._writer_pid != getpid():
+                self._writer = Thread(target=self._write_loop,
+                                      name="persist-writer",
+                                      daemon=True)
+                self._writer_pid = getpid()
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        conn = self._connection()
+        next_compaction = monotonic() + self.compact_interval
+        while True:
+            try:
+                batch = [
+                    self._queue.get(
+                        timeout=max(next_compaction - monotonic(), 0.01))
+                ]
+            except Empty:
+                batch = []
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                if batch:
+                    with conn:
+                        conn.execute("BEGIN")
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO repls VALUES (?, ?, ?)",
+                            batch)
+                    self.writes += len(batch)
+                if monotonic() >= next_compaction:
+                    next_compaction = monotonic() + self.compact_interval
+                    self.compact()
+            except Exception:
+                # A locked or full disk must not kill the writer
+                self.errors += 1
+
+    def compact(self) -> int:
+        """Drop expired records and reclaim their space.
+
+        Returns:
+            int: Number of records removed
+        """
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM repls WHERE fetched_at < ?",
+                               (time() - self.max_age, )).rowcount
+        if removed:
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.compactions += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Report disk tier activity.
+
+        Returns:
+            Dict[str, Any]: Reads, hits, writes, dropped writes, pending
+            writes and compactions
+        """
+        return {
+            "path": self.path,
+            "reads": self.reads,
+            "read_hits": self.read_hits,
+            "writes": self.writes,
+            "pending_writes": self._queue.qsize(),
+            "dropped_writes": self.dropped,
+            "compactions": self.compactions,
+            "errors": self.errors,
+        }
+
+
+class DiskCache(TTLCache):
+    """``TTLCache`` kept in a ``PersistentStore`` instead of in memory.
+
+    Every process using the file, and every restart, sees the same
+    entries. Entries age from when they were fetched. Reads and writes go
+    to SQLite synchronously; the store's writer thread, started by the
+    first write in each process, only compacts away entries past the
+    stale window every ``compact_interval`` seconds.
+
+    Args:
+        disk: Store holding the entries; its ``max_age`` is capped at
+            ``ttl + stale_ttl``
+        ttl: Seconds an entry is served as fresh
+        stale_ttl: Extra seconds an expired entry may be served while it
+            is refreshed in the background
+        refresh_workers: Threads used for background refreshes
+    """
+
+    backend = "disk"
+    blocking = True
+
+    def __init__(
+        self,
+        disk: PersistentStore,
+        ttl: float = config.CACHE_TTL,
+        stale_ttl: float = config.CACHE_STALE_TTL,
+        refresh_workers: int = config.CACHE_REFRESH_WORKERS,
+    ) -> None:
+        super().__init__(ttl=ttl,
+                         stale_ttl=stale_ttl,
+                         refresh_workers=refresh_workers)
+        self.disk = disk
+        # Entries past the stale window are never served again
+        disk.max_age = min(disk.max_age, ttl + stale_ttl)
+
+    def get(self, key: Hashable, stale: bool = False) -> Optional[Entry]:
+        """Look up an entry without loading it.
+
+        Args:
+            key: Cache key
+            stale: Also return expired entries still inside the stale
+                window
+
+        Returns:
+            Optional[Entry]: The entry, or None on a miss
+        """
+        found = self.disk.get(key)
+        if found is None:
+            return None
+        value, age = found
+        if age >= self.ttl + self.stale_ttl:
+            self.expirations += 1
+            return None
+        if age >= self.ttl and not stale:
+            return None
+        return Entry(value, monotonic() + self.ttl - age,
+                     len(codec.dumps(value)))
+
+    def set(self,
+            key: Hashable,
+            value: Any,
+            ttl: Optional[float] = None,
+            persist: bool = True) -> Optional[Entry]:
+        """Write a value to disk.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Override of the default TTL in seconds; may be negative
+                for values that are already stale
+            persist: Write the value; False for values already on disk
+
+        Returns:
+            Optional[Entry]: The stored entry
+        """
+        ttl = self.ttl if ttl is None else ttl
+        data = codec.dumps(value)
+        value = codec.document(value, data)
+        if persist:
+            self.disk.start_writer()
+            self.disk.write(key, value, age=self.ttl - ttl)
+        return Entry(value, monotonic() + ttl, len(data))
+
+    def _usage(self) -> Tuple[int, int]:
+        return self.disk.usage(time() - self.ttl - self.stale_ttl)
+
+    def clear(self) -> None:
+        """Drop every entry, for all processes."""
+        self.disk.clear()
+
+    def __len__(self) -> int:
+        return self._usage()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache effectiveness counters.
+
+        Returns:
+            Dict[str, Any]: Entries and bytes on disk, this process's
+            hit/miss counts and hit ratio, and the store's activity
+        """
+        entries, size = self._usage()
+        return {
+            **super().stats(),
+            "entries": entries,
+            "bytes": size,
+            "max_entries": None,
+            "max_bytes": None,
+            "store": self.disk.stats(),
+        }
+
+
+def open_store() -> Optional[PersistentStore]:
+    """Create the configured persistent store, if one is enabled.
+
+    Returns:
+        Optional[PersistentStore]: Store at ``REPLIT_INFO_PERSIST_PATH``,
+        or None when persistence is off
+    """
+    if not config.PERSIST_PATH:
+        return None
+    return PersistentStore(config.PERSIST_PATH)
@@ -0,0 +1,484 @@
+"""
+GraphQL document construction for ``Repl`` lookups.
+The full selection set is parsed once into a field tree so lookups can
+request only the paths a client asked for; generated documents are
+cached per field set, as are the projectors that cut a stored record
+down to a field set.
+"""
+
+from copy import deepcopy
+from functools import lru_cache
+from re import findall
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+REPL_SELECTION = """
+    id
+    isProject
+    isPrivate
+    isStarred
+    title
+    slug
+    imageUrl
+    folderId
+    isRenamed
+    commentCount
+    likeCount
+    currentUserDidLike
+    templateCategory
+    wasPosted
+    wasPublished
+    layoutState
+    language
+    owner: user {
+        id
+        username
+    }
+    origin {
+        id
+        title
+        url
+    }
+    iconUrl
+    templateLabel
+    url
+    multiplayerInvites {
+        email
+        replId
+        type
+    }
+    rootOriginReplUrl
+    timeCreated
+    timeUpdated
+    isOwner
+    config {
+        isServer
+        gitRemoteUrl
+        domain
+        isVnc
+        doClone
+    }
+    pinnedToProfile
+    hostedUrl
+    hostedUrlDotty: hostedUrl(dotty: true)
+    hostedUrlDev: hostedUrl(dev: true)
+    hostedUrlNoCustom: hostedUrl(noCustomDomain: true)
+    currentUserPermissions {
+        changeTitle
+        changeDescription
+        changeImageUrl
+        changeIconUrl
+        changeTemplateLabel
+        changeLanguage
+        changeConfig
+        changePrivacy
+        star
+        move
+        delete
+        leaveMultiplayer
+        editMultiplayers
+        viewHistory
+        containerAttach
+        containerWrite
+        changeAlwaysOn
+        linkDomain
+        changeCommentSettings
+        inviteGuests
+        publish
+        fork
+    }
+    isProjectFork
+    isModelSolution
+    isModelSolutionFork
+    workspaceCta
+    publicForkCount
+    runCount
+    isAlwaysOn
+    isBoosted
+    tags {
+        id
+        isOfficial
+    }
+    lastPublishedAt
+    multiplayers {
+        username
+    }
+    nixedLanguage
+    publishedAs
+    description(plainText: true)
+    markdownDescription: description(plainText: false)
+    templateInfo {
+        label
+        iconUrl
+    }
+    domains {
+        domain
+        state
+    }
+    replViewSettings {
+        id
+        defaultView
+        replFile
+        replImage
+    }
+"""
+
+# key -> (GraphQL field expression, child selection or None)
+FieldTree = Dict[str, Tuple[str, Optional["FieldTree"]]]
+
+
+class UnknownFieldError(ValueError):
+    """Raised when a requested field path is not part of ``Repl``."""
+
+
+def parse_selection(text: str) -> FieldTree:
+    """Parse a GraphQL selection set into a field tree.
+
+    Args:
+        text: Selection set body, one field per line
+
+    Returns:
+        FieldTree: Fields keyed by their response key (alias or name)
+    """
+    stack = [{}]
+    owners = []
+    last = None
+    for token in findall(r"[{}]|[^\s{}][^{}\n]*", text):
+        if token == "{":
+            owners.append(last)
+            stack.append({})
+        elif token == "}":
+            children, owner = stack.pop(), owners.pop()
+            stack[-1][owner] = (stack[-1][owner][0], children)
+        else:
+            expression = token.strip()
+            last = expression.split("(")[0].split(":")[0].strip()
+            stack[-1][last] = (expression, None)
+    return stack[0]
+
+
+REPL_FIELDS = parse_selection(REPL_SELECTION)
+
+
+def normalize_fields(
+    fields: Optional[Iterable[str]],
+) -> Optional[Tuple[str, ...]]:
+    """Normalize requested field paths into a hashable cache key.
+
+    Args:
+        fields: Dotted field paths, possibly comma separated, or None
+
+    Returns:
+        Optional[Tuple[str, ...]]: Sorted unique paths, or None for the
+        full record
+
+    Raises:
+        UnknownFieldError: If a path is not part of ``Repl``
+    """
+    if fields is None:
+        return None
+    paths = {
+        path.strip()
+        for value in fields for path in value.split(",") if path.strip()
+    }
+    for path in paths:
+        tree = REPL_FIELDS
+        for part in path.split("."):
+            if tree is None or part not in tree:
+                raise UnknownFieldError(f"unknown field: {path}")
+            tree = tree[part][1]
+    return tuple(sorted(paths)) or None
+
+
+def project_tree(fields: Optional[Tuple[str, ...]]) -> FieldTree:
+    """Prune the full field tree down to the requested paths.
+
+    Args:
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        FieldTree: Pruned field tree
+    """
+    if fields is None:
+        return REPL_FIELDS
+    tree: FieldTree = {}
+    # Shorter paths first so ``owner`` wins over ``owner.id``
+    for path in sorted(fields, key=lambda p: p.count(".")):
+        source, target = REPL_FIELDS, tree
+        *parents, leaf = path.split(".")
+        for part in parents:
+            expression, source = source[part]
+            if part in target and target[part][1] is None:
+                break
+            target = target.setdefault(part, (expression, {}))[1]
+        else:
+            # Copied, so deeper paths never write into ``REPL_FIELDS``
+            target[leaf] = deepcopy(source[leaf])
+    return tree
+
+
+class Projection(NamedTuple):
+    """Functions compiled for one field set."""
+
+    #: Cut a record that covers the field set down to exactly it
+    project: Callable[[Any], Any]
+    #: List the requested paths a record lacks
+    missing: Callable[[Any], List[str]]
+
+
+def compile_projector(tree: FieldTree) -> Callable[[Any], Any]:
+    """Compile a function copying the ``tree`` fields out of a record.
+
+    Lists are projected item by item and nulls pass through, as GraphQL
+    would have answered them. Keys follow the tree order, which is the
+    order the upstream answers in.
+
+    Args:
+        tree: Field tree to keep
+
+    Returns:
+        Callable[[Any], Any]: Projector; raises ``KeyError`` if the record
+        lacks a field
+    """
+    steps = tuple((key, compile_projector(children) if children else None)
+                  for key, (_, children) in tree.items())
+
+    def project(value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return [project(item) for item in value]
+        return {
+            key: value[key] if step is None else step(value[key])
+            for key, step in steps
+        }
+
+    return project
+
+
+def compile_checker(tree: FieldTree,
+                    prefix: str = "") -> Callable[[Any], List[str]]:
+    """Compile a function listing the ``tree`` paths a record lacks.
+
+    Args:
+        tree: Field tree to check for
+        prefix: Dotted path of ``tree`` within the record
+
+    Returns:
+        Callable[[Any], List[str]]: Checker returning missing paths
+    """
+    keys = frozenset(tree)
+    nested = tuple((key, compile_checker(children, f"{prefix}{key}."))
+                   for key, (_, children) in tree.items() if children)
+
+    def missing(value: Any) -> List[str]:
+        if value is None:
+            return []
+        if isinstance(value, list):
+            return list(
+                dict.fromkeys(path for item in value
+                              for path in missing(item)))
+        found = [] if keys <= value.keys() else [
+            prefix + key for key in tree if key not in value
+        ]
+        for key, check in nested:
+            if key in value:
+                found.extend(check(value[key]))
+        return found
+
+    return missing
+
+
+@lru_cache(maxsize=256)
+def build_projection(fields: Optional[Tuple[str, ...]] = None) -> Projection:
+    """Compile the projector and coverage check for a field set.
+
+    Args:
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        Projection: Functions for the field set; the full record's
+        projector returns the record itself
+    """
+    tree = project_tree(fields)
+    project = compile_projector(tree) if fields is not None else (
+        lambda value: value)
+    return Projection(project, compile_checker(tree))
+
+
+def merge_records(old: Any, new: Any, tree: Optional[FieldTree] = None) -> Any:
+    """Merge newly fetched fields into a stored record.
+
+    Objects are merged key by key in field tree order; anything else,
+    lists included, is replaced by the new value.
+
+    Args:
+        old: Stored record
+        new: Record holding the newly fetched fields
+        tree: Field tree of both values, defaulting to ``Repl``
+
+    Returns:
+        Any: Merged record
+    """
+    tree = REPL_FIELDS if tree is None else tree
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+    merged = {}
+    for key, (_, children) in tree.items():
+        if key in new:
+            merged[key] = (merge_records(old[key], new[key], children)
+                           if children and key in old else new[key])
+        elif key in old:
+            merged[key] = old[key]
+    return merged
+
+
+def covered_fields(record: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+    """Return the field set to fetch to refresh a stored record.
+
+    Args:
+        record: Stored record
+
+    Returns:
+        Optional[Tuple[str, ...]]: Its top-level fields, or None if it
+        holds the full record
+    """
+    if len(record) == len(REPL_FIELDS):
+        return None
+    return tuple(sorted(key for key in record if key in REPL_FIELDS))
+
+
+def record_paths(value: Any, prefix: str = "") -> FrozenSet[str]:
+    """List the field paths a record holds.
+
+    Objects contribute the paths of their keys, lists the paths of all
+    their items; anything else, nulls and empty containers included,
+    ends a path.
+
+    Args:
+        value: Record or part of one
+        prefix: Dotted path of ``value`` within the record
+
+    Returns:
+        FrozenSet[str]: Dotted paths of the leaves held
+    """
+    if isinstance(value, list) and value:
+        return frozenset().union(
+            *(record_paths(item, prefix) for item in value))
+    if not isinstance(value, dict) or not value:
+        return frozenset((prefix[:-1], )) if prefix else frozenset()
+    return frozenset().union(*(record_paths(child, f"{prefix}{key}.")
+                               for key, child in value.items()))
+
+
+def holds_more(record: Any, projected: Any) -> bool:
+    """Tell whether a record holds field paths its projection dropped.
+
+    Compares key counts level by level and stops at the first object
+    holding more keys, so the common case is decided at the top level.
+
+    Args:
+        record: Stored record
+        projected: ``record`` projected onto a field set
+
+    Returns:
+        bool: True if ``record`` has paths ``projected`` lacks
+    """
+    if isinstance(record, dict) and isinstance(projected, dict):
+        return len(record) > len(projected) or any(
+            holds_more(record[key], value)
+            for key, value in projected.items())
+    if isinstance(record, list) and isinstance(projected, list):
+        return any(
+            holds_more(item, value)
+            for item, value in zip(record, projected, strict=True))
+    return False
+
+
+def render_selection(tree: FieldTree, indent: str = "") -> str:
+    """Render a field tree back into GraphQL selection syntax.
+
+    Args:
+        tree: Field tree to render
+        indent: Prefix for every rendered line
+
+    Returns:
+        str: Selection set body
+    """
+    lines = []
+    for expression, children in tree.values():
+        if children is None:
+            lines.append(f"{indent}{expression}")
+        else:
+            lines.append(f"{indent}{expression} {{")
+            lines.append(render_selection(children, indent + "  "))
+            lines.append(f"{indent}}}")
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=256)
+def build_query(fields: Optional[Tuple[str, ...]] = None) -> str:
+    """Build the ``Repl`` query document for a field set.
+
+    Args:
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        str: GraphQL document taking a single ``$id`` variable
+    """
+    selection = render_selection(project_tree(fields), " " * 6)
+    return ("query Repl($id: String) {\n"
+            "  repl(id: $id) {\n"
+            "    ... on Repl {\n"
+            f"{selection}\n"
+            "    }\n"
+            "  }\n"
+            "}")
+
+
+def batch_alias(index: int) -> str:
+    """Return the response key used for the ``index``-th batched repl.
+
+    Args:
+        index: Position of the repl ID in the batch
+
+    Returns:
+        str: GraphQL alias
+    """
+    return f"r{index}"
+
+
+@lru_cache(maxsize=256)
+def build_batch_query(count: int,
+                      fields: Optional[Tuple[str, ...]] = None) -> str:
+    """Build one document resolving ``count`` repls with aliases.
+
+    The selection is emitted once as a fragment shared by every aliased
+    ``repl(id:)`` field, so the document grows by one line per ID.
+
+    Args:
+        count: Number of repl IDs, bound to ``$id0`` .. ``$id{count-1}``
+        fields: Normalized field paths, or None for the full record
+
+    Returns:
+        str: GraphQL document
+    """
+    selection = render_selection(project_tree(fields), " " * 2)
+    variables = ", ".join(f"$id{i}: String" for i in range(count))
+    repls = "\n".join(f"  {batch_alias(i)}: repl(id: $id{i}) "
+                      "{ ...ReplFields }" for i in range(count))
+    return (f"query Repls({variables}) {{\n"
+            f"{repls}\n"
+            "}\n"
+            "fragment ReplFields on Repl {\n"
+            f"{selection}\n"
+            "}")
@@ -0,0 +1,196 @@
+"""
+Subset-aware view of the repl lookup cache.
+Each repl ID has one cache entry holding every field fetched for it so
+far. A lookup for any subset of those fields is projected from the entry
+with a compiled projector; otherwise only the missing fields are fetched
+and merged in.
+"""
+
+from collections import defaultdict
+from threading import Lock
+from time import monotonic
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+import codec
+from cache import Entry, TTLCache
+from query import (
+    build_projection,
+    covered_fields,
+    holds_more,
+    merge_records,
+    record_paths,
+)
+
+Fields = Optional[Tuple[str, ...]]
+
+
+def record_key(replit_id: str) -> Hashable:
+    """Return the cache key of a repl's merged record.
+
+    Args:
+        replit_id: Repl ID
+
+    Returns:
+        Hashable: Key in the ``(replit_id, fields)`` form of the backends
+    """
+    return (replit_id, None)
+
+
+class RecordCache:
+    """Answers lookups for any field set covered by a cached record.
+
+    Args:
+        cache: Backend holding one merged record per repl ID
+    """
+
+    def __init__(self, cache: TTLCache) -> None:
+        self.cache = cache
+        self.subsumed_hits = self.merges = 0
+        self._lock = Lock()
+
+    def answer(self, entry: Entry, fields: Fields) -> Tuple[Any, Fields]:
+        """Project a cached record onto a field set.
+
+        Args:
+            entry: Cached record
+            fields: Normalized field paths, or None for the full record
+
+        Returns:
+            Tuple[Any, Fields]: The projected record and None, or None
+            and the sorted paths the record lacks
+        """
+        projection = build_projection(fields)
+        missing = projection.missing(entry.value)
+        if missing:
+            return None, tuple(sorted(missing))
+        found = projection.project(entry.value)
+        if found is not entry.value:
+            if holds_more(entry.value, found):
+                self.subsumed_hits += 1
+            found = codec.document(found, codec.dumps(found))
+        return found, None
+
+    def store(self,
+              replit_id: str,
+              fields: Fields,
+              record: Any,
+              entry: Optional[Entry] = None) -> Any:
+        """Cache a fetched record, merged into the entry it completes.
+
+        The record is merged into the latest fresh entry, so fields
+        stored by a concurrent lookup are kept. A merged entry keeps the
+        expiry of the fields it already held; a record holding all of
+        them replaces the entry.
+
+        Args:
+            replit_id: Repl ID
+            fields: Field set the caller asked for
+            record: Fetched record, or None if the repl does not exist
+            entry: Fresh cached entry the record was fetched to complete,
+                used if the cache no longer holds it
+
+        Returns:
+            Any: The record projected onto ``fields``
+        """
+        if record is None:
+            return None
+        key, ttl = record_key(replit_id), None
+        with self._lock:
+            entry = self.cache.get(key) or entry
+            if entry is not None and not (record_paths(entry.value)
+                                          <= record_paths(record)):
+                record = merge_records(entry.value, record)
+                ttl = entry.expires_at - monotonic()
+                self.merges += 1
+            stored = self.cache.set(key, record, ttl=ttl)
+        return build_projection(fields).project(
+            record if stored is None else stored.value)
+
+    def get_or_load(self, replit_id: str, fields: Fields,
+                    fetch: Callable[[Fields], Any]) -> Any:
+        """Return a repl's fields, fetching only what the cache lacks.
+
+        A stale entry that covers the fields is returned immediately and
+        refreshed in the background.
+
+        Args:
+            replit_id: Repl ID
+            fields: Normalized field paths, or None for the full record
+            fetch: Callable fetching a field set of the repl
+
+        Returns:
+            Any: The repl record, or None if it does not exist
+        """
+        cache, key = self.cache, record_key(replit_id)
+        entry = cache.get(key, stale=True) or cache.load_stored(key)
+        if entry is None:
+            cache.misses += 1
+            return self.store(replit_id, fields, fetch(fields))
+        found, missing = self.answer(entry, fields)
+        if missing is None:
+            if monotonic() < entry.expires_at:
+                cache.hits += 1
+            else:
+                cache.stale_hits += 1
+                wider = covered_fields(entry.value)
+                cache.refresh(key, lambda: fetch(wider))
+            return found
+        cache.misses += 1
+        if monotonic() < entry.expires_at:
+            return self.store(replit_id, fields, fetch(missing), entry)
+        return self.store(replit_id, fields, fetch(fields))
+
+    def get_many(
+        self, replit_ids: Iterable[str], fields: Fields
+    ) -> Tuple[Dict[str, Any], Dict[Fields, List[str]], Dict[str, Entry]]:
+        """Answer what the cache covers and plan fetches for the rest.
+
+        Args:
+            replit_ids: Unique repl IDs
+            fields: Normalized field paths, or None for the full record
+
+        Returns:
+            Tuple[Dict[str, Any], Dict[Fields, List[str]], Dict[str, Entry]]:
+            Answers by repl ID, repl IDs to fetch grouped by the field
+            set they need, and the fresh entries those fetches complete
+            (pass them to ``store``)
+        """
+        replit_ids = list(replit_ids)
+        entries = self.cache.get_entries(
+            record_key(replit_id) for replit_id in replit_ids)
+        found: Dict[str, Any] = {}
+        fetches: Dict[Fields, List[str]] = defaultdict(list)
+        partial = {}
+        for replit_id in replit_ids:
+            entry = entries.get(record_key(replit_id))
+            if entry is None or monotonic() >= entry.expires_at:
+                self.cache.misses += 1
+                fetches[fields].append(replit_id)
+                continue
+            answer, missing = self.answer(entry, fields)
+            if missing is None:
+                self.cache.hits += 1
+                found[replit_id] = answer
+            else:
+                self.cache.misses += 1
+                fetches[missing].append(replit_id)
+                partial[replit_id] = entry
+        return found, dict(fetches), partial
+
+    def stats(self) -> Dict[str, Any]:
+        """Report subset-aware cache activity.
+
+        Returns:
+            Dict[str, Any]: Hits answered from a wider record and fetches
+            merged into an existing one
+        """
+        return {"subsumed_hits": self.subsumed_hits, "merges": self.merges}
@@ -0,0 +1,362 @@
+"""
+Redis-protocol backend for the repl lookup cache.
+Speaks RESP over a plain socket, so any Redis-compatible server works
+without a client library. Multi-key reads go out as chunked ``MGET``
+commands in a single pipelined round trip, and values are stored as the
+serialized record behind a wall-clock expiry.
+"""
+
+from os import getpid
+from socket import IPPROTO_TCP, TCP_NODELAY, create_connection
+from struct import Struct
+from threading import local
+from time import monotonic, time
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+from urllib.parse import urlsplit
+
+import codec
+import config
+from cache import Entry, TTLCache
+from persist import encode_key
+
+if TYPE_CHECKING:
+    from persist import PersistentStore
+
+# Wall-clock time the value stops being fresh; the record follows
+EXPIRY = Struct("<d")
+Argument = Union[str, bytes, int]
+
+
+class RedisError(Exception):
+    """Error reply from the server."""
+
+
+def encode_command(*args: Argument) -> bytes:
+    """Encode one command as a RESP array of bulk strings.
+
+    Args:
+        *args: Command name and arguments
+
+    Returns:
+        bytes: Wire form of the command
+    """
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = b"%d" % arg
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def read_reply(reader: IO[bytes]) -> Any:
+    """Read one RESP reply.
+
+    Error replies are returned rather than raised, so the rest of a
+    pipeline can still be read.
+
+    Args:
+        reader: Buffered socket reader
+
+    Returns:
+        Any: str, int, bytes, None, list or ``RedisError``
+
+    Raises:
+        ConnectionError: If the server closed the connection
+    """
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("redis server closed the connection")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        return None if length < 0 else reader.read(length + 2)[:-2]
+    if kind == b"*":
+        length = int(rest)
+        return None if length < 0 else [
+            read_reply(reader) for _ in range(length)
+        ]
+    raise ConnectionError(f"unexpected redis reply: {line!r}")
+
+
+class RedisClient:
+    """Minimal pipelining RESP client with one connection per thread.
+
+    Args:
+        url: ``redis://[:password@]host[:port][/db]``
+        timeout: Seconds allowed for connecting and for each reply
+    """
+
+    def __init__(self,
+                 url: str = config.REDIS_URL,
+                 timeout: float = config.REDIS_TIMEOUT) -> None:
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self._local = local()
+
+    def _connection(self) -> IO[bytes]:
+        # A forked worker must not share its parent's socket
+        reader = getattr(self._local, "reader", None)
+        if reader is not None and self._local.pid == getpid():
+            return reader
+        sock = create_connection((self.host, self.port), self.timeout)
+        sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        self._local.sock, self._local.pid = sock, getpid()
+        self._local.reader = sock.makefile("rb")
+        setup: List[Sequence[Argument]] = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            try:
+                self.pipeline(setup)
+            except RedisError:
+                self._close()
+                raise
+        return self._local.reader
+
+    def _close(self) -> None:
+        reader = getattr(self._local, "reader", None)
+        if reader is not None:
+            reader.close()
+            self._local.sock.close()
+            self._local.reader = None
+
+    def pipeline(self, commands: Sequence[Sequence[Argument]]) -> List[Any]:
+        """Send several commands in one write and read all replies.
+
+        Args:
+            commands: Commands with their arguments
+
+        Returns:
+            List[Any]: One reply per command
+
+        Raises:
+            RedisError: If any command failed
+            OSError: If the connection failed or timed out; it is closed
+                so the next call reconnects
+        """
+        reader = self._connection()
+        try:
+            self._local.sock.sendall(b"".join(
+                encode_command(*command) for command in commands))
+            replies = [read_reply(reader) for _ in commands]
+        except (OSError, ValueError):
+            # A half-read reply leaves the connection out of step
+            self._close()
+            raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def execute(self, *command: Argument) -> Any:
+        """Run one command.
+
+        Args:
+            *command: Command name and arguments
+
+        Returns:
+            Any: The reply
+        """
+        return self.pipeline([command])[0]
+
+
+class RedisCache(TTLCache):
+    """``TTLCache`` kept on a Redis-protocol server shared by all hosts.
+
+    The server expires entries once they leave the stale window. A
+    failing server degrades to cache misses and dropped writes, counted
+    as ``errors``.
+
+    Args:
+        client: Connection to the server; defaults to
+            ``REPLIT_INFO_REDIS_URL``
+        prefix: Prepended to every key
+        ttl: Seconds an entry is served as fresh
+        stale_ttl: Extra seconds an expired entry may be served while it
+            is refreshed in the background
+        refresh_workers: Threads used for background refreshes
+        store: Optional persistent tier read on a miss and written on
+            every ``set``
+    """
+
+    backend = "redis"
+    blocking = True
+
+    def __init__(
+        self,
+        client: Optional[RedisClient] = None,
+        prefix: str = config.REDIS_PREFIX,
+        ttl: float = config.CACHE_TTL,
+        stale_ttl: float = config.CACHE_STALE_TTL,
+        refresh_workers: int = config.CACHE_REFRESH_WORKERS,
+        store: Optional["PersistentStore"] = None,
+    ) -> None:
+        super().__init__(ttl=ttl,
+                         stale_ttl=stale_ttl,
+                         refresh_workers=refresh_workers,
+                         store=store)
+        self.client = client or RedisClient()
+        self.prefix = prefix
+        self.errors = 0
+
+    def _name(self, key: Hashable) -> str:
+        return self.prefix + encode_key(key)
+
+    def _entry(self, stored: Optional[bytes], stale: bool) -> Optional[Entry]:
+        if stored is None:
+            return None
+        fresh_for = EXPIRY.unpack_from(stored)[0] - time()
+        if fresh_for <= -self.stale_ttl:
+            self.expirations += 1
+            return None
+        if fresh_for <= 0 and not stale:
+            return None
+        data = stored[EXPIRY.size:]
+        return Entry(codec.loads_document(data), monotonic() + fresh_for,
+                     len(data))
+
+    def get(self, key: Hashable, stale: bool = False) -> Optional[Entry]:
+        """Look up an entry without loading it.
+
+        Args:
+            key: Cache key
+            stale: Also return expired entries still inside the stale
+                window
+
+        Returns:
+            Optional[Entry]: The entry, or None on a miss
+        """
+        try:
+            stored = self.client.execute("GET", self._name(key))
+        except (OSError, RedisError):
+            self.errors += 1
+            return None
+        return self._entry(stored, stale)
+
+    def get_entries(self, keys: Iterable[Hashable]) -> Dict[Hashable, Entry]:
+        """Look up several entries in one round trip, without counting.
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Dict[Hashable, Entry]: Entries, stale ones included, of the
+            keys that were found
+        """
+        keys = list(keys)
+        names = [self._name(key) for key in keys]
+        size = config.REDIS_MGET_CHUNK
+        stored: List[Optional[bytes]] = [None] * len(keys)
+        if names:
+            try:
+                replies = self.client.pipeline([
+                    ("MGET", *names[i:i + size])
+                    for i in range(0, len(names), size)
+                ])
+                values = [value for reply in replies for value in reply]
+                if len(values) != len(keys):
+                    raise RedisError(f"MGET returned {len(values)} values "
+                                     f"for {len(keys)} keys")
+                stored = values
+            except (OSError, RedisError):
+                self.errors += 1
+        found = {}
+        for key, value in zip(keys, stored, strict=True):
+            entry = self._entry(value, True) or self.load_stored(key)
+            if entry is not None:
+                found[key] = entry
+        return found
+
+    def set(self,
+            key: Hashable,
+            value: Any,
+            ttl: Optional[float] = None,
+            persist: bool = True) -> Optional[Entry]:
+        """Store a value for every host.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Override of the default TTL in seconds; may be negative
+                for values that are already stale
+            persist: Also queue the value for the persistent tier
+
+        Returns:
+            Optional[Entry]: The stored entry
+        """
+        ttl = self.ttl if ttl is None else ttl
+        data = codec.dumps(value)
+        value = codec.document(value, data)
+        if persist and self.store is not None:
+            self.store.put(key, value)
+        keep = ttl + self.stale_ttl
+        if keep > 0:
+            try:
+                self.client.execute("SET", self._name(key),
+                                    EXPIRY.pack(time() + ttl) + data, "PX",
+                                    int(keep * 1000))
+            except (OSError, RedisError):
+                self.errors += 1
+        return Entry(value, monotonic() + ttl, len(data))
+
+    def clear(self) -> None:
+        """Drop every entry under the prefix, for all hosts."""
+        cursor = b"0"
+        while True:
+            cursor, names = self.client.execute("SCAN", cursor, "MATCH",
+                                                self.prefix + "*", "COUNT",
+                                                1000)
+            if names:
+                self.client.execute("DEL", *names)
+            if cursor == b"0":
+                return
+
+    def __len__(self) -> int:
+        try:
+            return self.client.execute("DBSIZE")
+        except (OSError, RedisError):
+            self.errors += 1
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache effectiveness counters.
+
+        Returns:
+            Dict[str, Any]: Keys in the server's database, this process's
+            hit/miss counts and hit ratio, and server errors
+        """
+        return {
+            **super().stats(),
+            "entries": len(self),
+            "bytes": None,
+            "max_entries": None,
+            "max_bytes": None,
+            "server": f"{self.client.host}:{self.client.port}/"
+                      f"{self.client.db}",
+            "errors": self.errors,
+        }
@@ -0,0 +1,269 @@
+"""
+Production entry point for the Replit Info API.
+Runs the WSGI app under gunicorn (or waitress where gunicorn is not
+available) or the ASGI app under uvicorn, with worker, thread,
+keep-alive and preload settings sized from the CPU count by default.
+Installed as the ``replit-info-serve`` console script.
+"""
+
+from argparse import ArgumentParser, BooleanOptionalAction, Namespace
+from importlib.util import find_spec
+from os import environ, getpid
+from pathlib import Path
+from signal import SIGTERM, signal
+from sys import stderr
+from types import FrameType
+from typing import Any, Dict, List, Optional
+
+import config
+
+SERVERS = ("gunicorn", "waitress", "uvicorn")
+# Options only some servers honour; warned about when set explicitly
+GUNICORN_ONLY = ("threads", "preload", "timeout")
+
+
+def pick_server(app: str, server: str = "") -> str:
+    """Choose the server for an app.
+
+    Args:
+        app: ``wsgi`` or ``asgi``
+        server: Requested server, or empty to pick the best installed one
+
+    Returns:
+        str: Server name
+
+    Raises:
+        SystemExit: If no suitable server is installed
+    """
+    if server:
+        candidates = [server]
+    elif app == "asgi":
+        candidates = ["uvicorn"]
+    else:
+        candidates = ["gunicorn", "waitress"]
+    for candidate in candidates:
+        if find_spec(candidate) is not None:
+            if (candidate == "gunicorn" and app == "asgi"
+                    and find_spec("uvicorn_worker") is None):
+                raise SystemExit("install uvicorn-worker to serve the asgi "
+                                 "app under gunicorn")
+            return candidate
+    raise SystemExit(f"install {' or '.join(candidates)} to serve the "
+                     f"{app} app, e.g. pip install {candidates[0]}")
+
+
+def ignored_options(options: Namespace) -> List[str]:
+    """List explicitly set options the chosen server cannot honour.
+
+    ASGI workers are single-threaded event loops, and uvicorn has no
+    preloading or stuck-worker timeout.
+
+    Args:
+        options: Parsed serve options
+
+    Returns:
+        List[str]: Names of the ignored options
+    """
+    if options.app != "asgi":
+        return []
+    ignored = ["threads"]
+    if options.server == "uvicorn":
+        ignored += ["preload", "timeout"]
+    return [name for name in ignored if name in options.explicit]
+
+
+def gunicorn_options(options: Namespace) -> Dict[str, Any]:
+    """Translate serve options into gunicorn settings.
+
+    Args:
+        options: Parsed serve options
+
+    Returns:
+        Dict[str, Any]: gunicorn settings
+    """
+    settings = {
+        "bind": f"{options.host}:{options.port}",
+        "workers": options.workers,
+        "threads": options.threads,
+        "worker_class": "gthread",
+        "preload_app": options.preload,
+        "keepalive": int(options.keepalive),
+        "graceful_timeout": int(options.graceful_timeout),
+        "timeout": int(options.timeout),
+    }
+    if options.pidfile:
+        settings["pidfile"] = options.pidfile
+    if options.app == "asgi":
+        settings["worker_class"] = "uvicorn_worker.UvicornWorker"
+    return settings
+
+
+def run_gunicorn(options: Namespace) -> None:
+    """Serve under gunicorn; ``SIGHUP`` to the master reloads gracefully.
+
+    Args:
+        options: Parsed serve options
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+
+        def load_config(self) -> None:
+            for name, value in gunicorn_options(options).items():
+                self.cfg.set(name, value)
+
+        def load(self) -> Any:
+            # Imported here so that without preload every worker builds
+            # its own app after the fork
+            if options.app == "asgi":
+                from asgi import app
+            else:
+                from main import app
+            return app
+
+    Application().run()
+
+
+def run_waitress(options: Namespace) -> None:
+    """Serve the WSGI app under waitress (single process, threaded).
+
+    Args:
+        options: Parsed serve options
+    """
+    from waitress import serve
+
+    from main import app
+
+    serve(app,
+          host=options.host,
+          port=options.port,
+          threads=options.workers * options.threads,
+          channel_timeout=options.timeout)
+
+
+def exit_on_signal(signum: int, _frame: Optional[FrameType]) -> None:
+    """Signal handler exiting with the conventional ``128 + signum`` code.
+
+    Args:
+        signum: Signal received
+    """
+    raise SystemExit(128 + signum)
+
+
+def run_uvicorn(options: Namespace) -> None:
+    """Serve the ASGI app under uvicorn; ``SIGHUP`` restarts workers.
+
+    The worker supervisor runs in this process, so its PID is the one
+    written to the pidfile.
+
+    Args:
+        options: Parsed serve options
+    """
+    from uvicorn import run
+
+    pidfile = Path(options.pidfile) if options.pidfile else None
+    if pidfile is not None:
+        pidfile.write_text(f"{getpid()}\n")
+        # uvicorn re-raises the stop signal after shutting down; exit
+        # through Python instead so the pidfile is removed
+        signal(SIGTERM, exit_on_signal)
+    try:
+        run("asgi:app",
+            host=options.host,
+            port=options.port,
+            workers=options.workers,
+            timeout_keep_alive=int(options.keepalive),
+            timeout_graceful_shutdown=int(options.graceful_timeout),
+            access_log=False)
+    finally:
+        if pidfile is not None:
+            pidfile.unlink(missing_ok=True)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> Namespace:
+    """Parse serve options; defaults come from ``config``.
+
+    Args:
+        argv: Command line arguments, or None for ``sys.argv``
+
+    Returns:
+        Namespace: Parsed options
+    """
+    parser = ArgumentParser(prog="replit-info-serve",
+                            description="Serve the Replit Info API.")
+    parser.add_argument("--app",
+                        choices=("wsgi", "asgi"),
+                        default=config.SERVE_APP)
+    parser.add_argument("--server",
+                        choices=SERVERS,
+                        default=config.SERVE_SERVER or None,
+                        help="defaults to gunicorn (or waitress) for wsgi "
+                        "and uvicorn for asgi; uvicorn always serves asgi")
+    parser.add_argument("--host", default=config.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    parser.add_argument("--workers",
+                        type=int,
+                        default=config.SERVE_WORKERS,
+                        help="worker processes")
+    parser.add_argument("--threads",
+                        type=int,
+                        help="threads per worker (wsgi only)")
+    parser.add_argument("--preload",
+                        action=BooleanOptionalAction,
+                        help="import the app once before forking workers "
+                        "(gunicorn only)")
+    parser.add_argument("--keepalive",
+                        type=float,
+                        default=config.SERVE_KEEPALIVE,
+                        help="seconds an idle client connection is kept")
+    parser.add_argument("--graceful-timeout",
+                        type=float,
+                        default=config.SERVE_GRACEFUL_TIMEOUT,
+                        help="seconds workers get to finish on reload")
+    parser.add_argument("--timeout",
+                        type=float,
+                        help="seconds before a stuck worker is restarted "
+                        "(gunicorn only)")
+    parser.add_argument("--pidfile",
+                        default=config.SERVE_PIDFILE,
+                        help="write the master PID here for reloads")
+    options = parser.parse_args(argv)
+    # Remember which server-specific options were chosen, on the command
+    # line or in the environment, before filling in the defaults
+    options.explicit = set()
+    for name in GUNICORN_ONLY:
+        setting = f"SERVE_{name.upper()}"
+        if (getattr(options, name) is not None
+                or f"REPLIT_INFO_{setting}" in environ):
+            options.explicit.add(name)
+        if getattr(options, name) is None:
+            setattr(options, name, getattr(config, setting))
+    return options
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the configured production server.
+
+    Args:
+        argv: Command line arguments, or None for ``sys.argv``
+    """
+    options = parse_args(argv)
+    options.server = pick_server(options.app, options.server or "")
+    if options.server == "waitress" and options.app == "asgi":
+        raise SystemExit("waitress only serves the wsgi app")
+    if options.server == "uvicorn" and options.app == "wsgi":
+        options.app = "asgi"
+    ignored = ignored_options(options)
+    if ignored:
+        flags = ", ".join(f"--{name}" for name in ignored)
+        print(f"replit-info-serve: {options.server} ignores {flags} when "
+              f"serving the asgi app", file=stderr)
+    {
+        "gunicorn": run_gunicorn,
+        "waitress": run_waitress,
+        "uvicorn": run_uvicorn,
+    }[options.server](options)
+
+
+if __name__ == "__main__":
+    main()
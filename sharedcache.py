@@ -0,0 +1,301 @@
+"""
+Repl lookup cache shared by every worker process on a host.
+Records live in a memory-mapped file: a set-associative slot table over
+a ring-buffer arena of serialized values. Writers serialize on a file
+lock; readers take no lock, copying a value out of the mapping and
+validating the copy against per-slot sequence counters before decoding.
+"""
+
+import os
+from contextlib import contextmanager
+from hashlib import blake2b
+from mmap import mmap
+from os import O_CREAT, O_RDWR, fstat, ftruncate, pread, pwrite
+from struct import Struct
+from threading import Lock
+from time import monotonic, time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Hashable,
+    Iterator,
+    Optional,
+    Tuple,
+)
+
+import codec
+import config
+from cache import Entry, TTLCache
+from persist import encode_key
+
+try:
+    from fcntl import LOCK_EX, LOCK_UN, lockf
+except ImportError:  # pragma: no cover - depends on the environment
+    lockf = None
+
+if TYPE_CHECKING:
+    from persist import PersistentStore
+
+# Version 2 stamps wall-clock expiries; older files are re-initialized
+MAGIC = b"RISHMC2\0"
+# Magic, bucket count, ways per bucket, arena size
+HEADER = Struct("<8sIIQ")
+# Absolute arena position of the next write; only ever grows
+CURSOR = Struct("<Q")
+CURSOR_AT = HEADER.size
+TABLE_AT = CURSOR_AT + CURSOR.size
+# Sequence, key digest, arena position, value length, expiry (wall clock)
+SLOT = Struct("<I16sQId")
+SEQUENCE = Struct("<I")
+EMPTY_KEY = bytes(16)
+WAYS = 8
+READ_RETRIES = 4
+
+
+def key_digest(key: Hashable) -> bytes:
+    """Hash a cache key to its fixed-size shared form.
+
+    Args:
+        key: ``(replit_id, fields)`` cache key
+
+    Returns:
+        bytes: 16-byte digest of the encoded key
+    """
+    return blake2b(encode_key(key).encode(), digest_size=16).digest()
+
+
+class SharedCache(TTLCache):
+    """``TTLCache`` whose entries live in a shared memory-mapped file.
+
+    Every process mapping the same file sees the same entries, so a host
+    holds one copy of each record and one eviction policy: values are
+    appended to a ring buffer, so the oldest writes are overwritten
+    first, and a full bucket replaces its oldest slot. Expiry times are
+    stored on the wall clock, which unlike the monotonic clock survives a
+    reboot, so a file kept across one never serves old entries as fresh.
+    Hit and refresh counters stay per process.
+
+    The file is created with the given geometry; an existing cache file
+    keeps its own, so delete it to resize.
+
+    Args:
+        path: Cache file, ideally on a tmpfs such as ``/dev/shm``
+        max_bytes: Size of the value arena
+        slots: Number of entries the table can index
+        ttl: Seconds an entry is served as fresh
+        stale_ttl: Extra seconds an expired entry may be served while it
+            is refreshed in the background
+        refresh_workers: Threads used for background refreshes
+        store: Optional persistent tier read on a miss and written on
+            every ``set``
+
+    Raises:
+        OSError: If the platform has no POSIX file locks
+    """
+
+    backend = "shared"
+
+    def __init__(
+        self,
+        path: str = config.SHARED_CACHE_PATH,
+        max_bytes: int = config.SHARED_CACHE_BYTES,
+        slots: int = config.SHARED_CACHE_SLOTS,
+        ttl: float = config.CACHE_TTL,
+        stale_ttl: float = config.CACHE_STALE_TTL,
+        refresh_workers: int = config.CACHE_REFRESH_WORKERS,
+        store: Optional["PersistentStore"] = None,
+    ) -> None:
+        if lockf is None:
+            raise OSError("the shared cache needs POSIX file locks")
+        self.path = path
+        self._fd = os.open(path, O_RDWR | O_CREAT, 0o600)
+        self._write_lock = Lock()
+        with self._locked():
+            buckets, arena = self._attach(max(slots // WAYS, 1), max_bytes)
+        super().__init__(ttl=ttl,
+                         stale_ttl=stale_ttl,
+                         max_entries=buckets * WAYS,
+                         max_bytes=arena,
+                         refresh_workers=refresh_workers,
+                         store=store)
+        self.buckets = buckets
+        self._arena_at = TABLE_AT + buckets * WAYS * SLOT.size
+        self._map = mmap(self._fd, self._arena_at + arena)
+
+    def _attach(self, buckets: int, arena: int) -> Tuple[int, int]:
+        # Adopt the geometry of an existing cache file, or lay out a new
+        # one; runs under the file lock so only one process initializes
+        header = pread(self._fd, HEADER.size, 0)
+        if len(header) == HEADER.size:
+            magic, found_buckets, ways, found_arena = HEADER.unpack(header)
+            size = TABLE_AT + found_buckets * WAYS * SLOT.size + found_arena
+            if (magic == MAGIC and ways == WAYS
+                    and fstat(self._fd).st_size == size):
+                return found_buckets, found_arena
+        ftruncate(self._fd, 0)
+        ftruncate(self._fd, TABLE_AT + buckets * WAYS * SLOT.size + arena)
+        pwrite(self._fd, HEADER.pack(MAGIC, buckets, WAYS, arena), 0)
+        return buckets, arena
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        # The thread lock orders writers within this process, the file
+        # lock across processes (POSIX locks are per process)
+        with self._write_lock:
+            lockf(self._fd, LOCK_EX)
+            try:
+                yield
+            finally:
+                lockf(self._fd, LOCK_UN)
+
+    def _cursor(self) -> int:
+        return CURSOR.unpack_from(self._map, CURSOR_AT)[0]
+
+    def _live(self, start: int, cursor: int) -> bool:
+        # A value is intact until the ring wraps around onto it
+        return cursor <= start + self.max_bytes
+
+    def _slots(self, digest: bytes) -> range:
+        bucket = int.from_bytes(digest[:8], "little") % self.buckets
+        first = TABLE_AT + bucket * WAYS * SLOT.size
+        return range(first, first + WAYS * SLOT.size, SLOT.size)
+
+    def get(self, key: Hashable, stale: bool = False) -> Optional[Entry]:
+        """Look up an entry without loading it.
+
+        The value is copied out of the shared mapping and only decoded
+        if no writer touched it meanwhile. The copy is kept as the
+        entry's serialized form.
+
+        Args:
+            key: Cache key
+            stale: Also return expired entries still inside the stale
+                window
+
+        Returns:
+            Optional[Entry]: The entry, or None on a miss
+        """
+        digest = key_digest(key)
+        now = time()
+        for at in self._slots(digest):
+            for _ in range(READ_RETRIES):
+                sequence, found, start, length, expires_at = (
+                    SLOT.unpack_from(self._map, at))
+                if sequence & 1:
+                    # A writer is updating this slot
+                    continue
+                if found != digest or not self._live(start, self._cursor()):
+                    break
+                if now >= expires_at + self.stale_ttl:
+                    self.expirations += 1
+                    return None
+                if now >= expires_at and not stale:
+                    return None
+                offset = self._arena_at + start % self.max_bytes
+                data = self._map[offset:offset + length]
+                if (SEQUENCE.unpack_from(self._map, at)[0] == sequence
+                        and self._live(start, self._cursor())):
+                    return Entry(codec.loads_document(data),
+                                 monotonic() + expires_at - now, length)
+                # Torn by a concurrent write; read the slot again
+        return None
+
+    def set(self,
+            key: Hashable,
+            value: Any,
+            ttl: Optional[float] = None,
+            persist: bool = True) -> Optional[Entry]:
+        """Store a value for every process, overwriting the oldest data.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Override of the default TTL in seconds; may be negative
+                for values that are already stale
+            persist: Also queue the value for the persistent tier
+
+        Returns:
+            Optional[Entry]: The stored entry, or None if it is larger
+            than the whole arena
+        """
+        data = codec.dumps(value)
+        value = codec.document(value, data)
+        if persist and self.store is not None:
+            self.store.put(key, value)
+        if len(data) > self.max_bytes:
+            return None
+        digest = key_digest(key)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time() + ttl
+        with self._locked():
+            start = self._cursor()
+            if start % self.max_bytes + len(data) > self.max_bytes:
+                # Values never wrap; skip to the start of the arena
+                start += self.max_bytes - start % self.max_bytes
+            cursor = start + len(data)
+            # Publish the cursor before overwriting, so readers of the
+            # values being overwritten see them invalidated
+            CURSOR.pack_into(self._map, CURSOR_AT, cursor)
+            offset = self._arena_at + start % self.max_bytes
+            self._map[offset:offset + len(data)] = data
+            at = self._victim(digest, cursor)
+            sequence = SEQUENCE.unpack_from(self._map, at)[0]
+            SEQUENCE.pack_into(self._map, at, (sequence + 1) & 0xFFFFFFFF)
+            SLOT.pack_into(self._map, at, (sequence + 1) & 0xFFFFFFFF,
+                           digest, start, len(data), expires_at)
+            SEQUENCE.pack_into(self._map, at, (sequence + 2) & 0xFFFFFFFF)
+        return Entry(value, monotonic() + ttl, len(data))
+
+    def _victim(self, digest: bytes, cursor: int) -> int:
+        # The key's own slot, else a free or dead one, else the oldest
+        now = time()
+        free = oldest = None
+        oldest_start = cursor
+        for at in self._slots(digest):
+            _, found, start, _, expires_at = SLOT.unpack_from(self._map, at)
+            if found == digest:
+                return at
+            if (found == EMPTY_KEY or not self._live(start, cursor)
+                    or now >= expires_at + self.stale_ttl):
+                if free is None:
+                    free = at
+            elif start < oldest_start:
+                oldest, oldest_start = at, start
+        if free is not None:
+            return free
+        self.evictions += 1
+        return oldest
+
+    def _records(self) -> Iterator[int]:
+        # Lengths of the live, unexpired entries
+        now, cursor = time(), self._cursor()
+        for _, found, start, length, expires_at in SLOT.iter_unpack(
+                self._map[TABLE_AT:self._arena_at]):
+            if (found != EMPTY_KEY and self._live(start, cursor)
+                    and now < expires_at + self.stale_ttl):
+                yield length
+
+    def clear(self) -> None:
+        """Drop every entry, for all processes."""
+        with self._locked():
+            CURSOR.pack_into(self._map, CURSOR_AT,
+                             self._cursor() + self.max_bytes)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._records())
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache effectiveness counters.
+
+        Returns:
+            Dict[str, Any]: Shared sizes, this process's hit/miss/eviction
+            counts and hit ratio
+        """
+        lengths = list(self._records())
+        return {
+            **super().stats(),
+            "entries": len(lengths),
+            "bytes": sum(lengths),
+            "path": self.path,
+        }
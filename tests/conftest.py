@@ -0,0 +1,93 @@
+"""
+Shared fixtures for the test suite.
+Time-dependent components read ``monotonic`` from their own module, so
+tests swap in a manual clock instead of sleeping. HTTP tests talk to the
+benchmark stub upstream on an ephemeral port, through the Flask app.
+"""
+
+from argparse import Namespace
+from http.server import ThreadingHTTPServer
+from os import getpid
+from threading import Thread
+
+import pytest
+from stub_upstream import StubHandler
+
+import main
+import upstream
+from breaker import CircuitBreaker
+from upstream import UpstreamClient
+
+
+class Clock:
+    """Manually advanced stand-in for ``time.monotonic``."""
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        """Move the clock forward.
+
+        Args:
+            seconds: Seconds to add
+        """
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> Clock:
+    """Return a manual clock starting at an arbitrary time."""
+    return Clock()
+
+
+@pytest.fixture
+def wall_clock() -> Clock:
+    """Return a manual stand-in for ``time.time`` at a realistic epoch."""
+    return Clock(1_700_000_000.0)
+
+
+@pytest.fixture
+def upstream_stub():
+    """Run the stub GraphQL upstream for one test.
+
+    Yields:
+        ThreadingHTTPServer: The server, with its ``url`` and the
+        ``options`` (latency in ms, error and missing rates) it reads on
+        every request
+    """
+    options = Namespace(latency=0.0,
+                        jitter=0.0,
+                        error_rate=0.0,
+                        missing_rate=0.0)
+    handler = type("Handler", (StubHandler, ), {"options": options})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    server.options = options
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def app(monkeypatch, upstream_stub):
+    """Point the Flask app at the stub upstream for one test.
+
+    Hedging and retries are off so every lookup is one upstream request,
+    and the app gets a fresh circuit breaker that opens after three
+    failures.
+
+    Yields:
+        FlaskClient: Test client of ``main.app``
+    """
+    client = UpstreamClient(url=upstream_stub.url, hedge=False, retries=0)
+    monkeypatch.setattr(upstream, "_client", client)
+    monkeypatch.setattr(upstream, "_client_pid", getpid())
+    monkeypatch.setattr(main, "breaker",
+                        CircuitBreaker(failure_threshold=3, reset_timeout=30))
+    yield main.app.test_client()
+    client.close()
@@ -0,0 +1,147 @@
+"""Tests for the asyncio serving mode."""
+
+from asyncio import CancelledError, Event, create_task, run, sleep, wait_for
+
+import pytest
+
+import asgi
+import config
+from breaker import CircuitBreaker
+from deadline import Deadline, DeadlineExceeded, deadline_scope
+from persist import PersistentStore
+from query import normalize_fields
+from records import record_key
+
+RECORD = {"id": "x", "title": "Stub", "likeCount": 1}
+
+
+async def call(path, query="", method="GET"):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.app({
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [],
+    }, receive, send)
+    headers = {
+        name.decode(): value.decode()
+        for name, value in messages[0]["headers"]
+    }
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return messages[0]["status"], headers, body
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replace the upstream call with a scripted coroutine."""
+    script = {"calls": 0, "release": None, "fail": []}
+
+    async def get_info(replit_id, _fields=None):
+        script["calls"] += 1
+        if script["fail"]:
+            raise script["fail"].pop(0)
+        if script["release"] is not None:
+            await script["release"].wait()
+        return dict(RECORD, id=replit_id)
+
+    monkeypatch.setattr(asgi, "get_info", get_info)
+    return script
+
+
+def test_waiters_retry_after_the_leader_is_cancelled(upstream):
+
+    async def scenario():
+        upstream["release"] = Event()
+        leader = create_task(asgi._load("cancelled", None))
+        await sleep(0)
+        waiter = create_task(asgi._load("cancelled", None))
+        await sleep(0)
+        leader.cancel()
+        await sleep(0)
+        upstream["release"].set()
+        with pytest.raises(CancelledError):
+            await leader
+        return await wait_for(waiter, 1)
+
+    assert run(scenario())["id"] == "cancelled"
+    assert upstream["calls"] == 2
+
+
+def test_waiters_retry_when_the_leaders_budget_runs_out(upstream):
+
+    async def scenario():
+        upstream["fail"].append(DeadlineExceeded("leader budget spent"))
+        leader = create_task(asgi._load("budget", None))
+        waiter = create_task(asgi._load("budget", None))
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        return await wait_for(waiter, 1)
+
+    assert run(scenario())["id"] == "budget"
+    assert upstream["calls"] == 2
+
+
+def test_waiters_give_up_at_their_own_deadline(upstream):
+
+    async def scenario():
+        upstream["release"] = Event()
+        leader = create_task(asgi._load("slow", None))
+        await sleep(0)
+        with deadline_scope(Deadline(0.05)), pytest.raises(
+                DeadlineExceeded):
+            await asgi._load("slow", None)
+        upstream["release"].set()
+        return await leader
+
+    assert run(scenario())["id"] == "slow"
+
+
+@pytest.mark.usefixtures("upstream")
+def test_head_response_has_headers_but_no_body():
+    status, headers, body = run(call("/get", "replit_id=head", "HEAD"))
+    assert status == 200
+    assert int(headers["content-length"]) > 0
+    assert headers["etag"]
+    assert body == b""
+
+
+def test_open_breaker_answers_503_with_retry_after(upstream, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    monkeypatch.setattr(asgi, "breaker", breaker)
+    status, headers, _ = run(call("/get", "replit_id=open-breaker"))
+    assert status == 503
+    assert 0 < int(headers["retry-after"]) <= 31
+    assert upstream["calls"] == 0
+
+
+def test_lookup_promotes_records_from_the_persistent_store(
+        upstream, monkeypatch, tmp_path):
+    store = PersistentStore(str(tmp_path / "records.db"))
+    store.write(record_key("stored"), dict(RECORD, id="stored"))
+    monkeypatch.setattr(asgi.cache, "store", store)
+    fields = normalize_fields(["title"])
+    assert run(asgi.lookup("stored", fields)) == {"title": "Stub"}
+    assert upstream["calls"] == 0
+    assert asgi.cache.store_hits >= 1
+
+
+@pytest.mark.usefixtures("upstream")
+def test_server_timing_follows_the_switch(monkeypatch):
+    _, headers, _ = run(call("/get", "replit_id=timed"))
+    names = [
+        entry.split(";")[0]
+        for entry in headers["server-timing"].split(", ")
+    ]
+    assert names[0] == "parse" and names[-1] == "total"
+    monkeypatch.setattr(config, "SERVER_TIMING", False)
+    _, headers, _ = run(call("/get", "replit_id=timed"))
+    assert "server-timing" not in headers
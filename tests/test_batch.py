@@ -0,0 +1,56 @@
+"""Tests for validating and answering multi-ID lookups."""
+
+import pytest
+
+import codec
+
+
+@pytest.mark.parametrize("body", [[1, 2], "ids", 3, None])
+def test_batch_body_must_be_an_object(app, body):
+    response = app.post("/batch", json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "body must be a JSON object"}
+
+
+def test_batch_ids_must_be_strings(app):
+    response = app.post("/batch", json={"ids": ["a", 1]})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_batch_resolves_every_id(app):
+    response = app.post("/batch", json={"ids": ["a", "b"], "fields": "id"})
+    assert response.status_code == 200
+    assert codec.loads(response.data) == {
+        "data": {
+            "a": {
+                "id": "a"
+            },
+            "b": {
+                "id": "b"
+            }
+        },
+        "errors": {},
+    }
+
+
+@pytest.mark.parametrize("replit_id", [",", " , ,"])
+def test_comma_list_without_ids_is_rejected(app, replit_id):
+    response = app.get("/get", query_string={"replit_id": replit_id})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "replit_id is required"}
+
+
+@pytest.mark.parametrize("body", [["a"], "a", None])
+def test_stream_body_must_be_an_object(app, body):
+    response = app.post("/stream", json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "body must be a JSON object"}
+
+
+def test_stream_sends_one_line_per_id(app):
+    response = app.post("/stream", json={"ids": ["a", "b"], "title": True})
+    assert response.mimetype == "application/x-ndjson"
+    lines = [codec.loads(line) for line in response.data.splitlines()]
+    assert sorted(line["id"] for line in lines) == ["a", "b"]
+    assert all(isinstance(line["data"], str) for line in lines)
@@ -0,0 +1,133 @@
+"""Tests for the upstream circuit breaker."""
+
+import pytest
+
+import breaker as breaker_module
+import main
+import upstream
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from deadline import DeadlineExceeded
+from upstream import (
+    UpstreamClient,
+    UpstreamError,
+    UpstreamStatusError,
+    UpstreamTimeout,
+)
+
+
+def fail(error):
+
+    def fn():
+        raise error
+
+    return fn
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setattr(breaker_module, "monotonic", clock)
+    return CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+
+def test_opens_after_consecutive_failures(breaker, clock):
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail(ConnectionError("refused")))
+    assert breaker.state == OPEN
+    clock.advance(10)
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.call(lambda: "never called")
+    assert rejected.value.retry_after == 20
+    assert (breaker.trips, breaker.rejected) == (1, 1)
+
+
+def test_success_resets_the_failure_count(breaker):
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail(ConnectionError("refused")))
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(ConnectionError):
+        breaker.call(fail(ConnectionError("refused")))
+    assert breaker.state == CLOSED
+
+
+def test_half_open_trial_closes_or_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30)
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_failure()
+    assert (breaker.state, breaker.trips) == (OPEN, 2)
+    clock.advance(30)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.parametrize("error", [
+    DeadlineExceeded("request budget of 0.000s exceeded"),
+    UpstreamError("Repl not found"),
+])
+def test_client_and_per_id_errors_never_open_it(breaker, error):
+    for _ in range(10):
+        with pytest.raises(type(error)):
+            breaker.call(fail(error))
+    assert (breaker.state, breaker.failures, breaker.trips) == (CLOSED, 0, 0)
+
+
+@pytest.mark.parametrize("error", [
+    UpstreamStatusError(502),
+    UpstreamTimeout("upstream timed out"),
+    ConnectionError("refused"),
+])
+def test_upstream_failures_open_it(breaker, error):
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            breaker.call(fail(error))
+    assert breaker.state == OPEN
+
+
+def test_budget_timeout_on_the_trial_frees_the_trial(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30)
+    with pytest.raises(DeadlineExceeded):
+        breaker.call(fail(DeadlineExceeded("budget spent")))
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_client_budget_timeouts_never_open_the_breaker(app, upstream_stub):
+    upstream_stub.options.latency = 200.0
+    for i in range(5):
+        for budget in ("0", "20"):
+            response = app.get(f"/get?replit_id=budget-{budget}-{i}",
+                               headers={"X-Request-Timeout-Ms": budget})
+            assert response.status_code == 504
+    assert main.breaker.stats()["state"] == CLOSED
+    assert main.breaker.stats()["trips"] == 0
+    upstream_stub.options.latency = 0.0
+    assert app.get("/get?replit_id=after-budget").status_code == 200
+
+
+def test_upstream_errors_open_the_breaker(app, upstream_stub):
+    upstream_stub.options.error_rate = 1.0
+    for i in range(3):
+        assert app.get(f"/get?replit_id=down-{i}").status_code == 500
+    response = app.get("/get?replit_id=down-3")
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_server_limit_timeouts_count_as_failures(upstream_stub):
+    upstream_stub.options.latency = 200.0
+    client = UpstreamClient(url=upstream_stub.url,
+                            hedge=False,
+                            retries=0,
+                            read_timeout=0.02)
+    with pytest.raises(UpstreamTimeout) as timed_out:
+        client.query({"query": "query { repl { id } }", "variables": {}})
+    assert upstream.is_upstream_failure(timed_out.value)
+    client.close()
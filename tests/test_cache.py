@@ -0,0 +1,128 @@
+"""Tests for the in-process TTL + LRU cache."""
+
+from threading import Event
+
+import pytest
+
+import cache as cache_module
+from cache import TTLCache
+
+
+@pytest.fixture
+def make_cache(monkeypatch, clock):
+    monkeypatch.setattr(cache_module, "monotonic", clock)
+    caches = []
+
+    def make(**kwargs):
+        kwargs.setdefault("ttl", 10)
+        kwargs.setdefault("stale_ttl", 5)
+        caches.append(TTLCache(**kwargs))
+        return caches[-1]
+
+    yield make
+    for cache in caches:
+        cache._executor.shutdown(wait=True)
+
+
+def test_entry_is_fresh_then_stale_then_gone(make_cache, clock):
+    cache = make_cache()
+    cache.set("a", {"x": 1})
+    assert cache.get("a").value == {"x": 1}
+    clock.advance(10)
+    assert cache.get("a") is None
+    assert cache.get("a", stale=True).value == {"x": 1}
+    clock.advance(5)
+    assert cache.get("a", stale=True) is None
+    assert cache.expirations == 1
+    assert len(cache) == 0
+
+
+def test_negative_ttl_stores_an_already_stale_entry(make_cache):
+    cache = make_cache()
+    cache.set("a", 1, ttl=-1)
+    assert cache.get("a") is None
+    assert cache.get("a", stale=True).value == 1
+
+
+def test_least_recently_used_entry_is_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a").value == 1
+    assert cache.get("c").value == 3
+    assert cache.evictions == 1
+
+
+def test_byte_budget_evicts_and_rejects_oversized_values(make_cache):
+    cache = make_cache(max_bytes=25)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") is None
+    assert cache.bytes <= 25
+    assert cache.set("c", "z" * 100) is None
+    assert cache.get("b") is not None
+
+
+def test_get_or_load_counts_hits_and_misses(make_cache):
+    cache = make_cache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"x": len(calls)}
+
+    assert cache.get_or_load("a", loader) == {"x": 1}
+    assert cache.get_or_load("a", loader) == {"x": 1}
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_missing_values_are_not_cached(make_cache):
+    cache = make_cache()
+    assert cache.get_or_load("a", lambda: None) is None
+    assert cache.get("a", stale=True) is None
+
+
+def test_stale_entry_is_served_while_refreshed(make_cache, clock):
+    cache = make_cache()
+    cache.set("a", {"v": "old"})
+    clock.advance(11)
+    assert cache.get_or_load("a", lambda: {"v": "new"}) == {"v": "old"}
+    cache._executor.shutdown(wait=True)
+    assert cache.get("a").value == {"v": "new"}
+    assert (cache.stale_hits, cache.refreshes) == (1, 1)
+
+
+def test_failed_refresh_keeps_the_stale_copy(make_cache, clock):
+    cache = make_cache()
+    cache.set("a", 1)
+    clock.advance(11)
+
+    def loader():
+        raise RuntimeError("upstream down")
+
+    assert cache.get_or_load("a", loader) == 1
+    cache._executor.shutdown(wait=True)
+    assert cache.refresh_errors == 1
+    assert cache.get("a", stale=True).value == 1
+
+
+def test_concurrent_stale_reads_refresh_once(make_cache, clock):
+    cache = make_cache()
+    cache.set("a", 1)
+    clock.advance(11)
+    release, calls = Event(), []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return 2
+
+    for _ in range(5):
+        assert cache.get_or_load("a", loader) == 1
+    release.set()
+    cache._executor.shutdown(wait=True)
+    assert len(calls) == 1
@@ -0,0 +1,17 @@
+"""Tests for record/replay cassettes."""
+
+from cassette import CassetteReader, CassetteRecorder
+
+PAYLOAD = {"query": "query { repl { id } }", "variables": {"id": "a"}}
+
+
+def test_recorded_responses_replay_after_close(tmp_path):
+    path = str(tmp_path / "upstream.cassette")
+    with CassetteRecorder(path) as recorder:
+        recorder.record(PAYLOAD, b'{"data":{"repl":null}}', 0.25)
+    recorder.record(PAYLOAD, b"ignored once closed", 0.0)
+    reader = CassetteReader(path)
+    body, latency = reader.lookup(PAYLOAD)
+    assert bytes(body) == b'{"data":{"repl":null}}'
+    assert latency == 0.25
+    assert reader.lookup({**PAYLOAD, "variables": {"id": "b"}}) is None
@@ -0,0 +1,95 @@
+"""Tests for single-flight coalescing."""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import sleep
+
+import pytest
+
+from coalesce import SingleFlight
+from deadline import DeadlineExceeded
+
+
+def wait_until(predicate):
+    for _ in range(500):
+        if predicate():
+            return
+        sleep(0.01)
+    raise AssertionError("condition never became true")
+
+
+def wait_for_followers(flight, count):
+    wait_until(lambda: flight.coalesced >= count)
+
+
+def test_concurrent_callers_share_one_call():
+    flight, release, calls = SingleFlight(), Event(), []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"id": "a"}
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.do, "a", fetch, 5) for _ in range(4)]
+        wait_for_followers(flight, 3)
+        release.set()
+        results = [future.result() for future in futures]
+    assert results == [{"id": "a"}] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {
+        "calls": 1,
+        "coalesced": 3,
+        "retries": 0,
+        "inflight": 0,
+    }
+
+
+def test_followers_share_the_leaders_error():
+    flight, release = SingleFlight(), Event()
+
+    def fetch():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(flight.do, "a", fetch, 5) for _ in range(2)]
+        wait_for_followers(flight, 1)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="upstream down"):
+                future.result()
+
+
+def test_followers_retry_when_the_leaders_budget_runs_out():
+    flight, release, calls = SingleFlight(), Event(), []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            raise DeadlineExceeded("request budget of 0.001s exceeded")
+        return "value"
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "a", fetch, 5)
+        wait_until(lambda: calls)
+        follower = pool.submit(flight.do, "a", fetch, 5)
+        wait_for_followers(flight, 1)
+        release.set()
+        with pytest.raises(DeadlineExceeded):
+            leader.result()
+        assert follower.result() == "value"
+    assert len(calls) == 2
+    assert flight.retries == 1
+
+
+def test_follower_gives_up_after_its_own_timeout():
+    flight, release = SingleFlight(), Event()
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(flight.do, "a", lambda: release.wait(5), 5)
+        wait_until(lambda: flight.stats()["inflight"])
+        with pytest.raises(TimeoutError):
+            flight.do("a", lambda: None, 0.05)
+        release.set()
+        assert leader.result() is True
@@ -0,0 +1,57 @@
+"""Tests for the JSON codec and its pre-encoded documents."""
+
+import sys
+from importlib.util import module_from_spec, spec_from_file_location
+
+import pytest
+
+import codec
+import main
+
+
+@pytest.fixture
+def fallback(monkeypatch):
+    """Load a separate copy of ``codec`` as if orjson were missing."""
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    spec = spec_from_file_location("codec_fallback", codec.__file__)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_fallback_matches_the_compact_output(fallback):
+    value = {"b": [1, 2.5, None, True], "a": "é", "c": {}}
+    assert fallback.NAME == "json"
+    assert fallback.dumps(value) == codec.dumps(value)
+    assert fallback.dumps_sorted(value) == codec.dumps_sorted(value)
+    assert fallback.dumps_sorted(value).startswith(b'{"a":"\xc3\xa9"')
+    assert fallback.loads(memoryview(fallback.dumps(value))) == value
+
+
+def test_fallback_passes_documents_through(fallback):
+    found = fallback.loads_document(b'{"a": 1}')
+    assert isinstance(found, fallback.Document)
+    assert fallback.dumps(found) == b'{"a": 1}'
+
+
+def test_loads_document_round_trips():
+    raw = codec.dumps({"title": "t", "owner": {"id": 1}})
+    found = codec.loads_document(memoryview(raw))
+    assert isinstance(found, codec.Document)
+    assert found == {"title": "t", "owner": {"id": 1}}
+    assert found.raw == raw and type(found.raw) is bytes
+    assert codec.dumps(found) is found.raw
+
+
+def test_document_leaves_non_objects_alone():
+    assert codec.document([1], b"[1]") == [1]
+    assert codec.loads_document(b'"t"') == "t"
+    # A copy of a document is encoded afresh
+    assert codec.dumps(dict(codec.document({"a": 1}, b"stale"))) == b'{"a":1}'
+
+
+def test_json_response_sends_the_encoded_form():
+    found = codec.document({"a": 1}, b'{ "a" : 1 }')
+    response = main.json_response(found)
+    assert response.mimetype == "application/json"
+    assert response.data == b'{ "a" : 1 }'
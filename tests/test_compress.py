@@ -0,0 +1,95 @@
+"""Tests for Accept-Encoding negotiation and the compressed body store."""
+
+from gzip import decompress
+
+import pytest
+
+import compress
+import config
+from compress import CompressionStore, negotiate, select_encoding
+
+
+@pytest.fixture
+def encoders(monkeypatch):
+    """Make every encoding available, each tagging the body it encodes."""
+    monkeypatch.setattr(
+        compress, "ENCODERS", {
+            name: lambda body, name=name: name.encode() + b":" + body
+            for name in ("br", "zstd", "gzip")
+        })
+
+
+@pytest.mark.usefixtures("encoders")
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("gzip;q=1, br;q=0.5", "gzip"),
+    ("br;q=0, zstd;q=0.1", "zstd"),
+    ("*", "br"),
+    ("*;q=0.5, gzip", "gzip"),
+    ("br;q=0, zstd;q=0, *", "gzip"),
+    ("identity;q=0", None),
+    ("identity;q=0, gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=bogus", None),
+    ("deflate", None),
+])
+def test_negotiate_honours_q_values(accept_encoding, expected):
+    assert negotiate(accept_encoding) == expected
+
+
+def test_unavailable_encodings_are_never_picked(monkeypatch):
+    monkeypatch.setattr(compress, "ENCODERS",
+                        {"gzip": compress.ENCODERS["gzip"]})
+    assert negotiate("br, zstd;q=0.9, gzip;q=0.1") == "gzip"
+
+
+def test_small_bodies_are_sent_as_is(monkeypatch):
+    monkeypatch.setattr(config, "COMPRESS_MIN_SIZE", 100)
+    assert select_encoding(99, "gzip") is None
+    assert select_encoding(100, "gzip") == "gzip"
+    monkeypatch.setattr(config, "COMPRESS_ENABLED", False)
+    assert select_encoding(100, "gzip") is None
+
+
+@pytest.mark.usefixtures("encoders")
+def test_store_reuses_compressed_bodies():
+    store = CompressionStore(max_bytes=100)
+    assert store.compress(b"body", "gzip") == b"gzip:body"
+    assert store.compress(b"body", "gzip") == b"gzip:body"
+    assert store.compress(b"body", "br") == b"br:body"
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    assert stats["bytes"] == len(b"gzip:body") + len(b"br:body")
+
+
+@pytest.mark.usefixtures("encoders")
+def test_store_evicts_least_recently_used_bodies():
+    store = CompressionStore(max_bytes=20)
+    store.compress(b"aaaa", "gzip")
+    store.compress(b"bbbb", "gzip")
+    store.compress(b"aaaa", "gzip")
+    store.compress(b"cccc", "gzip")
+    assert (store.stats()["entries"], store.bytes) == (2, 18)
+    store.compress(b"aaaa", "gzip")
+    store.compress(b"bbbb", "gzip")
+    assert (store.hits, store.misses) == (2, 4)
+    # Bodies larger than the whole store are compressed but not kept
+    assert store.compress(b"x" * 20, "gzip") == b"gzip:" + b"x" * 20
+    assert (store.stats()["entries"], store.bytes) == (2, 18)
+
+
+def test_responses_vary_on_accept_encoding(app):
+    full = app.get("/get?replit_id=enc", headers={"Accept-Encoding": "gzip"})
+    assert full.headers["Content-Encoding"] == "gzip"
+    assert full.headers["Vary"] == "Accept-Encoding"
+    identity = app.get("/get?replit_id=enc")
+    assert "Content-Encoding" not in identity.headers
+    assert identity.headers["Vary"] == "Accept-Encoding"
+    assert decompress(full.data) == identity.data
+    title = app.get("/get?replit_id=enc&title",
+                    headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in title.headers
+    assert title.headers["Vary"] == "Accept-Encoding"
@@ -0,0 +1,40 @@
+"""Tests for request deadline budgets."""
+
+import pytest
+
+import config
+import deadline
+from deadline import BUDGET_HEADER, Deadline, DeadlineExceeded
+
+
+@pytest.fixture(autouse=True)
+def budgets(monkeypatch, clock):
+    monkeypatch.setattr(deadline, "monotonic", clock)
+    monkeypatch.setattr(config, "REQUEST_BUDGET", 5.0)
+    monkeypatch.setattr(config, "REQUEST_BUDGET_MAX", 30.0)
+
+
+@pytest.mark.parametrize("value, budget", [
+    (None, 5.0),
+    ("250", 0.25),
+    ("-10", 0.0),
+    ("99999999", 30.0),
+    ("soon", 5.0),
+    ("nan", 5.0),
+    ("NaN", 5.0),
+    ("inf", 5.0),
+    ("-inf", 5.0),
+])
+def test_budget_header_is_parsed_and_clamped(value, budget):
+    headers = {} if value is None else {BUDGET_HEADER: value}
+    assert Deadline.from_headers(headers).budget == budget
+
+
+def test_timeouts_are_clamped_to_what_is_left(clock):
+    limit = Deadline(2.0)
+    clock.advance(1.5)
+    assert limit.timeouts(3.0, 0.2) == (0.5, 0.2)
+    clock.advance(0.5)
+    assert limit.expired
+    with pytest.raises(DeadlineExceeded):
+        limit.timeouts()
@@ -0,0 +1,146 @@
+"""Tests for conditional GET and merge-patch delta responses on /get."""
+
+import pytest
+import stub_upstream
+
+import codec
+import conditional
+import main
+from conditional import record_etag
+from delta import MEDIA_TYPE, VersionStore, merge_patch, parse_version
+
+
+def apply_patch(target, patch):
+    # RFC 7396 application, to check patches round-trip
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_patch(result.get(key), value)
+    return result
+
+
+def test_merge_patch_diffs_objects_and_replaces_the_rest():
+    old = {"a": 1, "b": {"c": 1, "d": 2}, "e": [1], "gone": True}
+    new = {"a": 1, "b": {"c": 2, "d": 2}, "e": [1, 2], "added": "x"}
+    patch = merge_patch(old, new)
+    assert patch == {"b": {"c": 2}, "e": [1, 2], "added": "x", "gone": None}
+    assert apply_patch(old, patch) == new
+    assert merge_patch(new, new) == {}
+
+
+@pytest.mark.parametrize("token", ['abc', '"abc"', 'W/"abc"', '"abc-gzip"'])
+def test_version_tokens_name_the_identity_representation(token):
+    assert parse_version(token) == "abc"
+
+
+def test_version_store_diffs_against_known_versions():
+    store = VersionStore(max_entries=2, versions=2)
+    assert store.update("k", "v1", {"n": 1}) is None
+    assert store.update("k", "v2", {"n": 2}, since='"v1"') == {"n": 2}
+    assert store.update("k", "v2", {"n": 2}, since="v2") == {}
+    store.update("k", "v3", {"n": 3})
+    # Only the two newest versions are kept
+    assert store.update("k", "v3", {"n": 3}, since="v1") is None
+    stats = store.stats()
+    assert (stats["deltas"], stats["current"], stats["unknown"]) == (1, 1, 1)
+
+
+@pytest.fixture
+def changing_record(monkeypatch, clock):
+    """Let a test change the stub's record between lookups.
+
+    Issued validators stop answering revalidations on their own once the
+    change is made.
+    """
+    monkeypatch.setattr(conditional, "monotonic", clock)
+
+    def change(**fields):
+        monkeypatch.setattr(stub_upstream, "RECORD",
+                            dict(stub_upstream.RECORD, **fields))
+        main.cache.clear()
+        clock.advance(main.validators.freshness)
+
+    return change
+
+
+def test_matching_etag_is_not_modified(app):
+    first = app.get("/get?replit_id=etag-a")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    bare = etag.strip('"')
+    assert bare == record_etag(codec.loads(first.data))
+    for tag in (etag, f"W/{etag}", f'"{bare}-gzip"', "*"):
+        again = app.get("/get?replit_id=etag-a",
+                        headers={"If-None-Match": tag})
+        assert again.status_code == 304
+        assert again.data == b""
+        assert again.headers["ETag"] == etag
+    other = app.get("/get?replit_id=etag-a",
+                    headers={"If-None-Match": '"other"'})
+    assert other.status_code == 200
+
+
+def test_recent_etag_is_answered_without_a_lookup(app, upstream_stub):
+    etag = app.get("/get?replit_id=etag-r").headers["ETag"]
+    short_circuits = main.validators.short_circuits
+    upstream_stub.options.error_rate = 1.0
+    response = app.get("/get?replit_id=etag-r",
+                       headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert main.validators.short_circuits == short_circuits + 1
+
+
+def test_changed_record_is_not_matched(app, changing_record):
+    etag = app.get("/get?replit_id=etag-b").headers["ETag"]
+    changing_record(likeCount=10_000)
+    response = app.get("/get?replit_id=etag-b",
+                       headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert codec.loads(response.data)["likeCount"] == 10_000
+
+
+def test_since_an_older_version_sends_a_merge_patch(app, changing_record):
+    first = app.get("/get?replit_id=delta-a")
+    old = codec.loads(first.data)
+    changing_record(likeCount=old["likeCount"] + 1, title="renamed")
+    current = app.get("/get?replit_id=delta-a").data
+    changing_record(likeCount=old["likeCount"] + 2, title="renamed")
+    response = app.get("/get?replit_id=delta-a&since=" +
+                       first.headers["ETag"])
+    assert response.status_code == 200
+    assert response.mimetype == MEDIA_TYPE
+    patch = codec.loads(response.data)
+    assert patch == {"likeCount": old["likeCount"] + 2, "title": "renamed"}
+    new = apply_patch(old, patch)
+    assert response.headers["ETag"].strip('"') == record_etag(new)
+    assert new != codec.loads(current)
+
+
+def test_since_the_current_version_sends_an_empty_patch(app):
+    etag = app.get("/get?replit_id=delta-b").headers["ETag"]
+    response = app.get(f"/get?replit_id=delta-b&since={etag}")
+    assert response.status_code == 200
+    assert response.mimetype == MEDIA_TYPE
+    assert codec.loads(response.data) == {}
+    assert response.headers["ETag"] == etag
+
+
+def test_since_with_a_matching_validator_is_not_modified(app):
+    etag = app.get("/get?replit_id=delta-d").headers["ETag"]
+    response = app.get(f"/get?replit_id=delta-d&since={etag}",
+                       headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_since_an_unknown_version_sends_the_full_record(app):
+    full = app.get("/get?replit_id=delta-c")
+    response = app.get("/get?replit_id=delta-c&since=unknown")
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert response.data == full.data
@@ -0,0 +1,129 @@
+"""Tests for the count-min sketch and background refresh of hot IDs."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cache as cache_module
+import hotset
+import records as records_module
+from cache import TTLCache
+from hotset import CountMinSketch, HotRefresher
+from records import RecordCache, record_key
+
+
+class Upstream:
+    """Batched fetch answering from a script of records and errors."""
+
+    def __init__(self) -> None:
+        self.records = {}
+        self.errors = {}
+        self.fail = False
+        self.calls = []
+
+    def __call__(self, replit_ids, fields):
+        self.calls.append((list(replit_ids), fields))
+        if self.fail:
+            raise ConnectionError("upstream down")
+        return ({
+            replit_id: self.records.get(replit_id)
+            for replit_id in replit_ids if replit_id not in self.errors
+        }, {
+            replit_id: self.errors[replit_id]
+            for replit_id in replit_ids if replit_id in self.errors
+        })
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+@pytest.fixture
+def refresher(monkeypatch, clock, upstream):
+    for module in (cache_module, records_module, hotset):
+        monkeypatch.setattr(module, "monotonic", clock)
+    cache = TTLCache(ttl=60, stale_ttl=30)
+    refresher = HotRefresher(RecordCache(cache),
+                             upstream,
+                             max_ids=8,
+                             min_hits=1,
+                             lead=10,
+                             interval=1,
+                             decay_interval=8,
+                             budget=1000,
+                             chunk_size=4)
+    refresher._pool = ThreadPoolExecutor(max_workers=1)
+    yield refresher
+    refresher._pool.shutdown(wait=True)
+    cache._executor.shutdown(wait=True)
+
+
+def scan(refresher):
+    # One scheduler tick, waiting for the refreshes it started
+    started = refresher.run_once()
+    refresher._pool.submit(lambda: None).result()
+    return started
+
+
+def test_sketch_never_undercounts_and_decays():
+    sketch = CountMinSketch(width=64)
+    for _ in range(6):
+        sketch.add("a")
+    sketch.add("b")
+    assert sketch.estimate("a") >= 6
+    assert sketch.estimate("b") >= 1
+    sketch.decay()
+    assert sketch.estimate("a") >= 3
+    assert sketch.estimate("a") <= sketch.add("a")
+
+
+def test_hot_id_without_a_record_is_fetched_whole(refresher, upstream):
+    refresher.hot = {"r": 5}
+    upstream.records["r"] = {"title": "t"}
+    assert scan(refresher) == 1
+    assert upstream.calls == [(["r"], None)]
+    assert refresher.records.cache.get(record_key("r")).value == {
+        "title": "t"
+    }
+    # Fresh for longer than the lead, so not due again
+    assert scan(refresher) == 0
+
+
+def test_failing_id_backs_off_exponentially(refresher, upstream, clock):
+    refresher.hot = {"r": 5}
+    upstream.errors["r"] = "boom"
+    polls = []
+    for _ in range(24):
+        polls.append(scan(refresher))
+        clock.advance(1)
+    # Retried after 1, 2, 4 and then every 8 seconds
+    assert [tick for tick, started in enumerate(polls) if started] == [
+        0, 1, 3, 7, 15, 23
+    ]
+    assert refresher.stats()["backing_off"] == 1
+    del upstream.errors["r"]
+    upstream.records["r"] = {"title": "t"}
+    clock.advance(8)
+    assert scan(refresher) == 1
+    assert refresher.stats()["backing_off"] == 0
+
+
+def test_failed_request_backs_off_every_id_in_it(refresher, upstream, clock):
+    refresher.hot = {"a": 5, "b": 5}
+    upstream.fail = True
+    assert scan(refresher) == 1
+    assert refresher.errors == 1
+    assert scan(refresher) == 0
+    upstream.fail = False
+    clock.advance(1)
+    assert scan(refresher) == 1
+    assert sorted(upstream.calls[-1][0]) == ["a", "b"]
+
+
+def test_missing_repl_stops_being_refreshed(refresher, upstream):
+    refresher.hot = {"r": 5}
+    assert scan(refresher) == 1
+    assert upstream.calls == [(["r"], None)]
+    assert refresher.hot == {}
+    assert refresher.stats()["backing_off"] == 0
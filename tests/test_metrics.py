@@ -0,0 +1,98 @@
+"""Tests for per-thread metric shards and the text exposition format."""
+
+from threading import Barrier, Thread
+
+from metrics import Counter, Gauge, Histogram, Registry, escape
+
+
+def in_threads(count, fn):
+    # Keeps every thread alive until all have recorded, so each gets a
+    # shard of its own
+    barrier = Barrier(count)
+
+    def run():
+        fn()
+        barrier.wait()
+
+    threads = [Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_shards_of_live_and_finished_threads_are_merged():
+    counter = Counter("c", "help", ("route", ))
+    threads = in_threads(4, lambda: counter.inc("/get", amount=2))
+    counter.inc("/get")
+    counter.inc("/batch")
+    for thread in threads:
+        thread.join()
+    assert counter.merged() == {("/get", ): 9, ("/batch", ): 1}
+    # Finished threads are folded in once, not on every scrape
+    assert counter.merged() == {("/get", ): 9, ("/batch", ): 1}
+    assert len(counter._shards) == 1
+
+
+def test_gauge_goes_down():
+    gauge = Gauge("g", "help")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.merged() == {(): 1}
+
+
+def test_histogram_shards_are_merged_bucket_by_bucket():
+    histogram = Histogram("h", "help", buckets=(1, 2))
+    for thread in in_threads(3, lambda: histogram.observe(1.5)):
+        thread.join()
+    histogram.observe(3)
+    assert histogram.merged() == {(): [0, 3, 1, 7.5]}
+
+
+def test_render_exposition_text():
+    registry = Registry()
+    counter = Counter("requests_total", "Requests handled", ("status", ),
+                      registry)
+    histogram = Histogram("duration_seconds",
+                          "Request time", ("route", ),
+                          registry,
+                          buckets=(0.5, 1))
+    counter.inc("200")
+    counter.inc("200")
+    histogram.observe(0.25, "/get")
+    histogram.observe(0.75, "/get")
+    histogram.observe(5, "/get")
+    registry.collector(lambda: [("up", "gauge", "Serving", 1),
+                                ("skipped", "gauge", "Unknown", None)])
+    assert registry.render() == "\n".join([
+        "# HELP requests_total Requests handled",
+        "# TYPE requests_total counter",
+        'requests_total{status="200"} 2',
+        "# HELP duration_seconds Request time",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{route="/get",le="0.5"} 1',
+        'duration_seconds_bucket{route="/get",le="1"} 2',
+        'duration_seconds_bucket{route="/get",le="+Inf"} 3',
+        'duration_seconds_sum{route="/get"} 6',
+        'duration_seconds_count{route="/get"} 3',
+        "# HELP up Serving",
+        "# TYPE up gauge",
+        "up 1",
+    ]) + "\n"
+
+
+def test_label_values_are_escaped():
+    assert escape('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+    counter = Counter("c", "help", ("path", ))
+    counter.inc('/x"\n')
+    assert list(counter.samples()) == [("c", '{path="/x\\"\\n"}', 1)]
+
+
+def test_metrics_endpoint_serves_the_registry(app):
+    app.get("/get?replit_id=m&title")
+    response = app.get("/metrics")
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+    assert "# TYPE replit_info_http_requests_total counter" in text
+    assert ('replit_info_http_requests_total'
+            '{route="/get",method="GET",status="200"}') in text
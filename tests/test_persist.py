@@ -0,0 +1,85 @@
+"""Tests for the SQLite store and the disk cache backend built on it."""
+
+from time import sleep
+
+import pytest
+
+import persist
+from persist import DiskCache, PersistentStore
+
+
+@pytest.fixture
+def make_cache(monkeypatch, tmp_path, wall_clock):
+    monkeypatch.setattr(persist, "time", wall_clock)
+    caches = []
+
+    def make(**kwargs):
+        store = PersistentStore(str(tmp_path / "cache.sqlite3"),
+                                compact_interval=kwargs.pop(
+                                    "compact_interval", 60))
+        kwargs.setdefault("ttl", 10)
+        kwargs.setdefault("stale_ttl", 5)
+        caches.append(DiskCache(store, **kwargs))
+        return caches[-1]
+
+    yield make
+    for cache in caches:
+        cache._executor.shutdown(wait=True)
+
+
+def rows(cache):
+    return cache.disk.usage(0)[0]
+
+
+def test_entries_are_shared_by_every_cache_on_the_file(make_cache):
+    make_cache().set(("a", None), {"x": 1})
+    entry = make_cache().get(("a", None))
+    assert entry.value == {"x": 1}
+    assert entry.size == len(b'{"x":1}')
+
+
+def test_clear_empties_the_file_for_every_cache(make_cache):
+    first, second = make_cache(), make_cache()
+    first.set(("a", None), {"x": 1})
+    assert second.stats()["entries"] == 1
+    assert second.stats()["bytes"] == len(b'{"x":1}')
+    second.clear()
+    assert len(first) == 0
+    assert first.get(("a", None)) is None
+
+
+def test_entry_is_fresh_then_stale_then_gone(make_cache, wall_clock):
+    cache = make_cache()
+    cache.set(("a", None), 1)
+    wall_clock.advance(10)
+    assert cache.get(("a", None)) is None
+    assert cache.get(("a", None), stale=True).value == 1
+    wall_clock.advance(5)
+    assert cache.get(("a", None), stale=True) is None
+    assert len(cache) == 0
+
+
+def test_values_read_back_from_disk_are_not_rewritten(make_cache):
+    cache = make_cache()
+    cache.set(("a", None), 1, persist=False)
+    assert cache.get(("a", None)) is None
+    assert cache.disk.writes == 0
+
+
+def test_store_keeps_entries_only_for_the_stale_window(make_cache):
+    assert make_cache(ttl=10, stale_ttl=5).disk.max_age == 15
+
+
+def test_writes_start_compaction_of_dead_entries(make_cache, wall_clock):
+    cache = make_cache(compact_interval=0.05)
+    cache.set(("old", None), 1)
+    wall_clock.advance(20)
+    cache.set(("new", None), 2)
+    # Rows are deleted before the compaction finishes and is counted
+    for _ in range(100):
+        if cache.disk.compactions and rows(cache) == 1:
+            break
+        sleep(0.02)
+    assert rows(cache) == 1
+    assert cache.disk.compactions >= 1
+    assert cache.get(("new", None)).value == 2
@@ -0,0 +1,120 @@
+"""Tests for pruning the ``Repl`` selection and rendering documents."""
+
+import pytest
+
+from query import (
+    REPL_FIELDS,
+    UnknownFieldError,
+    build_batch_query,
+    build_query,
+    normalize_fields,
+    project_tree,
+    render_selection,
+)
+
+
+def test_fields_are_split_deduplicated_and_sorted():
+    assert normalize_fields(["title,slug", " title ", "owner.id"]) == (
+        "owner.id",
+        "slug",
+        "title",
+    )
+    assert normalize_fields(None) is None
+    assert normalize_fields([",", ""]) is None
+
+
+@pytest.mark.parametrize("path", ["nope", "owner.nope", "title.id", "user"])
+def test_unknown_paths_are_rejected(path):
+    with pytest.raises(UnknownFieldError, match=f"unknown field: {path}"):
+        normalize_fields(["title", path])
+
+
+def test_nested_path_selects_only_that_leaf():
+    assert build_query(("owner.id", "title")) == "\n".join([
+        "query Repl($id: String) {",
+        "  repl(id: $id) {",
+        "    ... on Repl {",
+        "      title",
+        "      owner: user {",
+        "        id",
+        "      }",
+        "    }",
+        "  }",
+        "}",
+    ])
+
+
+@pytest.mark.parametrize("fields", [("owner", "owner.id"),
+                                    ("owner.id", "owner")])
+def test_parent_path_wins_over_its_children(fields):
+    assert project_tree(fields) == {"owner": REPL_FIELDS["owner"]}
+
+
+def test_sibling_paths_share_their_parent():
+    tree = project_tree(
+        normalize_fields(["config.domain", "config.isVnc", "origin.id"]))
+    assert render_selection(tree) == "\n".join([
+        "config {",
+        "  domain",
+        "  isVnc",
+        "}",
+        "origin {",
+        "  id",
+        "}",
+    ])
+
+
+def test_aliases_and_arguments_are_rendered():
+    tree = project_tree(
+        normalize_fields(
+            ["hostedUrlDev", "markdownDescription", "description"]))
+    assert render_selection(tree) == "\n".join([
+        "description(plainText: true)",
+        "hostedUrlDev: hostedUrl(dev: true)",
+        "markdownDescription: description(plainText: false)",
+    ])
+
+
+def test_full_record_selects_every_field():
+    document = build_query()
+    assert project_tree(None) is REPL_FIELDS
+    for expression, _ in REPL_FIELDS.values():
+        assert expression in document
+
+
+def test_batch_document_shares_one_fragment():
+    assert build_batch_query(2, ("owner", "owner.id", "slug")) == "\n".join([
+        "query Repls($id0: String, $id1: String) {",
+        "  r0: repl(id: $id0) { ...ReplFields }",
+        "  r1: repl(id: $id1) { ...ReplFields }",
+        "}",
+        "fragment ReplFields on Repl {",
+        "  owner: user {",
+        "    id",
+        "    username",
+        "  }",
+        "  slug",
+        "}",
+    ])
+
+
+@pytest.mark.parametrize("query", [
+    "replit_id=q&fields=nope",
+    "replit_id=q&fields=owner.nope",
+    "replit_id=q,r&fields=title.id",
+])
+def test_unknown_field_answers_400(app, query):
+    response = app.get(f"/get?{query}")
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("unknown field: ")
+
+
+def test_unknown_batch_field_answers_400(app):
+    response = app.post("/batch", json={"ids": ["a"], "fields": ["nope"]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "unknown field: nope"}
+
+
+def test_requested_fields_are_all_that_is_returned(app):
+    response = app.get("/get?replit_id=q&fields=owner.id&fields=slug")
+    assert set(response.get_json()) == {"owner", "slug"}
@@ -0,0 +1,119 @@
+"""Tests for answering field subsets from merged repl records."""
+
+import pytest
+
+import cache as cache_module
+import records as records_module
+from cache import TTLCache
+from query import (
+    REPL_FIELDS,
+    holds_more,
+    normalize_fields,
+    project_tree,
+    record_paths,
+)
+from records import RecordCache, record_key
+
+
+@pytest.fixture
+def records(monkeypatch, clock):
+    monkeypatch.setattr(cache_module, "monotonic", clock)
+    monkeypatch.setattr(records_module, "monotonic", clock)
+    cache = TTLCache(ttl=10, stale_ttl=5)
+    yield RecordCache(cache)
+    cache._executor.shutdown(wait=True)
+
+
+def fields(*paths):
+    return normalize_fields(paths)
+
+
+def no_fetch(wanted):
+    raise AssertionError(f"unexpected fetch of {wanted}")
+
+
+def test_subset_is_answered_from_a_wider_record(records):
+    records.store("r", fields("title", "slug"), {"title": "t", "slug": "s"})
+    assert records.get_or_load("r", fields("title"), no_fetch) == {
+        "title": "t"
+    }
+    assert records.subsumed_hits == 1
+    assert records.cache.hits == 1
+
+
+def test_exact_field_set_is_not_a_subsumed_hit(records):
+    records.store("r", fields("owner.id"), {"owner": {"id": 1}})
+    assert records.get_or_load("r", fields("owner.id"), no_fetch) == {
+        "owner": {
+            "id": 1
+        }
+    }
+    assert records.subsumed_hits == 0
+
+
+def test_nested_subset_counts_as_subsumed(records):
+    records.store("r", fields("owner"), {"owner": {"id": 1, "username": "u"}})
+    records.get_or_load("r", fields("owner.id"), no_fetch)
+    assert records.subsumed_hits == 1
+
+
+def test_missing_fields_are_fetched_and_merged(records, clock):
+    records.store("r", fields("title"), {"title": "t"})
+    expires_at = records.cache.get(record_key("r")).expires_at
+    clock.advance(3)
+    fetched = []
+
+    def fetch(wanted):
+        fetched.append(wanted)
+        return {"slug": "s"}
+
+    assert records.get_or_load("r", fields("slug"), fetch) == {"slug": "s"}
+    assert fetched == [("slug", )]
+    entry = records.cache.get(record_key("r"))
+    assert entry.value == {"title": "t", "slug": "s"}
+    assert entry.expires_at == expires_at
+    assert records.merges == 1
+
+
+def test_stores_racing_on_one_record_keep_both_fields(records):
+    # Both lookups missed before either stored its fetch
+    records.store("r", fields("title"), {"title": "t"})
+    records.store("r", fields("slug"), {"slug": "s"})
+    assert records.cache.get(record_key("r")).value == {
+        "title": "t",
+        "slug": "s",
+    }
+
+
+def test_record_covering_the_entry_replaces_it(records, clock):
+    records.store("r", fields("title"), {"title": "t"})
+    clock.advance(3)
+    records.store("r", fields("slug", "title"), {"title": "u", "slug": "s"})
+    entry = records.cache.get(record_key("r"))
+    assert entry.value == {"title": "u", "slug": "s"}
+    assert entry.expires_at == clock() + 10
+    assert records.merges == 0
+
+
+def test_pruned_tree_does_not_share_the_full_tree():
+    tree = project_tree(fields("owner", "owner.id"))
+    assert tree["owner"] == REPL_FIELDS["owner"]
+    assert tree["owner"][1] is not REPL_FIELDS["owner"][1]
+
+
+def test_record_paths_list_the_leaves_held():
+    record = {"owner": {"id": 1}, "domains": [{"domain": "d"}], "x": None}
+    assert record_paths(record) == {"owner.id", "domains.domain", "x"}
+
+
+def test_holds_more_compares_every_level():
+    record = {"owner": {"id": 1, "username": "u"}, "domains": [{"a": 1}]}
+    assert holds_more(record, {"owner": {"id": 1}})
+    assert holds_more(record, {
+        "owner": {
+            "id": 1,
+            "username": "u"
+        },
+        "domains": [{}]
+    })
+    assert not holds_more(record, record)
@@ -0,0 +1,90 @@
+"""Tests for the Redis-protocol cache backend against the stub server."""
+
+from socket import socket
+from threading import Thread
+
+import pytest
+import stub_redis
+from stub_redis import RespHandler, RespServer
+
+import rediscache
+from rediscache import RedisCache, RedisClient
+
+
+@pytest.fixture
+def redis_url():
+    server = RespServer(("127.0.0.1", 0), RespHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+    stub_redis.DATA.clear()
+
+
+@pytest.fixture
+def make_cache(monkeypatch, wall_clock):
+    monkeypatch.setattr(rediscache, "time", wall_clock)
+    caches = []
+
+    def make(url, **kwargs):
+        kwargs.setdefault("ttl", 10)
+        kwargs.setdefault("stale_ttl", 5)
+        caches.append(RedisCache(RedisClient(url, timeout=1), **kwargs))
+        return caches[-1]
+
+    yield make
+    for cache in caches:
+        cache._executor.shutdown(wait=True)
+
+
+def test_entries_are_shared_through_the_server(make_cache, redis_url):
+    make_cache(redis_url).set(("a", None), {"x": 1})
+    cache = make_cache(redis_url)
+    assert cache.get(("a", None)).value == {"x": 1}
+    assert len(cache) == 1
+    cache.clear()
+    assert cache.get(("a", None)) is None
+
+
+def test_entry_is_fresh_then_stale_then_gone(make_cache, redis_url,
+                                             wall_clock):
+    cache = make_cache(redis_url)
+    cache.set(("a", None), 1)
+    wall_clock.advance(10)
+    assert cache.get(("a", None)) is None
+    assert cache.get(("a", None), stale=True).value == 1
+    wall_clock.advance(5)
+    assert cache.get(("a", None), stale=True) is None
+    assert cache.expirations == 1
+
+
+def test_batch_lookup_returns_only_found_keys(make_cache, redis_url):
+    cache = make_cache(redis_url)
+    cache.set(("a", None), 1)
+    cache.set(("c", None), 3)
+    found = cache.get_entries([("a", None), ("b", None), ("c", None)])
+    assert {key: entry.value for key, entry in found.items()} == {
+        ("a", None): 1,
+        ("c", None): 3,
+    }
+
+
+def test_short_batch_reply_is_an_error_not_a_misread(make_cache, redis_url,
+                                                     monkeypatch):
+    cache = make_cache(redis_url)
+    cache.set(("a", None), 1)
+    monkeypatch.setattr(cache.client, "pipeline",
+                        lambda _commands: [[None]])
+    assert cache.get_entries([("a", None), ("b", None)]) == {}
+    assert cache.errors == 1
+
+
+def test_unreachable_server_degrades_to_misses(make_cache):
+    with socket() as closed:
+        closed.bind(("127.0.0.1", 0))
+        url = f"redis://127.0.0.1:{closed.getsockname()[1]}"
+    cache = make_cache(url)
+    assert cache.set(("a", None), 1).value == 1
+    assert cache.get(("a", None)) is None
+    assert cache.get_entries([("a", None)]) == {}
+    assert cache.errors == 3
@@ -0,0 +1,37 @@
+"""Tests for the production serve entry point."""
+
+import config
+import serve
+
+
+def parsed(argv, server):
+    options = serve.parse_args(argv)
+    options.server = server
+    return options
+
+
+def test_defaults_come_from_config(monkeypatch):
+    monkeypatch.delenv("REPLIT_INFO_SERVE_THREADS", raising=False)
+    options = parsed([], "gunicorn")
+    assert options.threads == config.SERVE_THREADS
+    assert options.timeout == config.SERVE_TIMEOUT
+    assert serve.ignored_options(options) == []
+
+
+def test_uvicorn_reports_gunicorn_only_options():
+    options = parsed(["--app", "asgi", "--threads", "4", "--preload"],
+                     "uvicorn")
+    assert serve.ignored_options(options) == ["threads", "preload"]
+
+
+def test_environment_settings_count_as_explicit(monkeypatch):
+    monkeypatch.setenv("REPLIT_INFO_SERVE_TIMEOUT", "30")
+    options = parsed(["--app", "asgi"], "uvicorn")
+    assert serve.ignored_options(options) == ["timeout"]
+
+
+def test_gunicorn_serves_asgi_with_the_uvicorn_worker_package():
+    options = parsed(["--app", "asgi", "--preload"], "gunicorn")
+    settings = serve.gunicorn_options(options)
+    assert settings["worker_class"] == "uvicorn_worker.UvicornWorker"
+    assert serve.ignored_options(options) == []
@@ -0,0 +1,130 @@
+"""Tests for the memory-mapped cache shared between worker processes."""
+
+from multiprocessing import get_context
+
+import pytest
+
+import sharedcache
+from sharedcache import (
+    HEADER,
+    MAGIC,
+    SEQUENCE,
+    SLOT,
+    SharedCache,
+    key_digest,
+)
+
+
+@pytest.fixture
+def make_cache(monkeypatch, tmp_path, clock, wall_clock):
+    monkeypatch.setattr(sharedcache, "time", wall_clock)
+    monkeypatch.setattr(sharedcache, "monotonic", clock)
+    caches = []
+
+    def make(**kwargs):
+        kwargs.setdefault("path", str(tmp_path / "cache.shm"))
+        kwargs.setdefault("ttl", 10)
+        kwargs.setdefault("stale_ttl", 5)
+        caches.append(SharedCache(**kwargs))
+        return caches[-1]
+
+    make.wall, make.clock = wall_clock, clock
+    yield make
+    for cache in caches:
+        cache._executor.shutdown(wait=True)
+
+
+def slot_of(cache, key):
+    digest = key_digest(key)
+    for at in cache._slots(digest):
+        if SLOT.unpack_from(cache._map, at)[1] == digest:
+            return at
+    raise KeyError(key)
+
+
+def test_value_is_shared_by_every_cache_on_the_file(make_cache):
+    first, second = make_cache(), make_cache()
+    first.set("a", {"x": [1, 2]})
+    entry = second.get("a")
+    assert entry.value == {"x": [1, 2]}
+    assert entry.expires_at == make_cache.clock() + 10
+    assert second.stats()["entries"] == 1
+
+
+def test_entry_is_fresh_then_stale_then_gone(make_cache):
+    cache = make_cache()
+    cache.set("a", 1)
+    make_cache.wall.advance(10)
+    assert cache.get("a") is None
+    assert cache.get("a", stale=True).value == 1
+    make_cache.wall.advance(5)
+    assert cache.get("a", stale=True) is None
+    assert cache.expirations == 1
+
+
+def test_expiry_survives_a_reboot(make_cache):
+    make_cache().set("a", 1)
+    # After a reboot the monotonic clock restarts near zero
+    make_cache.clock.now = 5.0
+    make_cache.wall.advance(60)
+    assert make_cache().get("a", stale=True) is None
+
+
+def test_slot_being_written_is_not_read(make_cache):
+    cache = make_cache()
+    cache.set("a", 1)
+    at = slot_of(cache, "a")
+    sequence = SEQUENCE.unpack_from(cache._map, at)[0]
+    SEQUENCE.pack_into(cache._map, at, sequence + 1)
+    assert cache.get("a") is None
+    SEQUENCE.pack_into(cache._map, at, sequence + 2)
+    assert cache.get("a").value == 1
+
+
+def test_overwritten_values_are_missed_not_misread(make_cache):
+    cache = make_cache(max_bytes=64)
+    for n in range(20):
+        cache.set(n, {"n": n})
+    assert cache.get(0) is None
+    assert cache.get(19).value == {"n": 19}
+    cache.clear()
+    assert cache.get(19) is None
+    assert len(cache) == 0
+
+
+def test_file_from_an_older_layout_is_reinitialized(make_cache, tmp_path):
+    cache = make_cache()
+    cache.set("a", 1)
+    cache._map[:HEADER.size] = HEADER.pack(
+        b"RISHMC1\0", cache.buckets, 8, cache.max_bytes)
+    cache._map.flush()
+    reopened = make_cache()
+    assert reopened.get("a") is None
+    assert (tmp_path / "cache.shm").read_bytes()[:len(MAGIC)] == MAGIC
+
+
+def write_values(path, count):
+    cache = SharedCache(path, max_bytes=4096, ttl=60)
+    for n in range(count):
+        cache.set(n % 7, {"n": n, "pad": "x" * (n % 50)})
+
+
+def test_reads_racing_a_writer_process_are_consistent(tmp_path):
+    path = str(tmp_path / "cache.shm")
+    cache = SharedCache(path, max_bytes=4096, ttl=60)
+    writer = get_context("fork").Process(target=write_values,
+                                         args=(path, 20000))
+    writer.start()
+    reads = 0
+    while writer.is_alive():
+        for key in range(7):
+            entry = cache.get(key)
+            if entry is not None:
+                value = entry.value
+                assert value["n"] % 7 == key
+                assert value["pad"] == "x" * (value["n"] % 50)
+                reads += 1
+    writer.join()
+    cache._executor.shutdown(wait=True)
+    assert writer.exitcode == 0
+    assert reads
@@ -0,0 +1,60 @@
+"""Tests for the Server-Timing phase breakdown."""
+
+import re
+
+import pytest
+
+import config
+import timing
+from timing import Timings, current_timings, phase, timing_scope
+
+ENTRY = re.compile(r"[a-z]+;dur=\d+\.\d")
+
+
+def test_phases_accumulate_and_end_with_the_total(monkeypatch):
+    clock = iter([0.0, 0.001, 0.003, 0.010, 0.0125, 0.020])
+    monkeypatch.setattr(timing, "perf_counter", lambda: next(clock))
+    timings = Timings()
+    token = current_timings.set(timings)
+    try:
+        with phase("lookup"):
+            pass
+        with phase("lookup"):
+            pass
+    finally:
+        current_timings.reset(token)
+    timings.add("encode", 0.00025)
+    assert timings.header() == "lookup;dur=4.5, encode;dur=0.2, total;dur=20.0"
+
+
+def test_phase_outside_a_scope_records_nothing():
+    with phase("lookup"):
+        pass
+    assert current_timings.get() is None
+
+
+def test_scope_is_off_with_the_switch(monkeypatch):
+    monkeypatch.setattr(config, "SERVER_TIMING", False)
+    with timing_scope() as timings:
+        assert timings is None
+        assert current_timings.get() is None
+    monkeypatch.setattr(config, "SERVER_TIMING", True)
+    with timing_scope() as timings:
+        assert current_timings.get() is timings
+    assert current_timings.get() is None
+
+
+def test_get_reports_its_phases(app):
+    response = app.get("/get?replit_id=timed")
+    entries = response.headers["Server-Timing"].split(", ")
+    assert all(ENTRY.fullmatch(entry) for entry in entries)
+    names = [entry.split(";")[0] for entry in entries]
+    assert {"parse", "encode"} <= set(names)
+    assert names[-1] == "total"
+    assert "Server-Timing" not in app.get("/stats").headers
+
+
+@pytest.mark.parametrize("path", ["/get?replit_id=untimed", "/stats"])
+def test_switch_turns_the_header_off(app, monkeypatch, path):
+    monkeypatch.setattr(config, "SERVER_TIMING", False)
+    assert "Server-Timing" not in app.get(path).headers
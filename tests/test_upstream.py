@@ -0,0 +1,138 @@
+"""Tests for the pooled upstream client's statistics and hedging."""
+
+from threading import Event, Lock, Timer
+
+import pytest
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+import config
+from deadline import Deadline, DeadlineExceeded, deadline_scope
+from upstream import LatencyWindow, UpstreamClient
+
+QUERY = {"query": "query { repl { id } }", "variables": {}}
+
+
+class StubAdapter(HTTPAdapter):
+    """Transport answering each attempt from a script instead of a socket.
+
+    Every attempt takes the next entry of ``script``: an ``Event`` the
+    attempt waits on before answering, an exception it raises, or None to
+    answer at once.
+    """
+
+    def __init__(self, *script) -> None:
+        super().__init__()
+        self.script = list(script)
+        self.attempts = 0
+        self._lock = Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            step = self.script[self.attempts] if self.attempts < len(
+                self.script) else None
+            self.attempts += 1
+            attempt = self.attempts
+        if isinstance(step, Event):
+            step.wait(kwargs["timeout"][1])
+        elif isinstance(step, Exception):
+            raise step
+        response = Response()
+        response.status_code = 200
+        response._content = b'{"data":{"repl":{"id":"%d"}}}' % attempt
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY", 0.01)
+    clients, held = [], []
+
+    def make(*script):
+        client = UpstreamClient(url="http://upstream.test",
+                                hedge=True,
+                                retries=0)
+        client.session.mount("http://", StubAdapter(*script))
+        for _ in range(config.HEDGE_MIN_SAMPLES):
+            client.latencies.add(0.001)
+        clients.append(client)
+        held.extend(step for step in script if isinstance(step, Event))
+        return client
+
+    yield make
+    for event in held:
+        event.set()
+    for client in clients:
+        client._hedge_executor.shutdown(wait=True)
+        client.close()
+
+
+def test_latency_quantiles_follow_the_window():
+    window = LatencyWindow(size=4)
+    assert window.quantile(0.5) is None
+    for seconds in (4, 1, 3, 2, 5):
+        window.add(seconds)
+    assert len(window) == 4
+    assert (window.quantile(0), window.quantile(0.5),
+            window.quantile(1)) == (1, 3, 5)
+
+
+def test_no_hedge_until_enough_latencies_are_seen():
+    client = UpstreamClient(url="http://upstream.test", hedge=True)
+    assert client.hedge_delay() is None
+    for _ in range(config.HEDGE_MIN_SAMPLES):
+        client.latencies.add(1.0)
+    assert client.hedge_delay() == 1.0
+    client._hedge_executor.shutdown(wait=True)
+    client.close()
+
+
+def test_fast_answer_is_not_hedged(make_client):
+    client = make_client(None)
+    assert client.query(QUERY) == {"data": {"repl": {"id": "1"}}}
+    assert (client.hedges, client.hedge_wins) == (0, 0)
+
+
+def test_slow_attempt_is_hedged_and_the_hedge_wins(make_client):
+    client = make_client(Event(), None)
+    assert client.query(QUERY) == {"data": {"repl": {"id": "2"}}}
+    stats = client.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_failed_hedge_waits_for_the_first_attempt(make_client):
+    slow = Event()
+    client = make_client(slow, ConnectionError("reset"))
+    # Answers well after the hedge was sent and failed
+    Timer(0.2, slow.set).start()
+    assert client.query(QUERY) == {"data": {"repl": {"id": "1"}}}
+    assert (client.hedges, client.hedge_wins) == (1, 0)
+
+
+def test_attempt_failing_before_the_hedge_delay_raises(make_client):
+    client = make_client(ConnectionError("first"), ConnectionError("second"))
+    with pytest.raises(ConnectionError, match="first"):
+        client.query(QUERY)
+    assert client.hedges == 0
+
+
+def test_hedged_attempts_stop_at_the_deadline(make_client):
+    client = make_client(Event(), Event())
+    with deadline_scope(Deadline(0.1)), pytest.raises(DeadlineExceeded):
+        client.query(QUERY)
+    assert (client.hedges, client.timeouts) == (1, 1)
+
+
+def test_pool_statistics_count_connection_reuse(upstream_stub):
+    client = UpstreamClient(url=upstream_stub.url, hedge=False, retries=0)
+    assert client.stats()["reuse_ratio"] == 0.0
+    for _ in range(4):
+        client.query(QUERY)
+    stats = client.stats()
+    assert (stats["pools"], stats["requests"]) == (1, 4)
+    assert (stats["connections_opened"], stats["idle_connections"]) == (1, 1)
+    assert stats["reuse_ratio"] == 0.75
+    assert stats["latency_p50"] is not None
+    assert stats["hedges"] == 0 and stats["hedge_delay"] is None
+    client.close()
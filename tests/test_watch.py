@@ -0,0 +1,158 @@
+"""Tests for polling watched repl IDs and publishing their changes."""
+
+from concurrent.futures import ThreadPoolExecutor
+from os import getpid
+from threading import Thread
+
+import pytest
+
+import watch
+from query import normalize_fields
+from watch import WatchHub
+
+
+class Upstream:
+    """Batched fetch answering from a script of records and errors."""
+
+    def __init__(self) -> None:
+        self.records = {}
+        self.errors = {}
+        self.fail = False
+        self.calls = []
+
+    def __call__(self, replit_ids, fields):
+        self.calls.append((list(replit_ids), fields))
+        if self.fail:
+            raise ConnectionError("upstream down")
+        return ({
+            replit_id: self.records.get(replit_id)
+            for replit_id in replit_ids if replit_id not in self.errors
+        }, {
+            replit_id: self.errors[replit_id]
+            for replit_id in replit_ids if replit_id in self.errors
+        })
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+@pytest.fixture
+def hub(monkeypatch, clock, upstream):
+    monkeypatch.setattr(watch, "monotonic", clock)
+    hub = WatchHub(upstream,
+                   interval=5,
+                   min_interval=1,
+                   max_interval=60,
+                   chunk_size=4)
+    # Polled by hand instead of by the scheduler thread
+    hub._pool = ThreadPoolExecutor(max_workers=1)
+    hub._thread, hub._thread_pid = Thread(), getpid()
+    yield hub
+    hub._pool.shutdown(wait=True)
+
+
+def scan(hub):
+    # One scheduler tick, waiting for the polls it started
+    started = hub.poll_once()
+    hub._pool.submit(lambda: None).result()
+    return started
+
+
+def run(hub, clock, seconds, tick=0.25):
+    ticks = []
+    for i in range(int(seconds / tick)):
+        if scan(hub):
+            ticks.append(i * tick)
+        clock.advance(tick)
+    return ticks
+
+
+def test_snapshot_then_changes_of_watched_fields(hub, upstream):
+    upstream.records["r"] = {"title": "a", "likeCount": 1}
+    subscription = hub.subscribe(["r"], normalize_fields(["likeCount"]))
+    assert scan(hub) == 1
+    assert subscription.drain() == [("snapshot", {
+        "id": "r",
+        "data": {
+            "likeCount": 1
+        }
+    })]
+    upstream.records["r"] = {"title": "b", "likeCount": 2}
+    hub._watched["r"].due_at = 0
+    scan(hub)
+    assert subscription.drain() == [("change", {
+        "id": "r",
+        "changes": {
+            "likeCount": {
+                "old": 1,
+                "new": 2
+            }
+        }
+    })]
+    # Grown by half after the snapshot, halved after the change
+    assert hub._watched["r"].interval == 5 * 1.5 / 2
+
+
+def test_interval_grows_while_nothing_changes(hub, upstream, clock):
+    upstream.records["r"] = {"likeCount": 1}
+    hub.subscribe(["r"], normalize_fields(["likeCount"]))
+    assert run(hub, clock, 20) == [0, 7.5, 18.75]
+    assert hub._watched["r"].interval == 5 * 1.5**3
+
+
+def test_failing_id_backs_off_and_reports_once(hub, upstream, clock):
+    upstream.errors["r"] = "repl unavailable"
+    subscription = hub.subscribe(["r"], normalize_fields(["title"]))
+    # Retried after 1, 2 and 4 seconds, then at its 5 second interval
+    assert run(hub, clock, 20) == [0, 1, 3, 7, 12, 17]
+    assert subscription.drain() == [("error", {
+        "id": "r",
+        "error": "repl unavailable"
+    })]
+    stats = hub.stats()
+    assert stats["failing_ids"] == 1
+    assert stats["mean_interval"] == 5
+    del upstream.errors["r"]
+    upstream.records["r"] = {"title": "t"}
+    clock.advance(5)
+    scan(hub)
+    assert subscription.drain() == [("snapshot", {
+        "id": "r",
+        "data": {
+            "title": "t"
+        }
+    })]
+    assert hub.stats()["failing_ids"] == 0
+
+
+def test_failed_request_backs_off_every_id(hub, upstream, clock):
+    upstream.fail = True
+    subscription = hub.subscribe(["a", "b"])
+    assert run(hub, clock, 4) == [0, 1, 3]
+    assert hub.errors == 3
+    events = subscription.drain()
+    assert sorted(events, key=lambda event: event[1]["id"]) == [
+        ("error", {
+            "id": "a",
+            "error": "upstream down"
+        }),
+        ("error", {
+            "id": "b",
+            "error": "upstream down"
+        }),
+    ]
+
+
+def test_wider_subscription_is_polled_at_once(hub, upstream):
+    upstream.records["r"] = {"title": "t", "slug": "s"}
+    hub.subscribe(["r"], normalize_fields(["title"]))
+    scan(hub)
+    assert upstream.calls[-1] == (["r"], ("title", ))
+    wider = hub.subscribe(["r"], normalize_fields(["slug"]))
+    assert scan(hub) == 1
+    assert upstream.calls[-1] == (["r"], ("slug", "title"))
+    assert wider.drain() == [("snapshot", {"id": "r", "data": {"slug": "s"}})]
+    # Nobody is waiting any more, so the next poll waits for the interval
+    assert scan(hub) == 0
@@ -0,0 +1,95 @@
+"""
+Per-request phase timings for the ``Server-Timing`` response header.
+A request opens a ``timing_scope``; any code running under it can wrap
+its own work in ``phase(name)`` and the durations are reported back to
+the client. Outside a scope ``phase`` records nothing.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterator, Optional
+
+import config
+
+HEADER = "Server-Timing"
+
+
+class Timings:
+    """Durations of the named phases of one request.
+
+    Phases with the same name accumulate, so a phase that runs several
+    times (or on several threads) reports its total time.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = perf_counter()
+        self._phases: Dict[str, float] = {}
+        self._lock = Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        """Record time spent in a phase.
+
+        Args:
+            name: Phase name; must be an HTTP token
+            seconds: Duration
+        """
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        """Render the phases and the elapsed total as a header value.
+
+        Returns:
+            str: ``Server-Timing`` value with durations in milliseconds
+        """
+        with self._lock:
+            phases = dict(self._phases)
+        phases["total"] = perf_counter() - self.started_at
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}"
+                         for name, seconds in phases.items())
+
+
+current_timings: ContextVar[Optional[Timings]] = ContextVar(
+    "current_timings", default=None)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time the enclosed block as a phase of the current request.
+
+    Args:
+        name: Phase name; must be an HTTP token
+
+    Yields:
+        None
+    """
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, perf_counter() - start)
+
+
+@contextmanager
+def timing_scope() -> Iterator[Optional[Timings]]:
+    """Collect phase timings for the enclosed request.
+
+    Yields:
+        Optional[Timings]: Timings being collected, or None when
+        ``REPLIT_INFO_SERVER_TIMING`` is off
+    """
+    if not config.SERVER_TIMING:
+        yield None
+        return
+    timings = Timings()
+    token = current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        current_timings.reset(token)
@@ -0,0 +1,548 @@
+"""
+Pooled keep-alive client for the replit.com GraphQL upstream.
+A single client is shared per worker process so lookups reuse warm
+TCP/TLS connections instead of paying a fresh handshake on every call.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os import getpid
+from threading import Lock, local
+from time import monotonic, perf_counter, sleep
+from typing import Any, Dict, List, Optional, Tuple
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout, Timeout
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import (
+    ConnectTimeoutError,
+    NewConnectionError,
+    ReadTimeoutError,
+)
+from urllib3.util.retry import Retry
+
+import codec
+import config
+from cassette import open_recorder, open_replay
+from deadline import Deadline, DeadlineExceeded, get_deadline
+from metrics import (
+    upstream_connect,
+    upstream_decode,
+    upstream_errors,
+    upstream_in_flight,
+    upstream_ttfb,
+)
+from query import batch_alias
+from timing import phase
+
+HEADERS = {
+    "Referer": "https://replit.com",
+    "X-Requested-With": "replit",
+}
+
+
+class UpstreamError(RuntimeError):
+    """Raised when the upstream answers without usable data."""
+
+
+def error_message(out: Any) -> str:
+    """Summarize the GraphQL errors of an upstream body.
+
+    Args:
+        out: Decoded upstream body
+
+    Returns:
+        str: Joined error messages, or a generic description
+    """
+    errors = out.get("errors") if isinstance(out, dict) else None
+    if not errors:
+        return "unexpected upstream response"
+    return "; ".join(
+        str(error.get("message", error)) if isinstance(error, dict) else
+        str(error) for error in errors)
+
+
+class UpstreamStatusError(UpstreamError):
+    """Raised when the upstream answers with a server error status.
+
+    Args:
+        status: HTTP status code of the response
+    """
+
+    def __init__(self, status: int) -> None:
+        super().__init__(f"upstream answered HTTP {status}")
+        self.status = status
+
+
+class UpstreamTimeout(TimeoutError):
+    """Raised when the upstream does not connect or answer in time."""
+
+
+def timeout_error(deadline: Deadline, limit: float, configured: float,
+                  reason: Any) -> TimeoutError:
+    """Choose the error for an upstream call that timed out.
+
+    A timeout the request budget clamped below the configured one means
+    the client's deadline ran out, not that the upstream is slow.
+
+    Args:
+        deadline: Deadline of the request
+        limit: Timeout that was in effect, in seconds
+        configured: Configured upstream timeout, in seconds
+        reason: What timed out, for the message
+
+    Returns:
+        TimeoutError: ``DeadlineExceeded`` or ``UpstreamTimeout``
+    """
+    if limit < configured:
+        return DeadlineExceeded(
+            f"request budget of {deadline.budget:.3f}s exceeded")
+    return UpstreamTimeout(f"upstream timed out: {reason}")
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Tell whether an error means the upstream itself is failing.
+
+    Connection errors, server error statuses, undecodable bodies and
+    timeouts under the server's own limits count. A spent request budget
+    and GraphQL errors about the requested repls do not: the first is
+    the client's, and the second come from a healthy upstream.
+
+    Args:
+        error: Error raised by an upstream call
+
+    Returns:
+        bool: Whether the circuit breaker should count it
+    """
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, UpstreamError):
+        return isinstance(error, UpstreamStatusError)
+    return True
+
+
+class ResetRetry(Retry):
+    """Retry policy for resets that never retries a timed-out attempt.
+
+    Timeouts are already clamped to the request deadline, so replaying
+    them would only overrun the budget.
+    """
+
+    def increment(self, *args: Any, **kwargs: Any) -> Retry:
+        error = kwargs.get("error")
+        # urllib3 2 derives refused connections from ConnectTimeoutError
+        if isinstance(error, (ConnectTimeoutError, ReadTimeoutError)
+                      ) and not isinstance(error, NewConnectionError):
+            raise error
+        return super().increment(*args, **kwargs)
+
+
+# Connect time spent by the current thread's in-progress upstream call
+_connect_time = local()
+
+
+class TimedConnect:
+    """Connection mixin that records how long connecting takes,
+    including any TLS handshake."""
+
+    def connect(self) -> None:
+        start = perf_counter()
+        try:
+            super().connect()
+        finally:
+            elapsed = perf_counter() - start
+            upstream_connect.observe(elapsed)
+            _connect_time.seconds = getattr(_connect_time, "seconds",
+                                            0.0) + elapsed
+
+
+class TimedHTTPConnection(TimedConnect, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnect, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """Transport adapter whose pools open timed connections."""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+class LatencyWindow:
+    """Rolling window of upstream latencies with cached quantiles.
+
+    Args:
+        size: Number of most recent samples kept
+    """
+
+    def __init__(self, size: int = config.HEDGE_WINDOW) -> None:
+        self._samples: deque = deque(maxlen=size)
+        self._sorted: List[float] = []
+        self._stale = 0
+
+    def add(self, seconds: float) -> None:
+        """Record one latency sample.
+
+        Args:
+            seconds: Observed latency
+        """
+        self._samples.append(seconds)
+        self._stale += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the ``q`` quantile of the window.
+
+        The sorted copy is refreshed at most every few samples so the
+        lookup stays cheap on the hot path.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            Optional[float]: Latency in seconds, or None without samples
+        """
+        if self._stale >= max(len(self._samples) // 20, 1):
+            self._sorted, self._stale = sorted(self._samples), 0
+        if not self._sorted:
+            return None
+        return self._sorted[min(int(q * len(self._sorted)),
+                                len(self._sorted) - 1)]
+
+
+def extract_repl(out: Any) -> Any:
+    """Pull the ``repl`` record out of a decoded GraphQL response.
+
+    Args:
+        out: Decoded upstream body
+
+    Returns:
+        Any: The repl record, or None if it does not exist
+
+    Raises:
+        UpstreamError: If the body carries no ``data`` object
+    """
+    try:
+        return out["data"]["repl"]
+    except (KeyError, TypeError):
+        upstream_errors.inc(UpstreamError.__name__)
+        raise UpstreamError(error_message(out)) from None
+
+
+def extract_batch(
+    out: Any,
+    replit_ids: List[str],
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Split a decoded aliased batch response into records and errors.
+
+    Args:
+        out: Decoded upstream body
+        replit_ids: IDs in the order they were bound to the aliases
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, str]]: Records keyed by ID (None
+        when the repl does not exist) and error messages keyed by ID
+
+    Raises:
+        UpstreamError: If the body carries neither data nor per-ID errors
+    """
+    aliases = {batch_alias(i): replit_id
+               for i, replit_id in enumerate(replit_ids)}
+    errors = {}
+    for error in out.get("errors") or []:
+        alias = (error.get("path") or [None])[0]
+        if alias in aliases:
+            errors[aliases[alias]] = error.get("message", "upstream error")
+    if not out.get("data") and not errors:
+        upstream_errors.inc(UpstreamError.__name__)
+        raise UpstreamError(error_message(out))
+    repls = out.get("data") or {}
+    return {
+        replit_id: repls.get(alias)
+        for alias, replit_id in aliases.items() if replit_id not in errors
+    }, errors
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client with a bounded connection pool.
+
+    Args:
+        url: GraphQL endpoint
+        pool_connections: Number of host pools kept alive
+        pool_maxsize: Connections kept alive per host
+        retries: Retries on connection resets and read errors
+        backoff: Backoff factor between retries in seconds
+        block: Wait for a free connection instead of opening extra ones
+        connect_timeout: Upper bound on connecting, in seconds
+        read_timeout: Upper bound on waiting for the response, in seconds
+        hedge: Send a second attempt once the first is slower than the
+            observed latency quantile
+    """
+
+    def __init__(
+        self,
+        url: str = config.UPSTREAM_URL,
+        pool_connections: int = config.POOL_CONNECTIONS,
+        pool_maxsize: int = config.POOL_MAXSIZE,
+        retries: int = config.UPSTREAM_RETRIES,
+        backoff: float = config.UPSTREAM_BACKOFF,
+        block: bool = config.POOL_BLOCK,
+        connect_timeout: float = config.UPSTREAM_CONNECT_TIMEOUT,
+        read_timeout: float = config.UPSTREAM_READ_TIMEOUT,
+        hedge: bool = config.HEDGE_ENABLED,
+    ) -> None:
+        self.url = url
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.hedge = hedge
+        self.latencies = LatencyWindow()
+        self.timeouts = self.hedges = self.hedge_wins = 0
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=config.HEDGE_WORKERS,
+            thread_name_prefix="hedge",
+        ) if hedge else None
+        self.session = Session()
+        self.session.headers.update(HEADERS)
+        self.adapter = TimedAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=block,
+            # GraphQL reads are idempotent, so POSTs are safe to replay
+            # after a reset connection.
+            max_retries=ResetRetry(
+                total=retries,
+                connect=retries,
+                read=retries,
+                status=0,
+                other=0,
+                allowed_methods=None,
+                backoff_factor=backoff,
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.replay = open_replay()
+        self.recorder = open_recorder()
+
+    def post(self, payload: Dict[str, Any]) -> Response:
+        """POST a GraphQL payload over a pooled connection.
+
+        Timeouts are clamped to the active request deadline. With
+        hedging on, a second attempt is sent once the first has been
+        outstanding for longer than the observed latency quantile.
+
+        Args:
+            payload: JSON body with ``query`` and ``variables``
+
+        Returns:
+            Response: Raw upstream response
+
+        Raises:
+            UpstreamTimeout: If the upstream does not answer in time
+            DeadlineExceeded: If the request budget runs out
+        """
+        deadline = get_deadline()
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._send(payload, deadline)
+        return self._hedged(payload, deadline, delay)
+
+    def query(self, payload: Dict[str, Any]) -> Any:
+        """POST a GraphQL payload and decode the response body.
+
+        With a cassette in replay mode the recorded body is used instead
+        of the network; in record mode every response is captured.
+
+        Args:
+            payload: JSON body with ``query`` and ``variables``
+
+        Returns:
+            Any: Decoded upstream body
+
+        Raises:
+            UpstreamStatusError: If the upstream answers a 5xx status
+        """
+        if self.replay is not None:
+            content = self._replayed(payload)
+        else:
+            start = monotonic()
+            with phase("upstream"):
+                response = self.post(payload)
+                content = response.content
+            if response.status_code >= 500:
+                upstream_errors.inc(UpstreamStatusError.__name__)
+                raise UpstreamStatusError(response.status_code)
+            if self.recorder is not None:
+                self.recorder.record(payload, content, monotonic() - start)
+        start = perf_counter()
+        try:
+            with phase("decode"):
+                out = codec.loads(content)
+        except ValueError as e:
+            upstream_errors.inc(type(e).__name__)
+            raise
+        upstream_decode.observe(perf_counter() - start)
+        return out
+
+    def _replayed(self, payload: Dict[str, Any]) -> bytes:
+        found = self.replay.lookup(payload)
+        if found is None:
+            raise UpstreamError("no recorded upstream response for this query")
+        content, latency = found
+        if config.CASSETTE_SIMULATE_LATENCY:
+            _, read = get_deadline().timeouts(self.connect_timeout,
+                                              self.read_timeout)
+            with phase("upstream"):
+                sleep(min(latency, read))
+            if latency > read:
+                error = timeout_error(get_deadline(), read,
+                                      self.read_timeout, "replayed")
+                self.timeouts += isinstance(error, UpstreamTimeout)
+                raise error
+        return content
+
+    def hedge_delay(self) -> Optional[float]:
+        """Return how long to wait before hedging, if hedging applies.
+
+        Returns:
+            Optional[float]: Seconds, or None when hedging is off or too
+            few latencies have been observed
+        """
+        if not self.hedge or len(self.latencies) < config.HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.latencies.quantile(config.HEDGE_QUANTILE),
+                   config.HEDGE_MIN_DELAY)
+
+    def _send(self, payload: Dict[str, Any], deadline: Deadline) -> Response:
+        timeout = deadline.timeouts(self.connect_timeout, self.read_timeout)
+        start = monotonic()
+        _connect_time.seconds = 0.0
+        upstream_in_flight.inc()
+        try:
+            response = self.session.post(self.url,
+                                         json=payload,
+                                         timeout=timeout)
+        except Timeout as e:
+            if isinstance(e, ConnectTimeout):
+                limit, configured = timeout[0], self.connect_timeout
+            else:
+                limit, configured = timeout[1], self.read_timeout
+            error = timeout_error(deadline, limit, configured, e)
+            self.timeouts += isinstance(error, UpstreamTimeout)
+            upstream_errors.inc(type(error).__name__)
+            raise error from e
+        except Exception as e:
+            upstream_errors.inc(type(e).__name__)
+            raise
+        finally:
+            upstream_in_flight.dec()
+        self.latencies.add(monotonic() - start)
+        # ``elapsed`` stops at the response headers, before the body
+        upstream_ttfb.observe(
+            max(response.elapsed.total_seconds() - _connect_time.seconds, 0))
+        return response
+
+    def _hedged(self, payload: Dict[str, Any], deadline: Deadline,
+                delay: float) -> Response:
+        first = self._hedge_executor.submit(self._send, payload, deadline)
+        done, _ = wait([first], timeout=min(delay, deadline.remaining()))
+        if done:
+            return first.result()
+        deadline.check()
+        self.hedges += 1
+        second = self._hedge_executor.submit(self._send, payload, deadline)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending,
+                                 timeout=deadline.remaining(),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                self.timeouts += 1
+                raise DeadlineExceeded("upstream did not answer in time")
+            for future in done:
+                if future.exception() is None:
+                    self.hedge_wins += future is second
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        """Report connection pool usage so the pool can be sized.
+
+        Returns:
+            Dict[str, Any]: Requests sent, connections opened, idle
+            connections held and the connection reuse ratio
+        """
+        pools = self.adapter.poolmanager.pools
+        requests = opened = idle = 0
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            requests += pool.num_requests
+            opened += pool.num_connections
+            idle += sum(conn is not None for conn in list(pool.pool.queue))
+        return {
+            "pools": len(pools),
+            "pool_maxsize": self.pool_maxsize,
+            "requests": requests,
+            "connections_opened": opened,
+            "idle_connections": idle,
+            "reuse_ratio": (1 - opened / requests) if requests else 0.0,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": self.hedge_delay(),
+            "latency_p50": self.latencies.quantile(0.5),
+            "latency_p95": self.latencies.quantile(0.95),
+            "cassette": (self.replay or self.recorder).stats() if (
+                self.replay or self.recorder) else None,
+        }
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        self.session.close()
+
+
+_client: Optional[UpstreamClient] = None
+_client_pid: Optional[int] = None
+_client_lock = Lock()
+
+
+def get_client() -> UpstreamClient:
+    """Return the worker-wide upstream client.
+
+    The client is created lazily and recreated after a fork so worker
+    processes never share sockets inherited from their parent.
+
+    Returns:
+        UpstreamClient: Shared client for the current process
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != getpid():
+        with _client_lock:
+            if _client is None or _client_pid != getpid():
+                _client, _client_pid = UpstreamClient(), getpid()
+    return _client
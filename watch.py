@@ -0,0 +1,565 @@
+"""
+Change-watch subscriptions for repl records.
+Each watched repl ID is polled once for all of its subscribers, in
+aliased batch requests, at an interval that adapts to how often the repl
+changes. Subscribers receive field-level diffs of the fields they watch
+as Server-Sent Events.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import getpid
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import codec
+import config
+from hotset import BatchFetch
+from query import build_projection
+from records import Fields, RecordCache, record_key
+
+Event = Tuple[str, Any]
+
+
+class WatchLimitError(RuntimeError):
+    """Raised when a subscription would exceed the watched ID limit."""
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, Any]:
+    """Flatten nested objects into dotted leaf paths.
+
+    Lists and nulls are leaves.
+
+    Args:
+        value: Record or field value
+        prefix: Dotted path of ``value``
+
+    Returns:
+        Dict[str, Any]: Leaf values by dotted path
+    """
+    if not isinstance(value, dict) or not value:
+        return {prefix.rstrip("."): value}
+    leaves = {}
+    for key, item in value.items():
+        leaves.update(flatten(item, f"{prefix}{key}."))
+    return leaves
+
+
+def diff_records(old: Dict[str, Any],
+                 new: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """List the leaf values that changed between two records.
+
+    Only fields present in both records are compared, so a record polled
+    for more fields than before shows no spurious changes.
+
+    Args:
+        old: Previous record
+        new: Current record
+
+    Returns:
+        Dict[str, Dict[str, Any]]: ``{"old": ..., "new": ...}`` by dotted
+        path, for every leaf that differs
+    """
+    changes = {}
+    for key in old.keys() & new.keys():
+        if old[key] == new[key]:
+            continue
+        before = flatten(old[key], key + ".")
+        after = flatten(new[key], key + ".")
+        for path in dict.fromkeys([*before, *after]):
+            if before.get(path) != after.get(path):
+                changes[path] = {
+                    "old": before.get(path),
+                    "new": after.get(path)
+                }
+    return changes
+
+
+def encode_event(name: str, data: Any) -> bytes:
+    """Encode one Server-Sent Event.
+
+    Args:
+        name: Event type
+        data: JSON-serializable payload
+
+    Returns:
+        bytes: Wire form of the event
+    """
+    return b"event: %s\ndata: %s\n\n" % (name.encode(), codec.dumps(data))
+
+
+# Comment line keeping idle connections (and their proxies) open
+HEARTBEAT = b": keepalive\n\n"
+
+
+class Subscription:
+    """One client's watch on a set of repl IDs.
+
+    Args:
+        replit_ids: Watched repl IDs
+        fields: Watched field paths, or None for the full record
+        max_events: Undelivered events kept before the subscription is
+            marked as overflowed
+        notify: Called after every published event, from the polling
+            threads
+    """
+
+    def __init__(self,
+                 replit_ids: Iterable[str],
+                 fields: Fields,
+                 max_events: int = config.WATCH_QUEUE_SIZE,
+                 notify: Optional[Callable[[], None]] = None) -> None:
+        self.replit_ids = tuple(dict.fromkeys(replit_ids))
+        self.fields = fields
+        self.max_events = max_events
+        self.notify = notify
+        #: IDs still owed their initial snapshot
+        self.awaiting: Set[str] = set(self.replit_ids)
+        #: Awaited IDs whose failing poll was already reported
+        self.failed: Set[str] = set()
+        self.overflowed = False
+        self._events: Deque[Event] = deque()
+        self._ready = Condition()
+
+    def wants(self, path: str) -> bool:
+        """Tell whether a changed leaf is within the watched fields.
+
+        Args:
+            path: Dotted leaf path
+
+        Returns:
+            bool: True if the path is watched
+        """
+        return self.fields is None or any(
+            path == field or path.startswith(field + ".")
+            or field.startswith(path + ".") for field in self.fields)
+
+    def publish(self, name: str, data: Any) -> None:
+        """Queue an event for the client.
+
+        Args:
+            name: Event type
+            data: JSON-serializable payload
+        """
+        with self._ready:
+            if len(self._events) >= self.max_events:
+                self.overflowed = True
+            else:
+                self._events.append((name, data))
+            self._ready.notify()
+        if self.notify is not None:
+            self.notify()
+
+    def drain(self, timeout: float = 0.0) -> List[Event]:
+        """Take the queued events, waiting up to ``timeout`` for one.
+
+        Args:
+            timeout: Seconds to wait while the queue is empty
+
+        Returns:
+            List[Event]: Events in publication order
+        """
+        with self._ready:
+            if not self._events and timeout > 0:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+
+class Watched:
+    """Polling state of one watched repl ID."""
+
+    __slots__ = ("subscribers", "fields", "record", "interval", "due_at",
+                 "polling", "polls", "changes", "failures")
+
+    def __init__(self, interval: float) -> None:
+        self.subscribers: Set[Subscription] = set()
+        self.fields: Fields = ()
+        self.record: Optional[Dict[str, Any]] = None
+        self.interval = interval
+        self.due_at = monotonic()
+        self.polling = False
+        self.polls = self.changes = self.failures = 0
+
+
+class WatchHub:
+    """Polls watched repl IDs on behalf of every subscriber.
+
+    An ID's poll interval halves after a poll that saw a change and
+    grows by half after one that did not, within ``min_interval`` and
+    ``max_interval``. Due IDs are polled together in batches of
+    ``chunk_size``, topped up with IDs that are more than half way to
+    their next poll. A failing ID is retried after ``min_interval``,
+    doubling up to its interval while it keeps failing, and subscribers
+    still owed its snapshot get one ``error`` event. Polled records also
+    refresh the record cache.
+
+    Args:
+        fetch: Batched upstream fetch; one call is one upstream request
+        records: Record cache to update, or None
+        interval: Initial seconds between polls of an ID
+        min_interval: Shortest seconds between polls of an ID
+        max_interval: Longest seconds between polls of an ID
+        max_watched: IDs watched at once across all subscriptions
+        workers: Threads running polls
+        chunk_size: Repl IDs per request
+        tick: Seconds between scans for due IDs
+    """
+
+    def __init__(
+        self,
+        fetch: BatchFetch,
+        records: Optional[RecordCache] = None,
+        interval: float = config.WATCH_INTERVAL,
+        min_interval: float = config.WATCH_MIN_INTERVAL,
+        max_interval: float = config.WATCH_MAX_INTERVAL,
+        max_watched: int = config.WATCH_MAX_WATCHED,
+        workers: int = config.WATCH_WORKERS,
+        chunk_size: int = config.BATCH_CHUNK_SIZE,
+        tick: float = 0.25,
+    ) -> None:
+        self.fetch = fetch
+        self.records = records
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_watched = max_watched
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.tick = tick
+        self.requests = self.polls = self.changes = self.published = 0
+        self.overflows = self.errors = 0
+        self._watched: Dict[str, Watched] = {}
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def subscribe(
+            self,
+            replit_ids: Iterable[str],
+            fields: Fields = None,
+            notify: Optional[Callable[[], None]] = None) -> Subscription:
+        """Start watching repl IDs.
+
+        The subscription first receives a ``snapshot`` event per ID,
+        then ``change`` events.
+
+        Args:
+            replit_ids: Repl IDs to watch
+            fields: Normalized field paths to watch, or None for all
+            notify: Called after every published event
+
+        Returns:
+            Subscription: The new subscription
+
+        Raises:
+            WatchLimitError: If too many IDs would be watched
+        """
+        subscription = Subscription(replit_ids, fields, notify=notify)
+        with self._lock:
+            added = [
+                replit_id for replit_id in subscription.replit_ids
+                if replit_id not in self._watched
+            ]
+            if len(self._watched) + len(added) > self.max_watched:
+                raise WatchLimitError(
+                    f"at most {self.max_watched} repl IDs can be watched")
+            self._subscriptions.add(subscription)
+            for replit_id in subscription.replit_ids:
+                watched = self._watched.get(replit_id)
+                if watched is None:
+                    watched = self._watched[replit_id] = Watched(
+                        self.interval)
+                watched.subscribers.add(subscription)
+                widened = self._update_fields(watched)
+                if widened or watched.record is None:
+                    # Poll now for the snapshot
+                    watched.due_at = monotonic()
+                else:
+                    self._snapshot(subscription, replit_id, watched.record)
+        self._ensure_thread()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop a subscription; IDs nobody watches are no longer polled.
+
+        Args:
+            subscription: Subscription to stop
+        """
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            for replit_id in subscription.replit_ids:
+                watched = self._watched.get(replit_id)
+                if watched is None:
+                    continue
+                watched.subscribers.discard(subscription)
+                if watched.subscribers:
+                    self._update_fields(watched)
+                else:
+                    del self._watched[replit_id]
+
+    @staticmethod
+    def _update_fields(watched: Watched) -> bool:
+        # Poll the union of the subscribers' fields; report a widening
+        wanted = [subscription.fields for subscription in watched.subscribers]
+        fields = None if None in wanted else tuple(
+            sorted(set().union(*wanted)))
+        polled, watched.fields = watched.fields, fields
+        return polled is not None and (fields is None
+                                       or not set(fields) <= set(polled))
+
+    def _snapshot(self, subscription: Subscription, replit_id: str,
+                  record: Optional[Dict[str, Any]]) -> None:
+        subscription.awaiting.discard(replit_id)
+        subscription.failed.discard(replit_id)
+        if record is None:
+            self._publish(subscription, "missing", {"id": replit_id})
+        else:
+            self._publish(
+                subscription, "snapshot", {
+                    "id": replit_id,
+                    "data": build_projection(subscription.fields).project(
+                        record),
+                })
+
+    def _publish(self, subscription: Subscription, name: str,
+                 data: Any) -> None:
+        overflowed = subscription.overflowed
+        subscription.publish(name, data)
+        self.published += 1
+        if subscription.overflowed and not overflowed:
+            self.overflows += 1
+
+    def _ensure_thread(self) -> None:
+        # Threads do not survive a fork, so each worker starts its own
+        if self._thread is not None and self._thread_pid == getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != getpid():
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="watch")
+                self._thread = Thread(target=self._loop,
+                                      name="watch",
+                                      daemon=True)
+                self._thread_pid = getpid()
+                self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            sleep(self.tick)
+            try:
+                self.poll_once()
+            except Exception:
+                # A failing poll must not kill the scheduler
+                self.errors += 1
+
+    def poll_once(self) -> int:
+        """Start polls for the watched IDs that are due.
+
+        Returns:
+            int: Upstream requests started
+        """
+        now = monotonic()
+        with self._lock:
+            idle = sorted(
+                (watched.due_at, replit_id)
+                for replit_id, watched in self._watched.items()
+                if not watched.polling)
+            due = [replit_id for due_at, replit_id in idle if due_at <= now]
+            if not due:
+                return 0
+            size = self.chunk_size
+            if len(due) % size:
+                # Spare places go to IDs half way to their next poll
+                due += [
+                    replit_id for due_at, replit_id in idle[len(due):]
+                    if due_at - now <= self._watched[replit_id].interval / 2
+                ][:size - len(due) % size]
+            chunks = []
+            for i in range(0, len(due), size):
+                chunk = due[i:i + size]
+                held = [self._watched[replit_id].fields for replit_id in chunk]
+                fields = None if None in held else tuple(
+                    sorted(set().union(*held)))
+                for replit_id in chunk:
+                    self._watched[replit_id].polling = True
+                chunks.append((chunk, fields))
+        for chunk, fields in chunks:
+            self._pool.submit(self._poll, chunk, fields)
+        return len(chunks)
+
+    def _poll(self, chunk: List[str], fields: Fields) -> None:
+        self.requests += 1
+        try:
+            data, errors = self.fetch(chunk, fields)
+        except Exception as e:
+            self.errors += 1
+            data, errors = {}, dict.fromkeys(chunk, str(e))
+        for replit_id in chunk:
+            if replit_id in errors or replit_id not in data:
+                self._fail(replit_id,
+                           errors.get(replit_id) or "repl not returned")
+            else:
+                self._update(replit_id, fields, data[replit_id])
+
+    def _settle(self, replit_id: str, fields: Fields, changed: bool) -> None:
+        # Adapt the interval and schedule the next poll
+        with self._lock:
+            watched = self._watched.get(replit_id)
+            if watched is None:
+                return
+            if changed:
+                watched.interval = max(self.min_interval,
+                                       watched.interval / 2)
+            else:
+                watched.interval = min(self.max_interval,
+                                       watched.interval * 1.5)
+            watched.due_at = monotonic() + watched.interval
+            watched.failures = 0
+            if fields is not None and any(
+                    replit_id in subscription.awaiting and (
+                        subscription.fields is None
+                        or not set(subscription.fields) <= set(fields))
+                    for subscription in watched.subscribers):
+                # Polled before a wider subscription arrived; poll again
+                watched.due_at = monotonic()
+            watched.polling = False
+
+    def _fail(self, replit_id: str, message: str) -> None:
+        # Back off exponentially, up to the adaptive interval, and tell
+        # subscribers waiting for a snapshot once per failure streak
+        with self._lock:
+            watched = self._watched.get(replit_id)
+            if watched is None:
+                return
+            watched.failures += 1
+            watched.due_at = monotonic() + min(
+                watched.interval,
+                self.min_interval * 2**(watched.failures - 1))
+            watched.polling = False
+            told = [
+                subscription for subscription in watched.subscribers
+                if replit_id in subscription.awaiting
+                and replit_id not in subscription.failed
+            ]
+            for subscription in told:
+                subscription.failed.add(replit_id)
+        for subscription in told:
+            self._publish(subscription, "error", {
+                "id": replit_id,
+                "error": message
+            })
+
+    def _update(self, replit_id: str, fields: Fields,
+                record: Optional[Dict[str, Any]]) -> None:
+        self.polls += 1
+        if record is not None and self.records is not None:
+            cache = self.records.cache
+            entry = None if fields is None else cache.get(
+                record_key(replit_id))
+            self.records.store(replit_id, fields, record, entry)
+        with self._lock:
+            watched = self._watched.get(replit_id)
+            if watched is None:
+                return
+            watched.polls += 1
+            first = watched.polls == 1
+            previous, watched.record = watched.record, record
+            subscribers = list(watched.subscribers)
+        # A repl that disappears or appears gets a fresh snapshot
+        appeared = not first and (previous is None) != (record is None)
+        changes = {}
+        if previous is not None and record is not None:
+            changes = diff_records(previous, record)
+        if changes or appeared:
+            watched.changes += 1
+            self.changes += 1
+        for subscription in subscribers:
+            if appeared or replit_id in subscription.awaiting:
+                if record is None or not build_projection(
+                        subscription.fields).missing(record):
+                    self._snapshot(subscription, replit_id, record)
+                continue
+            wanted = {
+                path: change
+                for path, change in changes.items()
+                if subscription.wants(path)
+            }
+            if wanted:
+                self._publish(subscription, "change", {
+                    "id": replit_id,
+                    "changes": wanted
+                })
+        self._settle(replit_id, fields, bool(changes) or appeared)
+
+    def events(
+            self,
+            subscription: Subscription,
+            heartbeat: float = config.WATCH_HEARTBEAT) -> Iterator[bytes]:
+        """Stream a subscription as Server-Sent Events until it is closed.
+
+        Ends after an ``overflow`` event if the client fell too far
+        behind; it should then subscribe again.
+
+        Args:
+            subscription: Subscription to stream
+            heartbeat: Seconds of silence before a keepalive comment
+
+        Yields:
+            bytes: Encoded events
+        """
+        try:
+            while True:
+                events = subscription.drain(heartbeat)
+                if not events and not subscription.overflowed:
+                    yield HEARTBEAT
+                for name, data in events:
+                    yield encode_event(name, data)
+                if subscription.overflowed:
+                    yield encode_event("overflow", {})
+                    return
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report watch activity.
+
+        Returns:
+            Dict[str, Any]: Watched IDs, IDs whose last poll failed,
+            subscriptions, upstream requests, polled records, changes
+            seen, events published and overflowed subscriptions
+        """
+        with self._lock:
+            intervals = [
+                watched.interval for watched in self._watched.values()
+            ]
+            failing = sum(1 for watched in self._watched.values()
+                          if watched.failures)
+        return {
+            "watched_ids": len(intervals),
+            "failing_ids": failing,
+            "subscriptions": len(self._subscriptions),
+            "mean_interval": (sum(intervals) / len(intervals)
+                              if intervals else None),
+            "requests": self.requests,
+            "polls": self.polls,
+            "changes": self.changes,
+            "published": self.published,
+            "overflows": self.overflows,
+            "errors": self.errors,
+        }